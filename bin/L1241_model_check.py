@@ -42,9 +42,9 @@ parser.add_argument('atp_pch_folder',
                     help='Folder in which ATP pch files of line parameters '
                          'are found.')
 parser.add_argument('binary_atp_data',
-                    type=argparse.FileType('rb'),
-                    help='Name of binary (Python pickle format) '
-                         'file to read. See make_ss_csv.py.')
+                    help='Name of binary (NPZ, or Python pickle format if '
+                         'the name ends in .p) file to read. See '
+                         'make_ss_csv.py.')
 parser.add_argument('binary_met_data',
                     nargs='?',
                     default=None,
@@ -52,6 +52,9 @@ parser.add_argument('binary_met_data',
                     help='Binary file of extracted meter data in Python '
                          'pickle format. For format, see extract_met_data in '
                          'sel_utilities package.')
+parser.add_argument('--pch-cache', default=None,
+                    help='Directory in which the line parameters read from '
+                         'the pch files are cached between runs.')
 
 
 def terminal_state(line_defs, line, terminal=(0, 1)):
@@ -130,9 +133,17 @@ def main(argv=None):
     except AttributeError:
         data_list = {}
 
-    # Read ATP steady-state data from pickle file.
-    with args.binary_atp_data as picklefile:
-        atp_data_list = pickle.load(picklefile)
+    # Read ATP steady-state data. Only the buses and branches used below
+    # are read from NPZ files.
+    if args.binary_atp_data.lower().endswith(('.p', '.pkl', '.pickle')):
+        with open(args.binary_atp_data, 'rb') as picklefile:
+            atp_data_list = pickle.load(picklefile)
+        atp_bus_data = atp_data_list['bus_data']
+        atp_branch_data = atp_data_list['branch_data']
+    else:
+        atp_data = pyATP.SSResultFile(args.binary_atp_data)
+        atp_bus_data = atp_data.bus_data
+        atp_branch_data = atp_data.branch_data
 
     line_defs = {'L1078B': {'terminals': ('Thedford', 'Stapleton'),
                             'atp_segs': ('L78BB', 'L78BA'),
@@ -205,7 +216,9 @@ def main(argv=None):
             except KeyError:
                 pass
 
-    # Pull in ATP parameters from PCH files
+    # Pull in ATP parameters from PCH files. Segments shared by several
+    # lines are only read once.
+    pyATP.set_line_params_cache(pyATP.LineParamsCache(args.pch_cache))
     for line, l in line_defs.items():
         _, summary_data_dict = pyATP.get_line_params_from_pch(
             args.atp_pch_folder, l['atp_segs']
@@ -217,8 +230,8 @@ def main(argv=None):
     # Pull in ATP steady-state results gathered by make_ss_csv
     for line, l in line_defs.items():
         for idx, branch in enumerate(l['atp_branches']):
-            l['term%d_atp_branch' % idx] = atp_data_list['branch_data'][branch]
-            l['term%d_atp_bus' % idx] = atp_data_list['bus_data'][branch[0]]
+            l['term%d_atp_branch' % idx] = atp_branch_data[branch]
+            l['term%d_atp_bus' % idx] = atp_bus_data[branch[0]]
 
     # Calculate absolute bus angles based on a reference bus and line PQ flows.
     try:
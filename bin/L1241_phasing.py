@@ -25,6 +25,11 @@ model_weights = [1.]
 # to rebuild all the .pch files that this program monkeys with.
 tmp_dir = 'C:/Users/pdbrown/Documents/ATPdata/work/L1241Phasing/tmp/'
 
+# Compute the line constants of the sections in Python instead of running
+# ATP LINE CONSTANTS cases. Set to False for conductor data that
+# pyATP.line_constants does not handle.
+native_line_constants = True
+
 # =============================================================================
 # Enter line configuration information.
 
@@ -185,6 +190,9 @@ criteria_weights = [1., 1.]
 # Hold results of each model in a dict indexed by the ATP model name
 results_dict = lineZ.new_results_dict(all_transitions_list, models)
 
+if not native_line_constants:
+    scheduler = pyATP.ATPScheduler()
+
 for model in models:
     # =============================================================================
     # Copy working files to temp directory
@@ -196,40 +204,54 @@ for model in models:
     # =============================================================================
     # Run analysis of all data cases. 
     # Time to run is approximately 1-2 s per case for this model.    
-    results = []
+    # Line constants cards of each section, read once
+    line_data = {}
+    for s in section_ATPname:
+        with open(tmp_dir + s + '.dat', 'r') as f:
+            line_data[s] = pyATP.LineConstCards()
+            line_data[s].read(f.read().splitlines())
+
     print('Running calcs....')
+    futures = {}
     for n, t in all_transitions_dict.items():
         for n2, l in enumerate(t):
             print('For %d transpositions, case %d of %d' % (n, n2, len(t)))
             
-            # Set phasing of line sections in ATP .dat files & re-run line
-            # constants.
+            # Set phasing of line sections & re-run line constants. The
+            # sections of a phasing combination are either computed here,
+            # or run as one ATP case batch, and batches run concurrently in
+            # their own scratch directories.
+            sections_batch = pyATP.ATPBatch()
+            seg_data_dict = {}
             for Pt, s in zip(lineZ.cum_Pt(l), section_ATPname):
-                line_const = tmp_dir + s + '.dat'
-                
-                with open(line_const, 'r') as f:
-                    inlines = f.read().splitlines()
-                line_data = pyATP.LineConstCards()
-                line_data.read(inlines)
-                
-                # Modify the phasing in .dat file.
+                # Modify the phasing in .dat file, rewriting only the
+                # columns of the phase numbers of the cards read.
                 for idx, ph in enumerate(Pt):
-                    line_data.data['conductors'][idx]['IP'] = ph + 1
-                
-                outlines = line_data.write()
-                
-                with open(line_const, 'w') as f:
-                    f.writelines(outlines)
-                # Run ATP on the .dat file to create .pch file.
-                pyATP.run_ATP(line_const)
-
-            # Read in line impedance parameters from PCH files
-            seg_data_dict, summary_data_dict = \
-                pyATP.get_line_params_from_pch(tmp_dir, section_ATPname)
-
-            results_dict[l][model] = ((summary_data_dict,
-                                       seg_data_dict),)
+                    line_data[s].patch('IP', ph + 1, idx)
+                if native_line_constants:
+                    seg_data_dict[s] = line_data[s].line_params()
+                else:
+                    sections_batch.add(line_data[s].patched_text())
+
+            if native_line_constants:
+                summary_data_dict = pyATP.summarize_line_params(seg_data_dict)
+                results_dict[l][model] = ((summary_data_dict,
+                                           seg_data_dict),)
+            else:
+                futures[l] = sections_batch.submit(scheduler, 'sections.dat',
+                                                   tmp_dir, punch=True)
+
+    for l, f in futures.items():
+        # Line impedance parameters from the PCH file of each batch
+        seg_data_dict = dict(zip(section_ATPname, f.result()))
+        summary_data_dict = pyATP.summarize_line_params(seg_data_dict)
+
+        results_dict[l][model] = ((summary_data_dict,
+                                   seg_data_dict),)
     
+if not native_line_constants:
+    scheduler.shutdown()
+
 # =============================================================================
 # Filter to non-dominated results across all models.
 
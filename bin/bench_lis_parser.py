@@ -0,0 +1,124 @@
+#! /usr/bin/env python
+# -- coding: utf-8 --
+'''bench_lis_parser.py
+
+Benchmark of the steady-state LIS parser engines. A synthetic LIS file with
+the requested number of branches is written, parsed with each engine of
+pyATP.get_SS_results, and the results are checked to be identical. The
+throughput of the numpy engine is then compared between the uncompressed file
+and compressed copies of it.
+
+'''
+
+from __future__ import print_function, unicode_literals
+
+import argparse
+import bz2
+import gzip
+import os
+import sys
+import tempfile
+import timeit
+
+import pyATP
+from pyATP.fakeatp import write_synthetic_lis
+
+parser = argparse.ArgumentParser()
+parser.add_argument('-n', '--branches', type=int, default=100000,
+                    help='Number of branches in the synthetic LIS file.')
+parser.add_argument('-s', '--switches', type=int, default=1000,
+                    help='Number of switches in the synthetic LIS file.')
+parser.add_argument('-r', '--repeat', type=int, default=3,
+                    help='Number of timing repetitions. The best is shown.')
+parser.add_argument('-c', '--compression', nargs='*',
+                    default=['gzip', 'bz2', 'xz', 'zstd'],
+                    help='Compressed formats to benchmark. Formats whose '
+                         'module is not installed are skipped.')
+
+
+def compressors():
+    ''' {format: (suffix, compress function)} of the available formats. '''
+    rtn = {'gzip': ('.gz', lambda data: gzip.compress(data, 6)),
+           'bz2': ('.bz2', bz2.compress)}
+    try:
+        import lzma
+        rtn['xz'] = ('.xz', lzma.compress)
+    except ImportError:
+        pass
+    try:
+        import zstandard
+        rtn['zstd'] = ('.zst', zstandard.ZstdCompressor().compress)
+    except ImportError:
+        pass
+    return rtn
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    args = parser.parse_args(argv)
+
+    fd, LIS_file = tempfile.mkstemp(suffix='.lis')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            write_synthetic_lis(f, args.branches, args.switches)
+        print('Synthetic LIS file: %d branches, %d switches, %.1f MB' %
+              (args.branches, args.switches,
+               os.path.getsize(LIS_file) / 1e6))
+
+        results = {}
+        times = {}
+        for engine in ('python', 'numpy'):
+            results[engine] = pyATP.get_SS_results(LIS_file, engine=engine)
+            times[engine] = min(timeit.repeat(
+                lambda: pyATP.get_SS_results(LIS_file, engine=engine),
+                number=1, repeat=args.repeat))
+            print('%-8s %8.3f s' % (engine, times[engine]))
+        assert results['python'] == results['numpy']
+        print('Results identical. Speedup: %.1fx' %
+              (times['python'] / times['numpy']))
+
+        # Most of the remaining time of the numpy engine is spent building
+        # the result dicts. Time the array extraction alone for reference.
+        def parse_arrays():
+            with pyATP.lis.map_file(LIS_file) as buf:
+                pyATP.lis.parse_SS_block(buf)
+        t = min(timeit.repeat(parse_arrays, number=1, repeat=args.repeat))
+        print('%-8s %8.3f s (arrays only, %.1fx)' %
+              ('numpy', t, times['python'] / t))
+
+        # Throughput in MB/s of uncompressed LIS data, parsed with the numpy
+        # engine straight from each compressed file.
+        with open(LIS_file, 'rb') as f:
+            data = f.read()
+        size = len(data) / 1e6
+        print('')
+        print('%-8s %9s %8s %10s' % ('input', 'size, MB', 'time, s',
+                                     'MB/s'))
+        print('%-8s %9.1f %8.3f %10.1f' % ('none', size, times['numpy'],
+                                           size / times['numpy']))
+        available = compressors()
+        for fmt in args.compression:
+            if fmt not in available:
+                print('%-8s skipped, not available' % fmt)
+                continue
+            suffix, compress = available[fmt]
+            compressed = LIS_file + suffix
+            with open(compressed, 'wb') as f:
+                f.write(compress(data))
+            try:
+                result = pyATP.get_SS_results(compressed, engine='numpy')
+                assert result == results['numpy']
+                t = min(timeit.repeat(
+                    lambda: pyATP.get_SS_results(compressed, engine='numpy'),
+                    number=1, repeat=args.repeat))
+                print('%-8s %9.1f %8.3f %10.1f' %
+                      (fmt, os.path.getsize(compressed) / 1e6, t, size / t))
+            finally:
+                os.remove(compressed)
+    finally:
+        os.remove(LIS_file)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
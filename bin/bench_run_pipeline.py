@@ -0,0 +1,87 @@
+#! /usr/bin/env python
+# -- coding: utf-8 --
+'''bench_run_pipeline.py
+
+End to end benchmark of the ATP run pipeline with the stand-in ATP executable
+of pyATP.fakeatp: decks are run one after the other with run_ATP and
+get_SS_results, then concurrently with an ATPScheduler, then through a run
+cache, cold and warm. No ATP installation is needed.
+
+'''
+
+from __future__ import print_function, unicode_literals
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import pyATP
+from pyATP import fakeatp
+
+parser = argparse.ArgumentParser()
+parser.add_argument('-d', '--decks', type=int, default=32,
+                    help='Number of different decks run.')
+parser.add_argument('-n', '--branches', type=int, default=2000,
+                    help='Number of branches in the LIS file of each deck.')
+parser.add_argument('-l', '--latency', type=float, default=0.2,
+                    help='Simulated ATP run time in seconds.')
+parser.add_argument('-w', '--workers', type=int, default=None,
+                    help='Number of scheduler workers, one per CPU by '
+                         'default.')
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    args = parser.parse_args(argv)
+
+    tmp_dir = tempfile.mkdtemp(prefix='bench_atp_')
+    previous = fakeatp.install(tmp_dir, n_branches=args.branches,
+                               latency=args.latency)
+    try:
+        decks = []
+        for k in range(args.decks):
+            deck = os.path.join(tmp_dir, 'case%d.atp' % k)
+            with open(deck, 'w') as f:
+                f.write('BEGIN NEW DATA CASE\nC case %d\n'
+                        'BEGIN NEW DATA CASE\nBLANK\n' % k)
+            decks.append(deck)
+
+        def report(label, t):
+            print('%-24s %8.3f s %8.1f runs/s' % (label, t, len(decks) / t))
+
+        start = time.time()
+        for deck in decks:
+            pyATP.run_ATP(deck)
+            pyATP.get_SS_results(pyATP.lis_filename(deck))
+        report('serial', time.time() - start)
+
+        with pyATP.ATPScheduler(args.workers) as scheduler:
+            start = time.time()
+            for f in scheduler.map(decks):
+                f.result()
+            report('scheduler (%d workers)' % scheduler.workers,
+                   time.time() - start)
+
+            cache = pyATP.RunCache(os.path.join(tmp_dir, 'cache'))
+            pyATP.set_run_cache(cache)
+            try:
+                for label in ('scheduler, cold cache', 'scheduler, warm cache'):
+                    start = time.time()
+                    for f in scheduler.map(decks):
+                        f.result()
+                    report(label, time.time() - start)
+            finally:
+                pyATP.set_run_cache(None)
+            print('Cache: %(hits)d hits, %(misses)d misses, %(stores)d '
+                  'stores' % cache.stats)
+    finally:
+        pyATP.pyATP.ATP_path, pyATP.pyATP.ATP_exe = previous
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
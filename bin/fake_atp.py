@@ -0,0 +1,24 @@
+#! /usr/bin/env python
+# -- coding: utf-8 --
+'''fake_atp.py
+
+Stand-in for the ATP executable writing deterministic synthetic LIS and PCH
+outputs, for testing and benchmarking the run pipeline without ATP. Point
+pyATP at it with
+
+    pyATP.pyATP.ATP_path = <directory of this script>
+    pyATP.pyATP.ATP_exe = 'fake_atp.py'
+
+or use pyATP.fakeatp.install, which also sets the network size and latency.
+Run with -h for the options.
+
+'''
+
+from __future__ import print_function, unicode_literals
+
+import sys
+
+from pyATP.fakeatp import main
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -51,8 +51,9 @@ def main(argv=None):
     parser.add_argument('BIN_FILE',
                         nargs='?',
                         default=None,
-                        help='Name to output binary (Python pickle format) '
-                             'file to. Any existing file will be overwritten.')
+                        help='Name to output binary file to, in NPZ format '
+                             '(Python pickle format if the name ends in .p). '
+                             'Any existing file will be overwritten.')
 
     if argv is None:
         argv = sys.argv
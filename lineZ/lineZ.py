@@ -179,20 +179,24 @@ chain_permutations = chain_permutations_4th
 def ZY_to_ABCD(Z, Y):
     ''' Create Two-port ABCD matrix from series impedance Z and shunt admittance Y.
         See Bergen & Vittal _Power Systems Analysis_ p.99-100
-        Function allows for multiple (e.g. three) phases per port of the system.'''
+        Function allows for multiple (e.g. three) phases per port of the system.
+        Z and Y may also be stacks of matrices of shape (..., n_ph, n_ph), e.g.
+        from pyATP.line_constants_stack, giving a (..., 2*n_ph, 2*n_ph) stack.'''
     Y1 = Y2 = Y/2.
     return ZY_to_ABCD2(Z, Y1, Y2)
 
 def ZY_to_ABCD2(Z, Y1, Y2):
     ''' Create Two-port ABCD matrix from series impedance Z and shunt admittances Y1 & Y2.
         See Bergen & Vittal _Power Systems Analysis_ p.99-100
-        Function allows for multiple (e.g. three) phases per port of the system.'''
-    n_ph = Z.shape[0]
-    ABCD = np.empty((n_ph*2, n_ph*2), dtype=cdtype)
-    ABCD[:n_ph,:n_ph] = np.eye(n_ph, dtype=cdtype) + Z.dot(Y2)
-    ABCD[:n_ph,n_ph:] = Z
-    ABCD[n_ph:,:n_ph] = Y1 + Y1.dot(Z).dot(Y2) + Y2
-    ABCD[n_ph:,n_ph:] = np.eye(n_ph, dtype=cdtype) + Y1.dot(Z)
+        Function allows for multiple (e.g. three) phases per port of the system,
+        and for stacks of matrices as ZY_to_ABCD.'''
+    n_ph = Z.shape[-1]
+    I = np.eye(n_ph, dtype=cdtype)
+    ABCD = np.empty(Z.shape[:-2] + (n_ph*2, n_ph*2), dtype=cdtype)
+    ABCD[...,:n_ph,:n_ph] = I + np.matmul(Z, Y2)
+    ABCD[...,:n_ph,n_ph:] = Z
+    ABCD[...,n_ph:,:n_ph] = Y1 + np.matmul(np.matmul(Y1, Z), Y2) + Y2
+    ABCD[...,n_ph:,n_ph:] = I + np.matmul(Y1, Z)
 
     return ABCD
     
@@ -516,34 +520,39 @@ def impedance_calcs_recursive(Zstr, Ystr, L, str_types, Pt_list, print_calcs = F
 
 
 def phase_impedances(Z):
-    ''' Calculate phase impedances.'''
-    return np.multiply(A[2, :], Z.dot(Apos))
+    ''' Calculate phase impedances. Z may be a stack of matrices of shape
+        (..., 3, 3), giving phase impedances of shape (..., 3).'''
+    return np.multiply(A[2, :], np.matmul(Z, Apos))
 
 
 def impedance_imbalance(Z):
     """ Impedance imbalance calculated as the maximum phase impedance
         magnitude minus the minimum phase impedance magnitude, divided by
         the mean phase impedance.
-        Returns factor in %."""
+        Returns factor in %, or an array of factors for a stack of matrices."""
     Zph = np.absolute(phase_impedances(Z))
-    mn = np.mean(Zph)
-    return (np.max(Zph) - np.min(Zph))/mn*100.
+    mn = np.mean(Zph, axis=-1)
+    return (np.max(Zph, axis=-1) - np.min(Zph, axis=-1))/mn*100.
+
+def seq_impedances(Z):
+    ''' Sequence impedance matrix of Z, or of each matrix of a stack. '''
+    return np.matmul(np.matmul(A_inv, Z), A)
 
 def neg_seq_voltage(Z, Iload=600., Vbase=345.E3):
-    Zs = A_inv.dot(Z).dot(A)
-    return abs(Zs[2,1])*Iload*1.732/Vbase*100.
+    Zs = seq_impedances(Z)
+    return abs(Zs[...,2,1])*Iload*1.732/Vbase*100.
 
 def neg_seq_unbalance_factor(Z):
     ''' Negative-sequence unbalance factor calculated based on EPRI Redbook Eqn. 3.4.35.
         Returns factor in %.'''
-    Zs = A_inv.dot(Z).dot(A)
-    return abs(Zs[2,1]/Zs[1,1])*100.
+    Zs = seq_impedances(Z)
+    return abs(Zs[...,2,1]/Zs[...,1,1])*100.
 
 def zero_seq_unbalance_factor(Z):
     ''' Zero-sequence unbalance factor calculated based on EPRI Redbook Eqn. 3.4.34.
         Returns factor in %.'''
-    Zs = A_inv.dot(Z).dot(A)
-    return abs(Zs[0,1]/Zs[1,1])*100.
+    Zs = seq_impedances(Z)
+    return abs(Zs[...,0,1]/Zs[...,1,1])*100.
 
 
 def filter_nondominated_results_old(results, criteria=[impedance_imbalance, neg_seq_unbalance_factor], precompute=None, beat_factor=1.0):
@@ -5,3 +5,19 @@ __email__ = 'pdb.lists@gmail.com'
 __version__ = '0.1.0'
 
 from .pyATP import *
+from .lineconst import *
+from .pl4 import *
+from .transient import *
+from .ssdata import *
+from .scheduler import *
+from .runcache import *
+from .paramcache import *
+from .batch import *
+from .sweep import *
+from .adaptive import *
+from .switching import *
+try:
+    from .aio import *
+except SyntaxError:
+    # The asyncio API needs Python 3.5 or later
+    pass
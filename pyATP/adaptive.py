@@ -0,0 +1,212 @@
+'''
+Adaptive sampling of deck parameter sweeps.
+
+Instead of running a dense grid, adaptive_sweep runs a small Latin hypercube
+design, fits a Gaussian process surrogate of the response of interest to the
+results so far, and runs the next batch of points where the surrogate is
+most uncertain or its gradient is steepest far from any sample. It stops
+when the predicted uncertainty is below a tolerance everywhere, or when the
+run budget is spent:
+
+    def unbalance(v, i):
+        # One or a sequence of real outputs of a point
+        V0, V1, V2 = lineZ.ph_to_seq_v(v)
+        return abs(V2 / V1)
+
+    results, surrogate = adaptive_sweep(
+        'model.atp', [('LEN', (1., 50.)), ('RHO', (10., 1000.))], unbalance,
+        nodes=['BUSA', 'BUSB', 'BUSC'], max_runs=60, tol=0.01)
+
+The surrogate only uses numpy. Its fit takes O(n^3) time in the number n of
+runs, which is negligible next to the runs for the few hundred points an
+adaptive sweep is meant for.
+'''
+
+from __future__ import print_function, unicode_literals
+
+from collections import OrderedDict
+
+import numpy as np
+
+from .sweep import latin_hypercube, run_sweep, SweepResults, _items
+
+__all__ = ['GPSurrogate', 'adaptive_sweep']
+
+
+class GPSurrogate(object):
+    '''
+    Gaussian process regression of the (n, n_out) outputs y at the (n, d)
+    points x, with a squared exponential kernel of one length scale in the
+    unit cube of the parameter ranges bounds, a list of (low, high). The
+    length scale maximizes the marginal likelihood unless it is given.
+    Outputs are standardized, so all share the length scale.
+    '''
+    # Relative noise variance keeping the kernel matrix well conditioned
+    nugget = 1e-8
+
+    def __init__(self, x, y, bounds, length_scale=None):
+        self.bounds = np.asarray(bounds, dtype=np.float64)
+        self.x = self._unit(x)
+        y = np.asarray(y, dtype=np.float64)
+        self.y = y.reshape(len(y), -1)
+        self.y_mean = self.y.mean(axis=0)
+        self.y_std = self.y.std(axis=0)
+        self.y_std[self.y_std == 0] = 1.
+        if length_scale is None:
+            length_scale = self._best_length_scale()
+        self.length_scale = length_scale
+        self._factor()
+
+    def _unit(self, x):
+        x = np.asarray(x, dtype=np.float64).reshape(-1, len(self.bounds))
+        low, high = self.bounds[:, 0], self.bounds[:, 1]
+        return (x - low) / np.where(high > low, high - low, 1.)
+
+    def _kernel(self, a, b, length_scale):
+        d2 = ((a[:, np.newaxis, :] - b[np.newaxis, :, :])**2).sum(axis=-1)
+        return np.exp(-0.5 * d2 / length_scale**2)
+
+    def _cholesky(self, length_scale):
+        K = self._kernel(self.x, self.x, length_scale)
+        K[np.diag_indices_from(K)] += self.nugget * len(K)
+        return np.linalg.cholesky(K)
+
+    def _best_length_scale(self):
+        z = (self.y - self.y_mean) / self.y_std
+        best = None
+        for length_scale in np.logspace(-1.5, 0.5, 21):
+            try:
+                L = self._cholesky(length_scale)
+            except np.linalg.LinAlgError:
+                continue
+            w = np.linalg.solve(L, z)
+            # Negative log marginal likelihood, summed over outputs
+            nll = 0.5 * (w**2).sum() + z.shape[1] * np.log(np.diag(L)).sum()
+            if best is None or nll < best[0]:
+                best = (nll, length_scale)
+        return best[1] if best is not None else 0.2
+
+    def _factor(self):
+        self._L = self._cholesky(self.length_scale)
+        z = (self.y - self.y_mean) / self.y_std
+        self._alpha = np.linalg.solve(self._L.T, np.linalg.solve(self._L, z))
+
+    def predict(self, x, gradient=False):
+        '''
+        Returns the (m, n_out) mean and standard deviation of the outputs at
+        the (m, d) points x. If gradient is True, the (m, d, n_out) gradient
+        of the mean with respect to the unit cube coordinates is returned
+        too.
+        '''
+        u = self._unit(x)
+        k = self._kernel(u, self.x, self.length_scale)
+        mean = k.dot(self._alpha)
+        v = np.linalg.solve(self._L, k.T)
+        var = np.maximum(1. - (v**2).sum(axis=0), 0.)
+        std = np.sqrt(var)[:, np.newaxis] * self.y_std
+        mean = mean * self.y_std + self.y_mean
+        if not gradient:
+            return mean, std
+        diff = u[:, np.newaxis, :] - self.x[np.newaxis, :, :]
+        grad = -np.einsum('mnd,mn,no->mdo', diff, k, self._alpha) \
+            / self.length_scale**2 * self.y_std
+        return mean, std, grad
+
+
+def _scores(gp, candidates, gradient_weight, y_range):
+    ''' Refinement score of each candidate: the predicted standard deviation
+        plus the change of the mean over the distance to the nearest sample,
+        both relative to the range of each output, maximum over outputs. '''
+    _, std, grad = gp.predict(candidates, gradient=True)
+    u = gp._unit(candidates)
+    d = np.sqrt(((u[:, np.newaxis, :] - gp.x[np.newaxis, :, :])**2)
+                .sum(axis=-1)).min(axis=1)
+    slope = np.sqrt((grad**2).sum(axis=1))
+    score = (std + gradient_weight * slope * d[:, np.newaxis]) / y_range
+    return score.max(axis=1), (std / y_range).max(axis=1)
+
+
+def _select(gp, candidates, n, gradient_weight, y_range):
+    ''' Greedy choice of n candidates. After each choice, the surrogate is
+        refitted as if the run gave its predicted mean, which lowers the
+        uncertainty around the chosen point without running it. '''
+    chosen = []
+    x, y = gp.x, gp.y
+    for _ in range(n):
+        score, _ = _scores(gp, candidates, gradient_weight, y_range)
+        score[chosen] = -np.inf
+        k = int(np.argmax(score))
+        chosen.append(k)
+        mean, _ = gp.predict(candidates[k:k + 1])
+        low, high = gp.bounds[:, 0], gp.bounds[:, 1]
+        x = np.vstack([x, gp._unit(candidates[k:k + 1])])
+        y = np.vstack([y, mean])
+        gp = GPSurrogate(low + x * (high - low), y, gp.bounds,
+                         gp.length_scale)
+    return chosen
+
+
+def adaptive_sweep(template, ranges, response, fields=None, nodes=(),
+                   branches=(), scheduler=None, formats=None,
+                   RMS_scale=False, name=None, include_dir=None,
+                   initial=None, batch=None, max_runs=100, tol=0.01,
+                   gradient_weight=1., n_candidates=1000, seed=None):
+    '''
+    Adaptive sweep of the deck template over the (low, high) ranges of each
+    parameter, a list of (name, (low, high)). response is a function of the
+    node voltages and branch currents of a point (rows of the SweepResults
+    of run_sweep) returning one or a sequence of real outputs to resolve.
+    template, fields, nodes, branches, scheduler, formats, RMS_scale, name
+    and include_dir are as for run_sweep.
+
+    initial points (by default 2*d + 1 for d parameters, at least batch) are
+    run first, then batches of batch points (by default the number of
+    scheduler workers, or 4) chosen among n_candidates random points. The
+    sweep stops after max_runs runs, or once the predicted standard
+    deviation of every output is below tol times the range of its values at
+    all candidates. Returns the SweepResults of all runs and the
+    GPSurrogate of the last fit.
+    '''
+    ranges = _items(ranges)
+    names = [n for n, _ in ranges]
+    bounds = np.array([r for _, r in ranges], dtype=np.float64)
+    rng = np.random.RandomState(seed)
+    if batch is None:
+        batch = scheduler.workers if scheduler is not None else 4
+    if initial is None:
+        initial = max(2 * len(names) + 1, batch)
+
+    kwargs = dict(fields=fields, nodes=nodes, branches=branches,
+                  scheduler=scheduler, formats=formats, RMS_scale=RMS_scale,
+                  name=name, include_dir=include_dir)
+    points = latin_hypercube(ranges, min(initial, max_runs),
+                             rng.randint(2**31))
+    tables = [run_sweep(template, points, **kwargs)]
+    gp = None
+    while True:
+        results = SweepResults.concatenate(tables)
+        x = np.column_stack([results.points[n] for n in names])
+        ok = results.ok
+        if not ok.any():
+            raise RuntimeError('All runs of the sweep failed: %s' %
+                               results.errors[min(results.errors)])
+        y = np.array([np.atleast_1d(response(v, i)) for v, i in
+                      zip(results.node_voltages[ok],
+                          results.branch_currents[ok])], dtype=np.float64)
+        gp = GPSurrogate(x[ok], y, bounds)
+        if len(results) >= max_runs:
+            break
+
+        y_range = np.ptp(y, axis=0)
+        y_range[y_range == 0] = 1.
+        candidates = bounds[:, 0] + rng.uniform(
+            size=(n_candidates, len(names))) * (bounds[:, 1] - bounds[:, 0])
+        _, rel_std = _scores(gp, candidates, gradient_weight, y_range)
+        if rel_std.max() < tol:
+            break
+        chosen = _select(gp, candidates, min(batch, max_runs - len(results)),
+                         gradient_weight, y_range)
+        points = OrderedDict((n, candidates[chosen, k])
+                             for k, n in enumerate(names))
+        tables = [results, run_sweep(template, points, **kwargs)]
+    return results, gp
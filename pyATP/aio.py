@@ -0,0 +1,136 @@
+'''
+Asyncio versions of run_ATP and get_SS_results.
+
+ATP is started as an asyncio subprocess, so one event loop can overlap many
+runs, and each run may be given a timeout after which the ATP process is
+killed. Cancelling a run also kills its process. LIS files are parsed in the
+default executor of the loop. For example:
+
+    async def study(decks):
+        return await gather_limited(
+            [run_SS_async(d, timeout=60.) for d in decks], limit=8)
+
+This module requires Python 3.5 or later.
+'''
+
+from __future__ import print_function, unicode_literals
+
+import asyncio
+import functools
+import os
+import subprocess
+
+from . import pyATP as _atp
+
+__all__ = ['run_ATP_async', 'get_SS_results_async', 'run_SS_async',
+           'gather_limited']
+
+
+def _kill(proc):
+    ''' Kill an ATP process. On Windows the ATP batch file starts the solver
+        as a child process, so the whole process tree is killed. '''
+    if proc.returncode is not None:
+        return
+    if os.name == 'nt':
+        with open(os.devnull, 'w') as devnull:
+            subprocess.call(('taskkill', '/F', '/T', '/PID', str(proc.pid)),
+                            stdout=devnull, stderr=devnull)
+    try:
+        proc.kill()
+    except ProcessLookupError:
+        pass
+
+
+async def _in_executor(f, *args, **kwargs):
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(None, functools.partial(f, *args,
+                                                              **kwargs))
+
+
+async def run_ATP_async(ATP_file, quiet=None, cwd=None, timeout=None,
+                        use_cache=True):
+    '''
+    Runs ATP on ATP_file as run_ATP does and returns the return code of the
+    ATP process. If it has not finished within timeout seconds, it is killed
+    and asyncio.TimeoutError is raised. The run cache set with set_run_cache
+    is used unless use_cache is False.
+    '''
+    cache = _atp.run_cache if use_cache else None
+    if cache is not None:
+        key = await _in_executor(cache.key, ATP_file, cwd)
+        base = os.path.splitext(os.path.join(cwd or '', ATP_file))[0]
+        rtn = await _in_executor(cache.restore, key, base)
+        if rtn is not None:
+            return rtn
+        before = cache.output_times(base)
+
+    kwargs = {}
+    if cwd is not None:
+        kwargs['cwd'] = cwd
+    if quiet is not None and quiet or quiet is None and _atp.be_quiet:
+        kwargs['stdout'] = subprocess.DEVNULL
+    proc = await asyncio.create_subprocess_exec(
+        os.path.join(_atp.ATP_path, _atp.ATP_exe), ATP_file, **kwargs)
+    try:
+        rtn = await asyncio.wait_for(proc.wait(), timeout)
+    except BaseException:
+        # Timed out or cancelled
+        _kill(proc)
+        await asyncio.shield(proc.wait())
+        raise
+
+    if cache is not None:
+        await _in_executor(cache.save, key, base, before, rtn)
+    return rtn
+
+
+async def get_SS_results_async(LIS_file, RMS_scale=False):
+    ''' Returns the SteadyStateResult of LIS_file, parsed in the default
+        executor of the event loop. '''
+    return await _in_executor(_atp.SteadyStateResult.from_lis, LIS_file,
+                              RMS_scale)
+
+
+async def run_SS_async(ATP_file, RMS_scale=False, quiet=None, cwd=None,
+                       timeout=None, use_cache=True):
+    '''
+    Runs ATP on ATP_file with run_ATP_async and returns the SteadyStateResult
+    of its LIS file. Raises RuntimeError if ATP wrote no LIS file.
+    '''
+    rtn = await run_ATP_async(ATP_file, quiet, cwd, timeout, use_cache)
+    LIS_file = _atp.lis_filename(os.path.join(cwd or '', ATP_file))
+    if not os.path.exists(LIS_file):
+        raise RuntimeError('ATP run of %s failed with return code %s and wrote '
+                           'no LIS file' % (ATP_file, rtn))
+    return await get_SS_results_async(LIS_file, RMS_scale)
+
+
+async def gather_limited(aws, limit=None, return_exceptions=False):
+    '''
+    Like asyncio.gather, but runs at most limit of the awaitables aws at a
+    time (the number of CPUs by default). Results are returned in the order
+    of aws. If one raises and return_exceptions is False, the others are
+    cancelled before the exception is raised.
+    '''
+    if limit is None:
+        limit = os.cpu_count() or 1
+    semaphore = asyncio.Semaphore(limit)
+
+    async def limited(aw):
+        async with semaphore:
+            return await aw
+
+    aws = list(aws)
+    tasks = [asyncio.ensure_future(limited(aw)) for aw in aws]
+    try:
+        return await asyncio.gather(*tasks,
+                                    return_exceptions=return_exceptions)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        # Close coroutines cancelled before they started
+        for aw in aws:
+            if asyncio.iscoroutine(aw):
+                aw.close()
+        raise
@@ -0,0 +1,178 @@
+'''
+Batching of independent ATP cases into one run.
+
+Starting ATP and allocating its tables takes much of the time of a small
+case. ATPBatch concatenates the data cases of several decks into one deck,
+separated by BEGIN NEW DATA CASE cards, so that ATP is started once for all
+of them, and splits the LIS and PCH outputs of the run back into results for
+each case:
+
+    batch = ATPBatch([deck1, deck2, deck3])
+    results = batch.run_SS('batch.atp')     # [SteadyStateResult, ...]
+
+Each deck must hold a single data case. The terminating BEGIN NEW DATA CASE
+and BLANK cards and anything after a $EOF card are removed from the decks.
+'''
+
+from __future__ import print_function, unicode_literals
+
+import codecs
+import os
+import re
+
+from . import compression
+from . import lis
+from . import pyATP as _atp
+
+__all__ = ['ATPBatch', 'case_cards', 'split_pch']
+
+_begin = re.compile(r'BEGIN NEW DATA CASE', re.I)
+_eof = re.compile(r'\$EOF', re.I)
+# Header comment punched at the start of the output of each support routine
+_punch_header = 'Cards punched by support routine'
+
+
+def _is_filler(line):
+    ''' True for the blank and comment cards that may follow the last data
+        case of a deck. '''
+    s = line.strip().upper()
+    return not s or s.startswith('BLANK') or line[:2].upper() == 'C '
+
+
+def case_cards(deck):
+    '''
+    Returns the list of cards (lines) of the single data case in the text
+    deck, without its BEGIN NEW DATA CASE card and without the cards ending
+    the deck. Raises ValueError if the deck holds more than one data case.
+    '''
+    lines = deck.splitlines()
+    for k, line in enumerate(lines):
+        if _eof.match(line):
+            del lines[k:]
+            break
+    starts = [k for k, line in enumerate(lines) if _begin.match(line)]
+    if starts and all(_is_filler(line) for line in lines[starts[-1] + 1:]):
+        del lines[starts.pop():]
+    if starts and all(_is_filler(line) for line in lines[:starts[0]]):
+        del lines[starts.pop(0)]
+    if starts:
+        raise ValueError('Deck holds more than one data case')
+    return lines
+
+
+def split_pch(PCH_file):
+    '''
+    Returns the list of the cards punched by each case of a PCH file, one
+    string per case. The cards of each case start with the header comment
+    written by the support routine that punched them.
+    '''
+    with compression.open_file(compression.find_file(PCH_file), 'r') as f:
+        lines = f.read().splitlines(True)
+    # Anything before the first header goes with the first case
+    cases = [[]]
+    header_seen = False
+    for line in lines:
+        if _punch_header in line:
+            if header_seen:
+                cases.append([])
+            header_seen = True
+        cases[-1].append(line)
+    return [''.join(c) for c in cases if c]
+
+
+class ATPBatch(object):
+    '''
+    Independent ATP data cases run together in one deck. decks is a list of
+    the texts of the decks of each case; more can be added with add.
+    '''
+    def __init__(self, decks=()):
+        self.cases = []
+        self.newline = None
+        for deck in decks:
+            self.add(deck)
+
+    def add(self, deck):
+        ''' Adds the data case of the text deck to the batch and returns its
+            index in the results. '''
+        if self.newline is None:
+            self.newline = '\r\n' if '\r\n' in deck else '\n'
+        self.cases.append(case_cards(deck))
+        return len(self.cases) - 1
+
+    def __len__(self):
+        return len(self.cases)
+
+    def render(self):
+        ''' Returns the text of the deck running all cases of the batch. '''
+        lines = []
+        for cards in self.cases:
+            lines.append('BEGIN NEW DATA CASE')
+            lines.extend(cards)
+        lines.extend(['BEGIN NEW DATA CASE', 'BLANK', ''])
+        return (self.newline or '\n').join(lines)
+
+    def write(self, ATP_file):
+        ''' Writes the deck of the batch to ATP_file. '''
+        with codecs.open(ATP_file, 'w', encoding='iso-8859-1',
+                         errors='replace') as f:
+            f.write(self.render())
+        return ATP_file
+
+    def parse_SS(self, LIS_file, RMS_scale=False):
+        '''
+        Returns the list of the SteadyStateResult of each case of the batch
+        from the LIS file of its run. Raises RuntimeError if a case has no
+        steady-state solution.
+        '''
+        results = _atp.get_all_SS_results(LIS_file, RMS_scale)
+        # Every case of the batch follows a BEGIN NEW DATA CASE card, so they
+        # are the first cases starting with one, whatever ATP printed before
+        with lis.map_file(compression.find_file(LIS_file)) as buf:
+            numbers = lis.marker_cases(buf)[:len(self.cases)]
+        numbers += [None]*(len(self.cases) - len(numbers))
+        missing = [k for k, n in enumerate(numbers) if n not in results]
+        if missing:
+            raise RuntimeError('No steady-state solution for cases %s of %s'
+                               % (', '.join(str(k + 1) for k in missing),
+                                  LIS_file))
+        return [results[n] for n in numbers]
+
+    def parse_pch(self, PCH_file):
+        '''
+        Returns the list of the LineConstPCHCards of each case of the batch
+        from the PCH file of its run. Every case must punch its results, as
+        LINE CONSTANTS cases with $PUNCH do.
+        '''
+        punched = split_pch(PCH_file)
+        if len(punched) != len(self.cases):
+            raise RuntimeError('%s holds the cards of %d cases, not %d' %
+                               (PCH_file, len(punched), len(self.cases)))
+        return [_atp.parse_line_params_pch(text) for text in punched]
+
+    def run_SS(self, ATP_file, RMS_scale=False):
+        ''' Writes the batch to ATP_file, runs ATP on it and returns the list
+            of the SteadyStateResult of each case. '''
+        _atp.run_ATP(self.write(ATP_file))
+        return self.parse_SS(_atp.atp_basename(ATP_file) + '.lis', RMS_scale)
+
+    def run_pch(self, ATP_file):
+        ''' Writes the batch to ATP_file, runs ATP on it and returns the list
+            of the LineConstPCHCards of each case. '''
+        _atp.run_ATP(self.write(ATP_file))
+        return self.parse_pch(_atp.atp_basename(ATP_file) + '.pch')
+
+    def submit(self, scheduler, name='batch.atp', include_dir=None,
+               punch=False, RMS_scale=False):
+        '''
+        Submits the batch to an ATPScheduler as one run of a deck named name
+        with includes taken from include_dir. Returns a Future of the list of
+        the results of each case, the SteadyStateResult of each case or, if
+        punch is True, the LineConstPCHCards.
+        '''
+        def parse(run):
+            base = os.path.splitext(run.ATP_file)[0]
+            if punch:
+                return self.parse_pch(base + '.pch')
+            return self.parse_SS(base + '.lis', RMS_scale)
+        return scheduler.submit(deck=self.render(), name=name,
+                                include_dir=include_dir, parse=parse)
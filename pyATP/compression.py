@@ -0,0 +1,110 @@
+'''
+Transparent reading of compressed ATP output files.
+
+LIS, PCH and PL4 files may be stored compressed with gzip, bzip2, xz or, if
+the zstandard package is installed, zstd. The format is detected from the
+first bytes of the file, not from its name, and the file is decompressed as
+it is read, without writing a temporary file.
+'''
+
+from __future__ import print_function, unicode_literals
+
+import bz2
+import gzip
+import io
+import os
+
+try:
+    import lzma
+except ImportError:
+    lzma = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+__all__ = ['file_compression', 'open_file', 'find_file', 'strip_suffix']
+
+# Magic bytes at the start of each supported compressed format
+MAGIC = [(b'\x1f\x8b', 'gzip'),
+         (b'BZh', 'bz2'),
+         (b'\xfd7zXZ\x00', 'xz'),
+         (b'\x28\xb5\x2f\xfd', 'zstd')]
+
+# Suffixes tried, in order, when a file is not found uncompressed
+SUFFIXES = ('.gz', '.bz2', '.xz', '.zst')
+
+
+def file_compression(filename):
+    ''' Returns the compression format of the file ('gzip', 'bz2', 'xz' or
+        'zstd') or None if it is not compressed. '''
+    with open(filename, 'rb') as f:
+        head = f.read(6)
+    for magic, name in MAGIC:
+        if head.startswith(magic):
+            return name
+    return None
+
+
+def _open_zstd(filename):
+    if zstandard is None:
+        raise IOError('%s is zstd compressed, which requires the zstandard '
+                      'package' % filename)
+    f = open(filename, 'rb')
+    try:
+        reader = zstandard.ZstdDecompressor().stream_reader(
+            f, closefd=True)
+    except TypeError:
+        # Older versions of zstandard do not close the file
+        reader = zstandard.ZstdDecompressor().stream_reader(f)
+    return io.BufferedReader(reader)
+
+
+def open_file(filename, mode='rb', encoding=None, errors=None):
+    '''
+    Open filename for reading, decompressing it on the fly if it is
+    compressed. mode is 'rb' for a binary stream or 'r' for a text stream
+    with universal newlines, as for the built-in open.
+    '''
+    if mode not in ('r', 'rb', 'rt'):
+        raise ValueError('Compressed files can only be opened for reading')
+    kind = file_compression(filename)
+    if kind is None:
+        if mode == 'rb':
+            return open(filename, 'rb')
+        return io.open(filename, 'r', encoding=encoding, errors=errors)
+    if kind == 'gzip':
+        f = gzip.GzipFile(filename, 'rb')
+    elif kind == 'bz2':
+        f = bz2.BZ2File(filename, 'rb')
+    elif kind == 'xz':
+        if lzma is None:
+            raise IOError('%s is xz compressed, which requires the lzma '
+                          'module' % filename)
+        f = lzma.LZMAFile(filename, 'rb')
+    else:
+        f = _open_zstd(filename)
+    if mode == 'rb':
+        return f
+    return io.TextIOWrapper(f, encoding=encoding, errors=errors)
+
+
+def find_file(filename):
+    ''' Returns filename if it exists. Otherwise returns the name of a
+        compressed copy with one of the SUFFIXES if one exists, or filename
+        unchanged if none does. '''
+    if os.path.exists(filename):
+        return filename
+    for suffix in SUFFIXES:
+        if os.path.exists(filename + suffix):
+            return filename + suffix
+    return filename
+
+
+def strip_suffix(filename):
+    ''' Returns filename without a compressed file suffix. '''
+    for suffix in SUFFIXES:
+        if filename.lower().endswith(suffix):
+            return filename[:-len(suffix)]
+    return filename
@@ -0,0 +1,260 @@
+'''
+Stand-in for the ATP executable, for testing and benchmarking without ATP.
+
+The stand-in reads a deck and, after an optional delay, writes synthetic
+outputs in the layout of ATP's: a LIS file with a steady-state phasor
+solution for every data case, and a PCH file with the punched RLC matrices
+of every LINE CONSTANTS case. Outputs depend only on the text of each case
+and the settings, so the same deck always gives the same files. To make
+run_ATP use it:
+
+    pyATP.fakeatp.install(tmp_dir, n_branches=1000, latency=0.5)
+
+It can also be run as a script, see main and bin/fake_atp.py.
+'''
+
+from __future__ import print_function, unicode_literals
+
+import argparse
+import codecs
+import hashlib
+import os
+import re
+import stat
+import sys
+import time
+
+import numpy as np
+
+from . import pyATP as _atp
+
+__all__ = ['fake_run', 'install', 'write_synthetic_lis',
+           'write_synthetic_pch']
+
+_begin = re.compile(r'^BEGIN NEW DATA CASE.*$', re.I | re.M)
+_line_constants = re.compile(r'^LINE CONSTANTS', re.I | re.M)
+
+_marker = (' Marker card preceding new EMTP data case.' + ' '*22 +
+           '|BEGIN NEW DATA CASE\n')
+
+# Banner printed by ATP at the top of the LIS file, before the echo of the
+# first card. The date is fixed so that outputs only depend on the deck.
+_banner = (
+    'Alternative Transients Program (ATP), GNU Linux or DOS. All rights '
+    'reserved by Can/Am user group of Portland, Oregon, USA.\n'
+    ' Date (dd-mth-yy) and time of day (hh.mm.ss) = 01-Jan-00  00:00:00\n'
+    ' Name of disk plot file (if any) is  %s.pl4\n'
+    ' Consult the 860-page ATP Rule Book of the Can/Am EMTP User Group in '
+    'Portland, Oregon, USA.\n'
+    ' ' + '-'*50 + '+' + '-'*80 + '\n'
+    ' Descriptive interpretation of input data cards.   |  Input data card '
+    'images are shown below, all 80 columns, character by character\n'
+    + ' '*51 + ''.join('%-10d' % k for k in range(9)).rstrip() + '\n'
+    + ' '*51 + '0123456789'*8 + '0\n'
+    ' ' + '-'*50 + '+' + '-'*80 + '\n')
+
+
+def _field(value):
+    return '%15.7E' % value
+
+
+def write_synthetic_lis(f, n_branches, n_switches, seed=0):
+    ''' Write a steady-state phasor solution in the fixed-width layout of an
+        ATP LIS file to the open text file f. '''
+    rng = np.random.RandomState(seed)
+    v = rng.uniform(-2e5, 2e5, (n_branches, 4))
+    i = rng.uniform(-2e3, 2e3, (n_branches, 4))
+    f.write('Sinusoidal steady-state phasor solution, branch by branch.  '
+            'All flows are away from a bus, and the real part, magnitude, '
+            'or "P"\n'
+            'is printed above the imaginary part, the angle, or "Q".\n'
+            ' Bus K     Phasor node voltage          Phasor branch current\n'
+            '  Bus M     Rectangular      Polar       Rectangular      Polar\n')
+    for n in range(n_branches):
+        f.write('\n %-9s  %-8s  %s  %19.7E  %s\n' %
+                ('N%07d' % n, '', _field(v[n, 0]), abs(v[n, 0] + 1j*v[n, 1]),
+                 _field(i[n, 0])))
+        f.write('%22s%s  %19.4f  %s\n' %
+                ('', _field(v[n, 1]), 0., _field(i[n, 1])))
+        f.write('\n %-9s  %-8s  %s  %19.7E  %s\n' %
+                ('', 'M%07d' % n, _field(v[n, 2]), abs(v[n, 2] + 1j*v[n, 3]),
+                 _field(i[n, 2])))
+        f.write('%22s%s  %19.4f  %s\n' %
+                ('', _field(v[n, 3]), 0., _field(i[n, 3])))
+    f.write('\n  Total network loss  P-loss  by summing injections =   '
+            '1.000000000E+00\n')
+    f.write('Output for steady-state phasor switch currents.\n')
+    f.write('     Node-K    Node-M        I-real            I-imag\n')
+    for n in range(n_switches):
+        f.write('      %-8s  %-11s  %16.7E  %16.7E\n' %
+                ('M%07d' % n, '' if n % 2 else 'S%07d' % n,
+                 i[n, 0], i[n, 1]))
+    f.write('\n')
+
+
+def _line_const_phases(case):
+    ''' Number of phases and the bus names of the BRANCH card of a LINE
+        CONSTANTS case. '''
+    lines = case.splitlines()
+    n_ph = 0
+    buses = []
+    in_conductors = False
+    for line in lines:
+        if line.upper().startswith('BRANCH'):
+            card = line[8:].ljust(36)
+            buses = [card[k:k + 6] for k in range(0, len(card.rstrip()), 6)]
+            in_conductors = True
+            continue
+        if line.upper().startswith('BLANK CARD ENDING CONDUCTOR'):
+            break
+        if in_conductors:
+            try:
+                n_ph = max(n_ph, int(line[:3]))
+            except ValueError:
+                # Units card
+                pass
+    n_ph = n_ph or 3
+    buses += ['IN___%s' % chr(65 + k % 26) if k % 2 == 0 else
+              'OUT__%s' % chr(65 + k % 26)
+              for k in range(len(buses), 2*n_ph)]
+    return n_ph, buses
+
+
+def write_synthetic_pch(f, case, seed=0):
+    '''
+    Write the cards punched by a LINE CONSTANTS case of a three (or n) phase
+    line to the open text file f: the case echoed as comments, then the
+    lower triangles of the R, L and C matrices as punched by ATP. The number
+    of phases and the bus names are taken from the conductor and BRANCH
+    cards of case.
+    '''
+    n_ph, buses = _line_const_phases(case)
+    rng = np.random.RandomState(seed)
+    # Symmetric matrices in Ohms, Ohms and microSiemens at 60 Hz, with the
+    # magnitudes of a transmission line some tens of miles long
+    R = np.full((n_ph, n_ph), 5.8) + np.diag(np.full(n_ph, 13.5))
+    L = np.full((n_ph, n_ph), 21.) + np.diag(np.full(n_ph, 31.))
+    C = np.full((n_ph, n_ph), -27.) + np.diag(np.full(n_ph, 207.))
+    for m in (R, L, C):
+        d = rng.uniform(0.9, 1.1, (n_ph, n_ph))
+        m *= (d + d.T) / 2
+
+    f.write('C  <++++++>  Cards punched by support routine on  01-Jan-00  '
+            '00:00:00  <++++++>\n')
+    for line in case.splitlines():
+        if line.strip() and not line.upper().startswith('$PUNCH'):
+            f.write('C %s\n' % line[:78])
+    f.write('$VINTAGE, 1\n')
+    f.write('$UNITS,  60.,  60.\n')
+    for r in range(n_ph):
+        for c in range(r + 1):
+            prefix = ('%2d%-6s%-6s%12s' % (r + 1, buses[2*r], buses[2*r + 1],
+                                           '') if c == 0 else ' '*26)
+            f.write('%s%16.8E%16.8E%16.8E\n' % (prefix, R[r, c], L[r, c],
+                                               C[r, c]))
+    f.write('$VINTAGE, -1,\n')
+    f.write('$UNITS, -1., -1., { Restore values that existed b4 preceding '
+            '$UNITS\n')
+
+
+def _is_filler(case):
+    ''' True for the text following the BEGIN NEW DATA CASE card that ends a
+        deck. '''
+    return all(not line.strip() or line.upper().startswith(('BLANK', '$EOF'))
+               for line in case.splitlines())
+
+
+def _seed(case, seed):
+    return (int(hashlib.sha256(case.encode('utf-8')).hexdigest()[:8], 16)
+            ^ seed) & 0xffffffff
+
+
+def fake_run(ATP_file, n_branches=100, n_switches=10, latency=0., seed=0):
+    '''
+    Writes the synthetic outputs of the deck ATP_file next to it, as ATP
+    would: <base>.lis, and <base>.pch if the deck has LINE CONSTANTS cases.
+    Each steady-state case has n_branches branches and n_switches switches.
+    latency is a delay in seconds before the outputs are written. Returns 0.
+    '''
+    with codecs.open(ATP_file, 'r', encoding='iso-8859-1') as f:
+        deck = f.read()
+    time.sleep(latency)
+
+    cases = _begin.split(deck)
+    if len(cases) > 1:
+        # Text before the first BEGIN NEW DATA CASE card and the blank case
+        # ending the deck are not data cases
+        cases = [c for c in cases[1:] if not _is_filler(c)]
+    base = os.path.splitext(ATP_file)[0]
+    punched = [c for c in cases if _line_constants.search(c)]
+    with codecs.open(base + '.lis', 'w', encoding='iso-8859-1') as f:
+        f.write(_banner % os.path.basename(base))
+        for case in cases:
+            f.write(_marker)
+            if _line_constants.search(case):
+                f.write('Line constants case with punched output.\n')
+            else:
+                write_synthetic_lis(f, n_branches, n_switches,
+                                    _seed(case, seed))
+        f.write(_marker)
+    if punched:
+        with codecs.open(base + '.pch', 'w', encoding='iso-8859-1') as f:
+            for case in punched:
+                write_synthetic_pch(f, case, _seed(case, seed))
+    return 0
+
+
+parser = argparse.ArgumentParser(
+    description='Stand-in for the ATP executable writing synthetic outputs.')
+parser.add_argument('ATP_file', help='ATP deck to "run".')
+parser.add_argument('-n', '--branches', type=int, default=100,
+                    help='Number of branches of each steady-state case.')
+parser.add_argument('-s', '--switches', type=int, default=10,
+                    help='Number of switches of each steady-state case.')
+parser.add_argument('-l', '--latency', type=float, default=0.,
+                    help='Delay in seconds before writing the outputs.')
+parser.add_argument('--seed', type=int, default=0,
+                    help='Seed combined with the text of each case.')
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    args = parser.parse_args(argv)
+    return fake_run(args.ATP_file, args.branches, args.switches,
+                    args.latency, args.seed)
+
+
+def install(directory, n_branches=100, n_switches=10, latency=0., seed=0):
+    '''
+    Writes a launcher of the stand-in with the given settings to directory
+    and points pyATP.ATP_path and ATP_exe to it, so that run_ATP and the
+    modules using it run the stand-in instead of ATP. Returns the previous
+    (ATP_path, ATP_exe) to restore them.
+    '''
+    args = ['--branches', str(n_branches), '--switches', str(n_switches),
+            '--latency', repr(float(latency)), '--seed', str(seed)]
+    package_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    if os.name == 'nt':
+        exe = 'fake_atp.bat'
+        text = ('@echo off\r\nset PYTHONPATH=%s;%%PYTHONPATH%%\r\n'
+                '"%s" -m pyATP.fakeatp %s %%*\r\n' %
+                (package_dir, sys.executable, ' '.join(args)))
+    else:
+        exe = 'fake_atp'
+        text = ('#!%s\nimport sys\nsys.path.insert(0, %r)\n'
+                'from pyATP.fakeatp import main\n'
+                'sys.exit(main(%r + sys.argv[1:]))\n' %
+                (sys.executable, package_dir, args))
+    filename = os.path.join(directory, exe)
+    with open(filename, 'w') as f:
+        f.write(text)
+    os.chmod(filename, os.stat(filename).st_mode | stat.S_IXUSR |
+             stat.S_IXGRP | stat.S_IXOTH)
+    previous = _atp.ATP_path, _atp.ATP_exe
+    _atp.ATP_path, _atp.ATP_exe = directory, exe
+    return previous
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,331 @@
+'''
+Line constants of overhead lines computed in Python.
+
+line_constants computes the series impedance and shunt admittance matrices
+of the phases of an overhead line from the conductor data of a LINE
+CONSTANTS case, as ATP does, without running ATP:
+
+    Z, Y = line_constants(cards.conductors(), rho=100., freq=60.,
+                          length=38.9, metric=False)
+
+The earth return is accounted for with Carson's series (asymptotic
+expansion for large distances), ground wires (phase number 0) are
+eliminated by Kron reduction and conductors of the same phase are combined
+into a bundle. Conductors are either given by their reactance at one foot
+(one meter) spacing (IX = 0), or as solid or tubular conductors with skin
+effect (IX = 4, SKIN = T/D). Z and Y are those of the nominal pi model of
+the whole length, as punched by ATP and held by LineConstPCHCards. See the
+EMTP Theory Book, chapter 4, for the equations.
+
+line_constants_stack does the same calculation at once for stacks of
+geometries given by conductor coordinates, radii and resistances in SI
+units, for design studies of many candidate geometries, e.g. for N tower
+geometries of n_c conductors:
+
+    Z, Y = line_constants_stack(phases, x, h, radius, resistance, rho=100.,
+                                freq=60., length=1e3)
+
+where x, h, radius and resistance are (N, n_c) arrays, returns stacks of N
+(n_ph, n_ph) matrices that lineZ.ZY_to_ABCD and lineZ.impedance_imbalance
+take as is.
+'''
+
+from __future__ import print_function, unicode_literals
+
+from math import pi, sqrt
+
+import numpy as np
+
+__all__ = ['line_constants', 'line_constants_stack', 'carson_correction',
+           'internal_impedance', 'kron_reduce']
+
+MU0 = 4e-7*pi
+EPS0 = 8.854187817e-12
+EULER_GAMMA = 0.5772156649015329
+
+# Lengths in meters of the units of the conductor cards, by units system:
+# (RESIS and REACT per unit length, DIAM, HORIZ/VTOWER/VMID, length)
+UNITS = {'english': (1609.344, 0.0254, 0.3048, 1609.344),
+         'metric': (1000., 0.01, 1., 1000.)}
+
+# Carson's series is used for a up to this value, its asymptotic expansion
+# above.
+CARSON_SERIES_MAX = 5.
+CARSON_TERMS = 30
+
+
+def _carson_coefficients(n):
+    ''' b_i, c_i and d_i of Carson's series for i = 1 to n (index 0 is not
+        used). The sign of b_i changes every four terms. '''
+    b = np.zeros(n + 1)
+    c = np.zeros(n + 1)
+    b[1], b[2] = sqrt(2)/6, 1./16
+    c[2] = 1.3659315
+    for i in range(3, n + 1):
+        sign = -1 if (i - 1) // 4 % 2 else 1
+        b[i] = sign * abs(b[i - 2]) / (i*(i + 2))
+        c[i] = c[i - 2] + 1./i + 1./(i + 2)
+    return b, c, pi/4*b
+
+_b, _c, _d = _carson_coefficients(CARSON_TERMS)
+
+
+def carson_correction(a, theta, omega):
+    '''
+    Carson's earth return correction, in Ohms per meter, of the impedance
+    between two conductors (or of a conductor, theta = 0) at angular
+    frequency omega. a = 4*pi*sqrt(5)*1e-4*D*sqrt(f/rho), where D is the
+    distance in meters from one conductor to the image of the other, and
+    theta is the angle between D and the vertical. a and theta are arrays
+    of the same shape.
+    '''
+    a = np.asarray(a, dtype=np.float64)
+    theta = np.asarray(theta, dtype=np.float64)
+    dR = np.zeros(a.shape)
+    dX = np.zeros(a.shape)
+
+    small = a <= CARSON_SERIES_MAX
+    s, t = a[small], theta[small]
+    log_s = np.log(s)
+    sR = np.full(s.shape, pi/8)
+    sX = 0.5*(0.6159315 - log_s)
+    power = np.ones(s.shape)
+    for i in range(1, CARSON_TERMS + 1):
+        power = power*s
+        cos_i = power*np.cos(i*t)
+        if i % 4 == 1:
+            sR -= _b[i]*cos_i
+            sX += _b[i]*cos_i
+        elif i % 4 == 3:
+            sR += _b[i]*cos_i
+            sX += _b[i]*cos_i
+        else:
+            log_term = _b[i]*((_c[i] - log_s)*cos_i +
+                              t*power*np.sin(i*t))
+            if i % 4 == 2:
+                sR += log_term
+                sX -= _d[i]*cos_i
+            else:
+                sR -= _d[i]*cos_i
+                sX -= log_term
+    dR[small], dX[small] = sR, sX
+
+    s, t = a[~small], theta[~small]
+    dR[~small] = (np.cos(t)/s - sqrt(2)*np.cos(2*t)/s**2 + np.cos(3*t)/s**3
+                  + 3*np.cos(5*t)/s**5 - 45*np.cos(7*t)/s**7) / sqrt(2)
+    dX[~small] = (np.cos(t)/s - np.cos(3*t)/s**3 + 3*np.cos(5*t)/s**5
+                  + 45*np.cos(7*t)/s**7) / sqrt(2)
+    return 4e-7*omega*(dR + 1j*dX)
+
+
+def _bessel_ik(z):
+    '''
+    Returns I0, I1, K0 and K1 of the complex array z (Re z > 0), scaled as
+    I*exp(-z) and K*exp(z) so that they do not overflow. Power series are
+    used for small |z| and asymptotic expansions for large |z|.
+    '''
+    z = np.asarray(z, dtype=np.complex128)
+    I0, I1, K0, K1 = [np.empty(z.shape, dtype=np.complex128)
+                      for _ in range(4)]
+
+    small = np.abs(z) <= 10.
+    s = z[small]
+    t = (s/2)**2
+    term0 = np.ones(s.shape, dtype=np.complex128)     # t**k/(k!)**2
+    term1 = np.ones(s.shape, dtype=np.complex128)     # t**k/(k!(k+1)!)
+    i0, i1 = term0.copy(), term1.copy()
+    k0 = np.zeros(s.shape, dtype=np.complex128)
+    # psi(k+1) + psi(k+2) for k = 0
+    psi_sum = -2*EULER_GAMMA + 1.
+    k1 = psi_sum*term1
+    harmonic = 0.
+    for k in range(1, 60):
+        term0 = term0*t/(k*k)
+        term1 = term1*t/(k*(k + 1))
+        harmonic += 1./k
+        psi_sum += 1./k + 1./(k + 1)
+        i0 += term0
+        i1 += term1
+        k0 += harmonic*term0
+        k1 += psi_sum*term1
+    i1 = i1*s/2
+    log_s = np.log(s/2)
+    k0 = k0 - (log_s + EULER_GAMMA)*i0
+    k1 = 1./s + log_s*i1 - s/4*k1
+    I0[small], I1[small] = i0*np.exp(-s), i1*np.exp(-s)
+    K0[small], K1[small] = k0*np.exp(s), k1*np.exp(s)
+
+    s = z[~small]
+    for nu, I, K in ((0, I0, K0), (1, I1, K1)):
+        mu = 4.*nu*nu
+        term = np.ones(s.shape, dtype=np.complex128)
+        i_sum, k_sum = term.copy(), term.copy()
+        for k in range(1, 20):
+            term = term*(mu - (2*k - 1)**2)/(k*8*s)
+            i_sum += (-1)**k*term
+            k_sum += term
+        I[~small] = i_sum/np.sqrt(2*pi*s)
+        K[~small] = k_sum*np.sqrt(pi/(2*s))
+    return I0, I1, K0, K1
+
+
+def internal_impedance(R_dc, radius, t_d, omega, mu_r=1.):
+    '''
+    Internal impedance in Ohms per meter of tubular conductors of outer
+    radius radius (m), thickness to diameter ratio t_d (0.5 for solid
+    conductors) and DC resistance R_dc (Ohms per meter) at angular
+    frequency omega, with skin effect. Arguments are arrays of the same
+    shape or scalars.
+    '''
+    R_dc, q, t_d = np.broadcast_arrays(np.asarray(R_dc, dtype=np.float64),
+                                       np.asarray(radius, dtype=np.float64),
+                                       np.asarray(t_d, dtype=np.float64))
+    shape = q.shape
+    R_dc, q, t_d = R_dc.ravel(), q.ravel(), t_d.ravel()
+    r = q*(1 - 2*t_d)
+    rho = R_dc*pi*(q**2 - r**2)
+    m = np.sqrt(1j*omega*MU0*mu_r/rho)
+    I0q, I1q, K0q, K1q = _bessel_ik(m*q)
+    ratio = I0q/I1q
+    tube = r > 0
+    if tube.any():
+        mt, qt, rt = m[tube], q[tube], r[tube]
+        _, I1r, _, K1r = _bessel_ik(mt*rt)
+        # exp(-2m(q - r)) from the scaling of the Bessel functions
+        e = np.exp(-2*mt*(qt - rt))
+        ratio[tube] = ((I0q[tube]*K1r + e*K0q[tube]*I1r) /
+                       (I1q[tube]*K1r - e*I1r*K1q[tube]))
+    return (rho*m/(2*pi*q)*ratio).reshape(shape)
+
+
+def kron_reduce(M, keep):
+    '''
+    Kron reduction of the square matrix M, or of the stack of matrices M of
+    shape (..., n, n), to the rows and columns selected by the boolean array
+    keep, eliminating the others as conductors with zero voltage:
+    M_kk - M_ke M_ee^-1 M_ek.
+    '''
+    keep = np.asarray(keep, dtype=bool)
+    drop = ~keep
+    M_kk = M[..., keep, :][..., keep]
+    if not drop.any():
+        return M_kk
+    return M_kk - np.matmul(M[..., keep, :][..., drop], np.linalg.solve(
+        M[..., drop, :][..., drop], M[..., drop, :][..., keep]))
+
+
+def line_constants_stack(phases, x, h, radius, resistance, rho, freq,
+                         length=1., gmr=None, t_d=None):
+    '''
+    Returns the series impedance Z (Ohms) and shunt admittance Y (Siemens)
+    matrices of the phases 1 to n_ph of many geometries of a line at once,
+    in stacks of shape (..., n_ph, n_ph), for a length in meters.
+
+    phases is the (n_c,) array of the phase numbers of the n_c conductors
+    (0 for ground wires), the same for all geometries. x (horizontal
+    position), h (average height), radius (outer radius) are in meters and
+    resistance in Ohms per meter, in arrays of shape (..., n_c) or that
+    broadcast to it, e.g. (N, n_c) for N geometries. The internal reactance
+    is given by the geometric mean radii gmr (by default that of a solid
+    round conductor, radius*exp(-1/4)), except for tubular conductors of
+    thickness to diameter ratio t_d > 0, for which resistance is the DC
+    resistance and the skin effect is computed. rho, the earth resistivity
+    in Ohm-m, is a scalar or an array of shape (...).
+
+    All the geometries are computed with vectorized operations, including
+    the Carson terms and the Kron reduction, and Z and Y can be used as is
+    with lineZ.ZY_to_ABCD and the unbalance criteria of lineZ.
+    '''
+    phases = np.asarray(phases, dtype=int)
+    if gmr is None:
+        gmr = np.asarray(radius, dtype=np.float64)*np.exp(-0.25)
+    x, h, radius, resistance, gmr, t_d = np.broadcast_arrays(
+        *[np.asarray(v, dtype=np.float64) for v in
+          (x, h, radius, resistance, gmr, 0. if t_d is None else t_d)])
+    n_ph = phases.max() if len(phases) else 0
+    if n_ph < 1 or set(range(1, n_ph + 1)) - set(phases):
+        raise ValueError('Conductors of phases 1 to %d not found' % n_ph)
+    omega = 2*pi*freq
+    rho = np.asarray(rho, dtype=np.float64)[..., np.newaxis, np.newaxis]
+
+    # Distances between conductors, and to their images
+    dx = x[..., :, np.newaxis] - x[..., np.newaxis, :]
+    h_sum = h[..., :, np.newaxis] + h[..., np.newaxis, :]
+    D = np.sqrt(dx**2 + h_sum**2)
+    d = np.sqrt(dx**2 + (h[..., :, np.newaxis] - h[..., np.newaxis, :])**2)
+
+    # Self terms: the geometric mean radius, or the outer radius and the
+    # internal impedance with skin effect of tubular conductors
+    z_int = resistance.astype(np.complex128)
+    gmr = gmr.copy()
+    tube = t_d > 0
+    if tube.any():
+        z_int[tube] = internal_impedance(resistance[tube], radius[tube],
+                                         t_d[tube], omega)
+        gmr[tube] = radius[tube]
+    diag = np.arange(len(phases))
+    d_z = d.copy()
+    d_z[..., diag, diag] = gmr
+    d_p = d.copy()
+    d_p[..., diag, diag] = radius
+
+    a = 4*pi*sqrt(5)*1e-4*D*np.sqrt(freq/rho)
+    theta = np.arctan2(np.abs(dx), h_sum)
+    Z = (1j*omega*MU0/(2*pi)*np.log(D/d_z) +
+         carson_correction(a, theta, omega))
+    Z[..., diag, diag] += z_int
+    P = np.log(D/d_p)/(2*pi*EPS0)
+
+    # Eliminate the ground wires, then combine the conductors of each phase
+    phase = phases > 0
+    Z = kron_reduce(Z, phase)
+    C = np.linalg.inv(kron_reduce(P, phase))
+    T = (phases[phase][:, np.newaxis] == np.arange(1, n_ph + 1)).astype(float)
+    if len(T) > n_ph:
+        Z = np.linalg.inv(np.matmul(np.matmul(T.T, np.linalg.inv(Z)), T))
+        C = np.matmul(np.matmul(T.T, C), T)
+    else:
+        # One conductor per phase, in the order of their phase numbers
+        order = np.argsort(phases[phase])
+        Z = Z[..., order, :][..., order]
+        C = C[..., order, :][..., order]
+    return Z*length, 1j*omega*C*length
+
+
+def line_constants(conductors, rho, freq, length=1., metric=False):
+    '''
+    Returns the (n_ph, n_ph) series impedance Z (Ohms) and shunt admittance
+    Y (Siemens) matrices of the phases 1 to n_ph of a line of the given
+    length (miles, or km if metric) at freq Hz over earth of resistivity
+    rho (Ohm-m).
+
+    conductors is a sequence of dicts with the fields of the conductor
+    cards of LineConstCards: IP (phase number, 0 for ground wires), SKIN,
+    RESIS, IX, REACT, DIAM, HORIZ, VTOWER and VMID, in the units of the
+    cards. Conductor heights are averaged over the span as ATP does,
+    VTOWER - 2/3 of the sag; a VMID of 0 means no sag. Raises ValueError
+    for IX other than 0 or 4, or if a phase has no conductor.
+    '''
+    per_length, diam_unit, height_unit, length_unit = \
+        UNITS['metric' if metric else 'english']
+    fields = ['IP', 'SKIN', 'RESIS', 'IX', 'REACT', 'DIAM', 'HORIZ',
+              'VTOWER', 'VMID']
+    data = np.array([[c.get(f) or 0. for f in fields] for c in conductors],
+                    dtype=np.float64).reshape(-1, len(fields))
+    ip = data[:, 0].astype(int)
+    skin, resis, ix, react, diam = data[:, 1:6].T
+    v_tower, v_mid = data[:, 7], data[:, 8]
+    if not np.isin(ix, (0, 4)).all():
+        raise ValueError('Only conductors with IX = 0 or 4 are supported')
+    if ((ix == 4) & ((skin <= 0) | (skin > 0.5))).any():
+        raise ValueError('IX = 4 conductors need 0 < SKIN (T/D) <= 0.5')
+
+    # The geometric mean radius from the reactance at unit spacing for
+    # IX = 0; it is not used for IX = 4.
+    omega = 2*pi*freq
+    gmr = height_unit*np.exp(-react/per_length/(omega*MU0/(2*pi)))
+    return line_constants_stack(
+        ip, data[:, 6]*height_unit,
+        np.where(v_mid > 0, (v_tower + 2*v_mid)/3, v_tower)*height_unit,
+        diam/2*diam_unit, resis/per_length, rho, freq,
+        length=length*length_unit, gmr=gmr, t_d=np.where(ix == 4, skin, 0.))
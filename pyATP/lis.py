@@ -0,0 +1,938 @@
+'''
+Vectorized parsing of ATP LIS output files.
+
+The LIS file is memory-mapped and the blocks of interest are located by byte
+offset. Fixed-width columns are then gathered for all lines of a block at once
+and converted to NumPy arrays in bulk, instead of slicing and converting each
+field of each line in Python. get_SS_results uses this engine by default.
+Compressed LIS files are read transparently, see the compression module.
+'''
+
+from __future__ import print_function, unicode_literals
+
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+import contextlib
+import json
+import mmap
+import os
+import re
+
+import numpy as np
+
+from . import compression
+
+# Steady state phasor solution column definitions, 1-based starting column
+# numbers as in get_SS_results. Two blank spaces between columns are assumed.
+SS_NODE_COLS = [2, 13, 23, 40, 61, 78, 99, 116, 133]
+SS_SW_COLS = [7, 17, 30, 48, 66, 85, 97, 115, 133]
+
+# Headings marking the blocks of the LIS file. Each must start a line,
+# optionally after leading spaces where noted.
+ss_res_start = b'Sinusoidal steady-state phasor solution, branch by branch'
+ss_node_end = b'Total network loss  P-loss  by summing injections'
+ss_sw_start = b'Output for steady-state phasor switch currents.'
+# Echo of the card that separates stacked data cases
+new_case = b'BEGIN NEW DATA CASE'
+# Echo of an input card in a LIS file: its description, then | and the card
+_card_echo = re.compile(br'^[^|\n]*\|[ \t]*[^\s|][^\n]*', re.M)
+# Heading of the table of output variables, one row per frequency of a
+# FREQUENCY SCAN (or per time step of a transient simulation)
+fs_heading = b'Column headings for the'
+
+# Sidecar index files, see build_index
+LIS_INDEX_SUFFIX = '.idx'
+LIS_INDEX_VERSION = 3
+
+# Number of lines from the steady-state heading to the first blank line of
+# the first branch.
+SS_HEADER_LINES = 4
+
+SSBlock = namedtuple('SSBlock', ['from_node', 'to_node', 'v_from', 'v_to',
+                                 'i_from', 'i_to',
+                                 'sw_from', 'sw_to', 'sw_i', 'end',
+                                 'node_lines'])
+SSBlock.__doc__ = ''' Arrays extracted from one steady-state phasor solution.
+    Row n of from_node, to_node, v_from, v_to, i_from and i_to describes the
+    nth branch printed. sw_from, sw_to and sw_i describe the switches. end is
+    the byte offset just past the last line parsed. node_lines is an (n, 2)
+    array of the byte offsets of the lines printing the from node and the to
+    node of each branch. '''
+
+
+FrequencyScan = namedtuple('FrequencyScan', ['freq', 'values', 'names',
+                                             'end'])
+FrequencyScan.__doc__ = ''' Results of a FREQUENCY SCAN. freq is the vector of
+    frequencies and values an (n_freq, n_var) complex array of the output
+    variables at each frequency. names gives the node name of each column of
+    values, or (from node, to node) for voltage differences and branch
+    currents. end is the byte offset just past the table. '''
+
+# Columns printed per output variable for each FREQUENCY SCAN output option
+FS_OUTPUTS = {'polar': 2, 'rect': 2, 'mag': 1, 'both': 4}
+
+
+def col_slices(col_nums):
+    ''' Convert 1-based starting column numbers to slices of the field
+        contents, assuming two blank spaces between columns. '''
+    return [slice(start-1, end-3) for start, end in
+            zip(col_nums[:-1], col_nums[1:])]
+
+
+def find_line(buf, text, pos=0, end=None, indent=False):
+    ''' Returns the offset of the start of the first line in buf[pos:end]
+        that begins with text, or -1 if there is none. If indent is True,
+        the text may be preceded by spaces. A plain substring search is used
+        since it is much faster than a multi-line regular expression on large
+        files. '''
+    if end is None:
+        end = len(buf)
+    while True:
+        i = buf.find(text, pos, end)
+        if i < 0:
+            return -1
+        line_start = buf.rfind(b'\n', 0, i) + 1
+        if i == line_start or \
+                indent and buf[line_start:i].strip(b' ') == b'':
+            return line_start
+        pos = i + 1
+
+
+def next_line(buf, pos, end=None, n=1):
+    ''' Returns the offset of the start of the nth line after the line
+        containing pos. '''
+    if end is None:
+        end = len(buf)
+    for _ in range(n):
+        i = buf.find(b'\n', pos, end)
+        pos = end if i < 0 else i + 1
+    return pos
+
+
+@contextlib.contextmanager
+def map_file(filename):
+    ''' Context manager yielding a read-only memory map of the file. A
+        compressed file is decompressed into memory in one streaming pass
+        instead, and its bytes are yielded. '''
+    if compression.file_compression(filename) is not None:
+        with compression.open_file(filename) as f:
+            yield f.read()
+        return
+    with open(filename, 'rb') as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files cannot be mapped
+            yield b''
+            return
+        try:
+            yield mm
+        finally:
+            try:
+                mm.close()
+            except BufferError:
+                # An array view of the map is still alive, e.g. in a
+                # traceback. The map is closed when it is collected.
+                pass
+
+
+def line_bounds(buf, start, end):
+    ''' Returns arrays of the start offsets and end offsets (excluding the
+        newline) of the lines in buf[start:end]. '''
+    a = np.frombuffer(buf, dtype=np.uint8, count=end-start, offset=start)
+    nl = np.flatnonzero(a == 10) + start
+    starts = np.concatenate(([start], nl + 1))
+    ends = np.concatenate((nl, [end]))
+    if starts[-1] >= end:
+        starts = starts[:-1]
+        ends = ends[:-1]
+    return starts, ends
+
+
+def fixed_width(buf, starts, ends, sl):
+    ''' Gather the characters of slice sl from every line given by starts and
+        ends into a (n_lines, width) uint8 array. Characters past the end of
+        a line and carriage returns are returned as spaces. '''
+    a = np.frombuffer(buf, dtype=np.uint8)
+    idx = starts[:, np.newaxis] + np.arange(sl.start, sl.stop)
+    field = np.take(a, idx, mode='clip')
+    if len(starts) and np.min(ends - starts) < sl.stop:
+        field[idx >= ends[:, np.newaxis]] = ord(' ')
+    field[field == ord('\r')] = ord(' ')
+    return field
+
+
+def _as_bytes(field):
+    return np.ascontiguousarray(field).view('S%d' % field.shape[1])[:, 0]
+
+
+def to_float(field):
+    ''' Convert a fixed-width field array to float64 in bulk. '''
+    if field.shape[0] == 0:
+        return np.empty(0, dtype=np.float64)
+    return _as_bytes(field).astype(np.float64)
+
+
+def to_str(field):
+    ''' Convert a fixed-width field array to an array of stripped strings. '''
+    if field.shape[0] == 0:
+        return np.empty(0, dtype='U1')
+    return np.char.strip(_as_bytes(field)).astype('U')
+
+
+def is_blank(field):
+    ''' Returns a boolean array that is True for blank rows of field. '''
+    return np.all((field == ord(' ')) | (field == ord('\t')), axis=1)
+
+
+def to_complex(re_part, im_part):
+    rtn = np.empty(re_part.shape, dtype=np.complex128)
+    rtn.real = re_part
+    rtn.imag = im_part
+    return rtn
+
+
+def _switch_lines(buf, pos, end, sl):
+    ''' Returns line bounds of the switch current table starting at pos. The
+        table ends at the first line that is blank in the node column. The
+        search window grows until that line or the end of the data is
+        found so only the table itself is scanned. '''
+    window = 1 << 16
+    while True:
+        stop = min(pos + window, end)
+        starts, ends = line_bounds(buf, pos, stop)
+        if stop < end:
+            # The last line may be cut off by the window
+            starts = starts[:-1]
+            ends = ends[:-1]
+        blank = np.flatnonzero(is_blank(fixed_width(buf, starts, ends, sl)))
+        if len(blank) > 0:
+            return starts[:blank[0]], ends[:blank[0]]
+        if stop >= end:
+            return starts, ends
+        window *= 4
+
+
+def SS_offsets(buf, pos=0, end=None):
+    '''
+    Locate the first steady-state phasor solution in buf[pos:end]. Returns a
+    dict of the byte offsets of the lines starting the solution (ss_start),
+    ending the node block (node_end) and heading the switch currents
+    (sw_head), and of the end of the region searched for switches (sw_end).
+    Offsets of blocks that are not found are -1.
+    '''
+    if end is None:
+        end = len(buf)
+    offsets = {'ss_start': -1, 'node_end': -1, 'sw_head': -1, 'sw_end': end}
+    ss_start = find_line(buf, ss_res_start, pos, end)
+    if ss_start < 0:
+        return offsets
+    offsets['ss_start'] = ss_start
+    data_start = next_line(buf, ss_start, end, SS_HEADER_LINES)
+    node_end = find_line(buf, ss_node_end, data_start, end, indent=True)
+    offsets['node_end'] = node_end
+    if node_end >= 0:
+        # Switch currents are printed before the next steady-state
+        # solution, if there is one.
+        sw_end = find_line(buf, ss_res_start, node_end, end)
+        if sw_end >= 0:
+            offsets['sw_end'] = sw_end
+        offsets['sw_head'] = find_line(buf, ss_sw_start, node_end,
+                                       offsets['sw_end'])
+    return offsets
+
+
+def parse_SS_block(buf, pos=0, end=None, offsets=None):
+    '''
+    Parse the first steady-state phasor solution found in buf[pos:end]. buf
+    can be any object supporting the buffer protocol, such as a memory map
+    of the LIS file. Returns an SSBlock or None if no steady-state solution
+    is found. Values are in peak units as printed by ATP.
+
+    offsets may be the dict returned by SS_offsets for the same range, e.g.
+    from a LIS index, so the blocks are not searched for again.
+    '''
+    if end is None:
+        end = len(buf)
+    if offsets is None:
+        offsets = SS_offsets(buf, pos, end)
+    ss_start = offsets['ss_start']
+    if ss_start < 0:
+        return None
+
+    # Skip the heading lines to get to where results start
+    data_start = next_line(buf, ss_start, end, SS_HEADER_LINES)
+    node_end = offsets['node_end']
+    if node_end < 0:
+        node_end = end
+
+    starts, ends = line_bounds(buf, data_start, node_end)
+    # Each branch is printed as six lines: blank, from node real parts,
+    # from node imaginary parts, blank, to node real parts, to node
+    # imaginary parts.
+    n = len(starts) // 6
+    starts = starts[:6*n].reshape(n, 6)
+    ends = ends[:6*n].reshape(n, 6)
+    c = col_slices(SS_NODE_COLS)
+
+    def col(line, k):
+        return fixed_width(buf, starts[:, line], ends[:, line], c[k])
+
+    from_node = to_str(col(1, 0))
+    to_node = to_str(col(4, 1))
+    v_from = to_complex(to_float(col(1, 2)), to_float(col(2, 2)))
+    i_from = to_complex(to_float(col(1, 4)), to_float(col(2, 4)))
+    v_to = to_complex(to_float(col(4, 2)), to_float(col(5, 2)))
+    i_to = to_complex(to_float(col(4, 4)), to_float(col(5, 4)))
+    block_end = node_end
+    node_lines = starts[:, [1, 4]]
+
+    # Switch currents (if any)
+    sw_head = offsets['sw_head']
+    sw_end = offsets['sw_end']
+    if sw_head >= 0:
+        c = col_slices(SS_SW_COLS)
+        # Eat the column header line
+        sw_start = next_line(buf, sw_head, sw_end, 2)
+        starts, ends = _switch_lines(buf, sw_start, sw_end, c[0])
+        sw_from = to_str(fixed_width(buf, starts, ends, c[0]))
+        sw_to = to_str(fixed_width(buf, starts, ends, c[1]))
+        sw_to = np.where(sw_to == '', 'TERRA', sw_to)
+        re_field = fixed_width(buf, starts, ends, c[2])
+        im_field = fixed_width(buf, starts, ends, c[3])
+        is_open = np.char.find(_as_bytes(re_field), b'Open') >= 0
+        re_field[is_open] = ord(' ')
+        re_field[is_open, -1] = ord('0')
+        im_field[is_open] = ord(' ')
+        im_field[is_open, -1] = ord('0')
+        sw_i = to_complex(to_float(re_field), to_float(im_field))
+        if len(ends):
+            block_end = int(ends[-1])
+    else:
+        sw_from = sw_to = np.empty(0, dtype='U1')
+        sw_i = np.empty(0, dtype=np.complex128)
+
+    return SSBlock(from_node, to_node, v_from, v_to, i_from, i_to,
+                   sw_from, sw_to, sw_i, block_end, node_lines)
+
+
+def _interleave(a, b):
+    rtn = np.empty(len(a) + len(b), dtype=np.result_type(a, b))
+    rtn[0::2] = a
+    rtn[1::2] = b
+    return rtn
+
+
+def _intern(names):
+    ''' Returns (unique_names, codes) where unique_names is an array of
+        each name in order of first appearance and codes gives the index of
+        each element of names in unique_names. '''
+    uniq, first, inverse = np.unique(names, return_index=True,
+                                     return_inverse=True)
+    order = np.argsort(first, kind='stable')
+    rank = np.empty(len(order), dtype=np.int32)
+    rank[order] = np.arange(len(order), dtype=np.int32)
+    return uniq[order], rank[inverse.ravel()]
+
+
+def _last_occurrence(codes):
+    ''' Returns (unique_codes, pos) where pos is the position of the last
+        occurrence of each unique code, like the value kept by a dict that
+        is assigned the codes in order. '''
+    uniq, idx = np.unique(codes[::-1], return_index=True)
+    return uniq, len(codes) - 1 - idx
+
+
+class SteadyStateArrays(object):
+    '''
+    Compact, array-backed storage of a steady-state phasor solution.
+
+    Node names are interned once: node_names is a bytes array of them in
+    order of first appearance (ATP node names are ASCII), and names are
+    looked up by binary search in a sorted copy, so no Python object is kept
+    per node or branch. voltages holds
+    the node voltage phasors in the same order, NaN for names that only
+    appear on switches. Each branch or switch is stored once, as a row of
+    br_nodes (from and to node index) and br_current (current at the from end
+    and at the to end; for switches the to end is the negated from end).
+    The reverse direction of a branch is looked up from the same row.
+
+    node_voltages and branch_currents are read-only dict-compatible views,
+    so code written for the dicts of get_SS_results keeps working.
+    '''
+    def __init__(self, node_names, voltages, br_nodes, br_current,
+                 _lookup=None):
+        self.node_names = node_names
+        self.voltages = voltages
+        self.br_nodes = br_nodes
+        self.br_current = br_current
+        # Number of nodes with a voltage. They come first in node_names.
+        self.n_v = int(np.count_nonzero(~np.isnan(voltages)))
+        if _lookup is None:
+            name_order = np.argsort(node_names, kind='stable')
+            keys, key_pos = _last_occurrence(self._key_codes())
+            _lookup = (node_names[name_order], name_order.astype(np.int32),
+                       keys, key_pos.astype(np.int32))
+        self._sorted_names, self._name_order, self._keys, self._key_pos = \
+            _lookup
+        self.node_voltages = NodeVoltageView(self)
+        self.branch_currents = BranchCurrentView(self)
+
+    @classmethod
+    def from_block(cls, block):
+        ''' Build from an SSBlock returned by parse_SS_block. '''
+        n = len(block.from_node)
+        names, codes = _intern(np.concatenate(
+            (_interleave(block.from_node, block.to_node),
+             _interleave(block.sw_from, block.sw_to))).astype('S'))
+        voltages = np.full(len(names), np.nan, dtype=np.complex128)
+        v_nodes, pos = _last_occurrence(codes[:2*n])
+        voltages[v_nodes] = _interleave(block.v_from, block.v_to)[pos]
+        br_nodes = codes.reshape(-1, 2)
+        br_current = np.empty((len(br_nodes), 2), dtype=np.complex128)
+        br_current[:n, 0] = block.i_from
+        br_current[:n, 1] = block.i_to
+        br_current[n:, 0] = block.sw_i
+        br_current[n:, 1] = -block.sw_i
+        return cls(names, voltages, br_nodes, br_current)
+
+    @classmethod
+    def from_dicts(cls, node_voltages, branch_currents):
+        ''' Build from the node_voltages and branch_currents dicts of
+            get_SS_results. The to end current of each branch is the current
+            of the reverse key, or the negated current if there is none. '''
+        nodes = list(node_voltages)
+        keys = list(branch_currents)
+        names, codes = _intern(np.array(
+            nodes + [n for k in keys for n in k], dtype='U').astype('S'))
+        voltages = np.full(len(names), np.nan, dtype=np.complex128)
+        voltages[:len(nodes)] = [node_voltages[n] for n in nodes]
+        br_current = np.array(
+            [(i, branch_currents.get((t, f), -i))
+             for (f, t), i in branch_currents.items()],
+            dtype=np.complex128).reshape(-1, 2)
+        return cls(names, voltages, codes[len(nodes):].reshape(-1, 2),
+                   br_current)
+
+    def scaled(self, s):
+        ''' Returns a new SteadyStateArrays with all phasors multiplied by s.
+            The node index and branch lookup tables are shared. '''
+        return self.__class__(self.node_names, self.voltages*s,
+                              self.br_nodes, self.br_current*s,
+                              _lookup=(self._sorted_names, self._name_order,
+                                       self._keys, self._key_pos))
+
+    def _key_codes(self):
+        ''' Key code of (from, to) for the forward and reverse direction of
+            each row, in the order a dict would have been assigned. '''
+        n = len(self.node_names)
+        fr = self.br_nodes[:, 0].astype(np.int64)
+        to = self.br_nodes[:, 1].astype(np.int64)
+        codes = np.empty(2*len(fr), dtype=np.int64)
+        codes[0::2] = fr*n + to
+        codes[1::2] = to*n + fr
+        return codes
+
+    def node_codes(self, names):
+        ''' Indices of the node names. Raises KeyError for unknown names. '''
+        try:
+            names = np.asarray(names, dtype='U').astype('S')
+        except UnicodeEncodeError:
+            raise KeyError(names)
+        sorted_names = self._sorted_names
+        j = np.searchsorted(sorted_names, names)
+        found = j < len(sorted_names)
+        found[found] = sorted_names[j[found]] == names[found]
+        if not np.all(found):
+            raise KeyError(names[np.argmin(found)].decode('ascii'))
+        return self._name_order[j].astype(np.int64)
+
+    def node_voltage_array(self, names):
+        ''' Array of the voltages at the named nodes. '''
+        idx = self.node_codes(names)
+        v = self.voltages[idx]
+        if np.any(idx >= self.n_v):
+            raise KeyError(names[int(np.argmax(idx >= self.n_v))])
+        return v
+
+    def _branch_pos(self, pairs):
+        pairs = list(pairs)
+        fr = self.node_codes([p[0] for p in pairs])
+        to = self.node_codes([p[1] for p in pairs])
+        codes = fr*len(self.node_names) + to
+        j = np.searchsorted(self._keys, codes)
+        found = j < len(self._keys)
+        found[found] = self._keys[j[found]] == codes[found]
+        if not np.all(found):
+            raise KeyError(tuple(pairs[int(np.argmin(found))]))
+        return self._key_pos[j]
+
+    def branch_current_array(self, pairs):
+        ''' Array of the currents of the (from node, to node) pairs. '''
+        return self.br_current.ravel()[self._branch_pos(pairs)]
+
+    def branch_keys(self):
+        ''' (from, to) keys in the order a dict would have been built. '''
+        codes = self._key_codes()
+        uniq, first = np.unique(codes, return_index=True)
+        codes = codes[np.sort(first)]
+        n = len(self.node_names)
+        names = self.node_names.astype('U')
+        return list(zip(names[codes // n].tolist(),
+                        names[codes % n].tolist()))
+
+
+class NodeVoltageView(Mapping):
+    ''' Read-only {node name: voltage} view of SteadyStateArrays. '''
+    def __init__(self, arrays):
+        self.arrays = arrays
+
+    def __getitem__(self, name):
+        return complex(self.arrays.node_voltage_array([name])[0])
+
+    def __iter__(self):
+        return iter(self.arrays.node_names[:self.arrays.n_v].astype('U')
+                    .tolist())
+
+    def __len__(self):
+        return self.arrays.n_v
+
+
+class BranchCurrentView(Mapping):
+    ''' Read-only {(from node, to node): current} view of
+        SteadyStateArrays. '''
+    def __init__(self, arrays):
+        self.arrays = arrays
+
+    def __getitem__(self, key):
+        try:
+            fr, to = key
+        except (TypeError, ValueError):
+            raise KeyError(key)
+        return complex(self.arrays.branch_current_array([(fr, to)])[0])
+
+    def __iter__(self):
+        return iter(self.arrays.branch_keys())
+
+    def __len__(self):
+        return len(self.arrays._keys)
+
+
+def find_card(buf, text, pos=0, end=None):
+    ''' Returns the offset of the start of the first line in buf[pos:end]
+        holding a card that begins with text, either as a line of a deck or
+        as the echo of a card in a LIS file, after the first | of the line.
+        Returns -1 if there is none. Cards merely containing text, such as
+        comment cards, are not matched. '''
+    if end is None:
+        end = len(buf)
+    while True:
+        i = buf.find(text, pos, end)
+        if i < 0:
+            return -1
+        line_start = buf.rfind(b'\n', 0, i) + 1
+        if i == line_start or buf.find(b'|', line_start, i) == i - 1:
+            return line_start
+        pos = i + 1
+
+
+def _holds_case(buf, end):
+    ''' True if buf[:end], the text before the first BEGIN NEW DATA CASE
+        card, holds a data case: echoes of its cards or its results, rather
+        than only the banner ATP prints at the top of a LIS file. '''
+    for m in _card_echo.finditer(buf, 0, end):
+        if b'Input data card images' not in m.group(0):
+            return True
+    return (find_line(buf, ss_res_start, 0, end) >= 0 or
+            find_line(buf, fs_heading, 0, end, indent=True) >= 0)
+
+
+def iter_cases(buf):
+    '''
+    Generator of (case_number, start, end) byte ranges of the data cases in
+    buf. Every line holding (the echo of) a BEGIN NEW DATA CASE card starts
+    a new case, numbered from 1. The text before the first one, usually the
+    banner of ATP, belongs to the first case, unless it holds echoed cards
+    or results: ATP also accepts decks that do not start with that card,
+    and their first case is then numbered 1. The buffer is scanned once,
+    lazily, as the generator is consumed.
+    '''
+    end = len(buf)
+    nxt = find_card(buf, new_case)
+    case = 1
+    start = 0
+    if nxt < 0 or _holds_case(buf, nxt):
+        yield case, 0, nxt if nxt >= 0 else end
+        case += 1
+        start = nxt
+    while nxt >= 0:
+        nxt = find_card(buf, new_case, next_line(buf, nxt))
+        yield case, start, nxt if nxt >= 0 else end
+        case += 1
+        start = nxt
+
+
+def marker_cases(buf):
+    ''' Returns the list of the numbers of the cases of iter_cases that
+        begin with a BEGIN NEW DATA CASE card, in order: the cases of the
+        deck after each such card. '''
+    rtn = []
+    for case, start, end in iter_cases(buf):
+        if find_card(buf, new_case, start, end) >= 0:
+            rtn.append(case)
+    return rtn
+
+
+def _file_stamp(LIS_file):
+    st = os.stat(LIS_file)
+    return getattr(st, 'st_mtime_ns', int(st.st_mtime*1e9)), st.st_size
+
+
+def index_filename(LIS_file):
+    ''' Name of the sidecar index file of LIS_file. '''
+    return LIS_file + LIS_INDEX_SUFFIX
+
+
+def build_index(LIS_file, save=True):
+    '''
+    Scan LIS_file once and return its index, a dict of
+
+        mtime, size     stamp of the LIS file when it was indexed
+        cases           list with a dict per data case of its number and the
+                        byte offsets of its start and end, of its frequency
+                        scan table (fs_start) and of its steady-state
+                        solution blocks as returned by SS_offsets
+        nodes           list with a dict per case of the offset of the line
+                        where each node first appears in the steady-state
+                        node block
+
+    Offsets of blocks that are not found are -1. Offsets of compressed files
+    refer to the decompressed contents. If save is True, the index is also
+    written as JSON to the sidecar file index_filename(LIS_file), where
+    load_index finds it while the LIS file is unchanged.
+    '''
+    mtime, size = _file_stamp(LIS_file)
+    index = {'version': LIS_INDEX_VERSION, 'mtime': mtime, 'size': size,
+             'cases': [], 'nodes': []}
+    with map_file(LIS_file) as buf:
+        for case, start, end in iter_cases(buf):
+            entry = {'case': case, 'start': start, 'end': end,
+                     'fs_start': find_line(buf, fs_heading, start, end,
+                                           indent=True)}
+            offsets = SS_offsets(buf, start, end)
+            entry.update(offsets)
+            nodes = {}
+            block = parse_SS_block(buf, start, end, offsets)
+            if block is not None:
+                names = _interleave(block.from_node, block.to_node)
+                lines = block.node_lines.ravel()
+                uniq, first = np.unique(names, return_index=True)
+                nodes = dict(zip(uniq.tolist(), lines[first].tolist()))
+            index['cases'].append(entry)
+            index['nodes'].append(nodes)
+    if save:
+        with open(index_filename(LIS_file), 'w') as f:
+            json.dump(index, f)
+    return index
+
+
+def load_index(LIS_file):
+    ''' Returns the index of LIS_file saved by build_index, or None if
+        there is none or the LIS file has changed since. '''
+    try:
+        with open(index_filename(LIS_file)) as f:
+            index = json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+    if index.get('version') != LIS_INDEX_VERSION or \
+            [index.get('mtime'), index.get('size')] != \
+            list(_file_stamp(LIS_file)):
+        return None
+    return index
+
+
+def get_index(LIS_file):
+    ''' Returns the saved index of LIS_file, building and saving it first
+        if it is missing or stale. '''
+    index = load_index(LIS_file)
+    if index is None:
+        index = build_index(LIS_file)
+    return index
+
+
+def _SS_case_offsets(index):
+    ''' (case, start, end, offsets) of the indexed cases with a
+        steady-state solution. '''
+    keys = ('ss_start', 'node_end', 'sw_head', 'sw_end')
+    return [(c['case'], c['start'], c['end'], {k: c[k] for k in keys})
+            for c in index['cases'] if c['ss_start'] >= 0]
+
+
+def iter_SS_arrays(LIS_file, index=None):
+    '''
+    Generator of (case_number, SteadyStateArrays) for every data case of
+    LIS_file that has a steady-state phasor solution, in a single pass over
+    the memory-mapped file. Cases without a steady-state solution (e.g. the
+    empty case ending the deck) are skipped but still numbered.
+
+    If an index of the file is given, or a current one has been saved by
+    build_index, the solutions are parsed directly at the indexed offsets.
+    '''
+    if index is None:
+        index = load_index(LIS_file)
+    with map_file(LIS_file) as buf:
+        if index is not None:
+            for case, start, end, offsets in _SS_case_offsets(index):
+                yield case, SteadyStateArrays.from_block(
+                    parse_SS_block(buf, start, end, offsets))
+            return
+        for case, start, end in iter_cases(buf):
+            block = parse_SS_block(buf, start, end)
+            if block is not None:
+                yield case, SteadyStateArrays.from_block(block)
+
+
+def read_all_SS_arrays(LIS_file, workers=None):
+    '''
+    Returns a list of (case_number, SteadyStateArrays) of all data cases of
+    LIS_file, as iter_SS_arrays, parsed in parallel by a pool of workers
+    threads (one per CPU by default). The cases are located with the index
+    of the file, which is built and saved first if needed. Most of the
+    parsing is done by NumPy, which releases the GIL.
+    '''
+    cases = _SS_case_offsets(get_index(LIS_file))
+    if workers is None:
+        workers = os.cpu_count() or 1
+    with map_file(LIS_file) as buf:
+        def parse(case):
+            n, start, end, offsets = case
+            return n, SteadyStateArrays.from_block(
+                parse_SS_block(buf, start, end, offsets))
+        with ThreadPoolExecutor(max(1, workers)) as pool:
+            return list(pool.map(parse, cases))
+
+
+def read_SS_arrays(LIS_file):
+    ''' Memory-map LIS_file and return the first steady-state solution as
+        SteadyStateArrays, or None if there is none. The saved index of the
+        file is used if it is current. '''
+    index = load_index(LIS_file)
+    with map_file(LIS_file) as buf:
+        if index is not None:
+            cases = _SS_case_offsets(index)
+            block = parse_SS_block(buf, *cases[0][1:]) if cases else None
+        else:
+            block = parse_SS_block(buf)
+    if block is None:
+        return None
+    return SteadyStateArrays.from_block(block)
+
+
+def read_SS_node_voltages(LIS_file, names, case=None):
+    '''
+    Returns an array of the steady-state voltages of the named nodes, read
+    from the lines located by the index of LIS_file (built and saved first
+    if needed) without parsing the rest of the file. case selects the data
+    case, by default the first one with a steady-state solution. Raises
+    KeyError for names not in the node block.
+    '''
+    index = get_index(LIS_file)
+    cases = [k for k, c in enumerate(index['cases']) if c['ss_start'] >= 0
+             and (case is None or c['case'] == case)]
+    if not cases:
+        raise KeyError('No steady-state solution for case %s' % case)
+    nodes = index['nodes'][cases[0]]
+    lines = np.array([nodes[n] for n in names], dtype=np.int64)
+    c = col_slices(SS_NODE_COLS)[2]
+    with map_file(LIS_file) as buf:
+        def line_end(pos):
+            i = buf.find(b'\n', pos)
+            return len(buf) if i < 0 else i
+        # The real part is printed on the node's line and the imaginary part
+        # on the next one
+        re_end = np.array([line_end(pos) for pos in lines.tolist()],
+                          dtype=np.int64)
+        im_end = np.array([line_end(pos + 1) for pos in re_end.tolist()],
+                          dtype=np.int64)
+        re_part = to_float(fixed_width(buf, lines, re_end, c))
+        im_part = to_float(fixed_width(buf, re_end + 1, im_end, c))
+    return to_complex(re_part, im_part)
+
+
+def read_SS_results(LIS_file, s=1.0):
+    ''' Memory-map LIS_file and return (node_voltages, branch_currents) for
+        the first steady-state solution in the same format as
+        get_SS_results, as views of SteadyStateArrays. '''
+    arrays = read_SS_arrays(LIS_file)
+    if arrays is None:
+        print('Steady-state phasor solution not found.')
+        return {}, {}
+    if s != 1.0:
+        arrays = arrays.scaled(s)
+    return arrays.node_voltages, arrays.branch_currents
+
+
+# Lines of numbers, as printed in the rows of the output variable table
+_number_lines = re.compile(br'(?:[ \t]*[-+.\d][^\n]*\n?)+')
+_n_vars = re.compile(br'Column headings for the +(\d+)')
+# A number in E or F format. Fields filling their width run together, as in
+# -1.234567E+02-2.345678E+01, so numbers are not split on blanks
+_number = re.compile(br'[-+]?(?:\d+\.?\d*|\.\d+)(?:[Ee][-+]?\d+)?')
+# Column labels of real and imaginary parts in the table heading
+_rect_heading = re.compile(br'\b(?:real|imag)', re.I)
+
+
+def _FS_fields(first_line):
+    ''' Returns (freq, values): the slice of the frequency field and the
+        slices of the value fields of the first line of a table row, after
+        an optional step number. Fields are right-aligned, so each one runs
+        from the end of the previous one to the end of its number. '''
+    ends = [0] + [m.end() for m in _number.finditer(first_line)]
+    if b'.' not in first_line[:ends[1]]:
+        del ends[0]
+    return (slice(ends[0], ends[1]),
+            [slice(a, b) for a, b in zip(ends[1:], ends[2:])])
+
+
+def _FS_layout(n_fields, n_var, fs_output, heading):
+    ''' Returns the output option of a table with n_fields values per row.
+        Without fs_output it follows from the number of columns per
+        variable, and two columns are magnitude and angle, as printed by
+        default, unless the heading labels them as real and imaginary
+        parts. '''
+    if fs_output is None:
+        k = n_fields // n_var if n_fields % n_var == 0 else 0
+        outputs = [out for out in ('mag', 'polar', 'both')
+                   if FS_OUTPUTS[out] == k]
+        if outputs:
+            fs_output = outputs[0]
+        if fs_output == 'polar' and any(_rect_heading.search(line)
+                                        for line in heading):
+            fs_output = 'rect'
+    if fs_output is None or FS_OUTPUTS[fs_output]*n_var != n_fields:
+        raise ValueError('Frequency scan table does not have the columns of '
+                         '%d output variables' % n_var)
+    return fs_output
+
+
+def _FS_names(heading, n_cols, n_var, k):
+    ''' Variable names from the heading lines above the table. The first
+        line with a name per column gives the (upper) node names, aligned
+        with the (lower) node names of the line below it, if any. '''
+    for n, line in enumerate(heading):
+        top = line.decode('ascii', 'replace').rstrip()
+        spans = [m.span() for m in re.finditer(r'\S+', top)]
+        if len(spans) > n_var:
+            break
+    else:
+        return [str(n) for n in range(n_var)]
+    # Names are either repeated over the k columns of each variable or
+    # given once per variable
+    step = k if len(spans) > n_cols else 1
+    spans = spans[len(spans) - n_var*step:]
+    bottom = (heading[n + 1].decode('ascii', 'replace').rstrip()
+              if n + 1 < len(heading) else '')
+    names = []
+    prev_end = spans[0][0] - 1
+    for start, stop in spans:
+        to_node = bottom[prev_end:stop].strip()
+        names.append((top[start:stop], to_node) if to_node
+                     else top[start:stop])
+        prev_end = stop
+    return names[::step]
+
+
+def parse_FS_block(buf, pos=0, end=None, fs_output=None):
+    '''
+    Parse the first table of output variables found in buf[pos:end], as
+    printed by a FREQUENCY SCAN. Returns a FrequencyScan or None if there is
+    no table.
+
+    Each row of the table holds the frequency (after a step number in some
+    versions) and the magnitude and angle in degrees ('polar'), the real and
+    imaginary parts ('rect'), the magnitude only ('mag') or the magnitude,
+    angle, real and imaginary parts ('both') of each variable, as selected on
+    the FREQUENCY SCAN card. fs_output gives the layout; by default it is
+    inferred from the number of columns per variable, and two columns are
+    read as magnitude and angle, ATP's default, unless the table heading
+    labels them as real and imaginary parts. For 'mag' the values are real
+    magnitudes.
+
+    The fields are sliced at the columns of the first row and converted to
+    floats in bulk, as for the steady-state tables, so negative numbers that
+    fill their field and run into the previous one are read correctly.
+    Lines of rows wrapped onto several lines are told apart by their blank
+    frequency field.
+    '''
+    if end is None:
+        end = len(buf)
+    if fs_output is not None and fs_output not in FS_OUTPUTS:
+        raise ValueError('fs_output must be one of %s' %
+                         ', '.join(sorted(FS_OUTPUTS)))
+    start = find_line(buf, fs_heading, pos, end, indent=True)
+    if start < 0:
+        return None
+    n_var = int(_n_vars.search(buf, start, end).group(1))
+
+    # Class description and heading lines come before the first number
+    heading = []
+    line = next_line(buf, start, end)
+    while line < end:
+        m = _number_lines.match(buf, line, end)
+        if m is not None and m.end() > line:
+            break
+        nxt = next_line(buf, line, end)
+        text = bytes(buf[line:nxt])
+        if text.strip() and b'output variables' not in text:
+            heading.append(text.rstrip(b'\r\n'))
+        line = nxt
+    else:
+        return None
+    starts, ends = line_bounds(buf, line, m.end())
+    freq, slices = _FS_fields(bytes(buf[starts[0]:ends[0]]))
+    # Rows wrapped onto several lines continue below the value fields of
+    # their first line, with the leading fields left blank
+    lead = slice(0, freq.stop)
+    row = ~is_blank(fixed_width(buf, starts, ends, lead))
+    freq = to_float(fixed_width(buf, starts[row], ends[row], freq))
+    fields = np.zeros((len(starts), len(slices)))
+    filled = np.zeros((len(starts), len(slices)), dtype=bool)
+    for n, sl in enumerate(slices):
+        field = fixed_width(buf, starts, ends, sl)
+        filled[:, n] = ~is_blank(field)
+        fields[filled[:, n], n] = to_float(field[filled[:, n]])
+    n_cols = np.count_nonzero(filled) // len(freq)
+    if n_cols*len(freq) != np.count_nonzero(filled):
+        raise ValueError('Frequency scan table has rows of unequal length')
+    fs_output = _FS_layout(n_cols, n_var, fs_output, heading)
+    k = FS_OUTPUTS[fs_output]
+    cols = fields[filled].reshape(len(freq), n_var, k)
+    if fs_output == 'mag':
+        values = cols[:, :, 0].astype(np.complex128)
+    elif fs_output == 'rect':
+        values = to_complex(cols[:, :, 0], cols[:, :, 1])
+    else:
+        values = cols[:, :, 0] * np.exp(1j*np.radians(cols[:, :, 1]))
+    names = _FS_names(heading, n_cols, n_var, k)
+    return FrequencyScan(freq, values, names, m.end())
+
+
+def iter_FS_results(LIS_file, fs_output=None):
+    ''' Generator of (case_number, FrequencyScan) for every data case of
+        LIS_file with a frequency scan, as for iter_SS_arrays. '''
+    with map_file(LIS_file) as buf:
+        for case, start, end in iter_cases(buf):
+            scan = parse_FS_block(buf, start, end, fs_output)
+            if scan is not None:
+                yield case, scan
+
+
+def read_FS_results(LIS_file, fs_output=None):
+    ''' Memory-map LIS_file and return the first FrequencyScan, or None if
+        there is none. '''
+    with map_file(LIS_file) as buf:
+        return parse_FS_block(buf, fs_output=fs_output)
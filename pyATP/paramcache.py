@@ -0,0 +1,215 @@
+'''
+Cache of line parameters read from PCH files.
+
+get_line_params_from_pch reads, parses and combines the PCH files of the
+segments of a line every time it is called, although the same segments are
+often shared by several lines and runs. LineParamsCache keeps the Z, Y and
+ABCD matrices of each PCH file and the summaries of each list of segments in
+memory and, optionally, in NPZ files in a directory, keyed by a SHA-256 hash
+of the contents of the PCH files. To use a cache in get_line_params_from_pch:
+
+    pyATP.set_line_params_cache(pyATP.LineParamsCache('C:/ATP/pch_cache'))
+
+A file is only read again when its size or modification time change, and
+even then it is only parsed again if its contents changed. PCH files that
+are not cached are read concurrently by a thread pool.
+'''
+
+from __future__ import print_function, unicode_literals
+
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import os
+import tempfile
+import threading
+
+import numpy as np
+
+from . import compression
+from . import pyATP as _atp
+
+__all__ = ['LineParamsCache']
+
+# Incremented whenever the layout of cache entries or the key changes, so that
+# old entries are not used.
+LINE_PARAMS_CACHE_VERSION = 1
+
+_PARAMS_ARRAYS = ('RLC', 'Z', 'Y', 'ABCD')
+
+
+class LineParamsCache(object):
+    '''
+    Cache of the LineConstPCHCards of PCH files and of the summaries of
+    get_line_params_from_pch, in memory and in the directory cache_dir
+    (created if needed) unless it is None. workers is the number of threads
+    reading PCH files, one per CPU by default. Statistics of the cache use
+    in this process are kept in the stats dict: hits (in memory), loads
+    (from cache_dir), misses (parsed) and the same for summaries.
+
+    Cached LineConstPCHCards only hold the RLC, Z, Y and ABCD arrays, as
+    those of the numpy engine of parse_line_params_pch, and are shared by
+    all users of the cache, so they should not be modified.
+    '''
+    def __init__(self, cache_dir=None, workers=None):
+        self.cache_dir = cache_dir
+        if cache_dir is not None and not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        self.workers = workers or os.cpu_count() or 1
+        self.stats = {'hits': 0, 'loads': 0, 'misses': 0,
+                      'summary_hits': 0, 'summary_loads': 0,
+                      'summary_misses': 0}
+        self._lock = threading.Lock()
+        # {path: (size, mtime, key)} of the files read
+        self._keys = {}
+        # {key: LineConstPCHCards}
+        self._params = {}
+        # {summary key: summary dict}
+        self._summaries = {}
+
+    def _count(self, stat):
+        with self._lock:
+            self.stats[stat] += 1
+
+    def _entry(self, key, kind):
+        return os.path.join(self.cache_dir, key[:2], '%s_%s.npz' % (kind, key))
+
+    def _load(self, key, kind):
+        ''' Dict of the arrays stored under key, or None. '''
+        if self.cache_dir is None:
+            return None
+        try:
+            with np.load(self._entry(key, kind)) as data:
+                return dict((k, data[k]) for k in data.files)
+        except (IOError, OSError, ValueError, KeyError):
+            return None
+
+    def _save(self, key, kind, arrays):
+        if self.cache_dir is None:
+            return
+        entry = self._entry(key, kind)
+        parent = os.path.dirname(entry)
+        if not os.path.isdir(parent):
+            try:
+                os.makedirs(parent)
+            except OSError:
+                # Made by another thread or process in the meantime
+                pass
+        # Entries are written to a temporary file and renamed, so a
+        # concurrent reader never sees half of one.
+        fd, tmp = tempfile.mkstemp(prefix='tmp_', suffix='.npz', dir=parent)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, **arrays)
+            os.rename(tmp, entry)
+        except OSError:
+            # On Windows, the entry was stored by someone else meanwhile
+            os.remove(tmp)
+
+    def lookup(self, PCH_file):
+        '''
+        Returns (key, LineConstPCHCards) of PCH_file, where key is the hex
+        SHA-256 hash of its (decompressed) contents. A compressed PCH file,
+        e.g. <PCH_file>.gz, is used if there is no PCH_file.
+        '''
+        path = os.path.abspath(compression.find_file(PCH_file))
+        st = os.stat(path)
+        with self._lock:
+            known = self._keys.get(path)
+        if known is not None and known[:2] == (st.st_size, st.st_mtime):
+            key = known[2]
+            with self._lock:
+                params = self._params.get(key)
+            if params is not None:
+                self._count('hits')
+                return key, params
+
+        with compression.open_file(path, 'r') as f:
+            text = f.read()
+        h = hashlib.sha256(('pyATP line params %d\0' %
+                            LINE_PARAMS_CACHE_VERSION).encode('utf-8'))
+        h.update(text.encode('utf-8'))
+        key = h.hexdigest()
+        with self._lock:
+            self._keys[path] = (st.st_size, st.st_mtime, key)
+            params = self._params.get(key)
+        if params is not None:
+            self._count('hits')
+            return key, params
+
+        arrays = self._load(key, 'params')
+        if arrays is not None:
+            params = _atp.LineConstPCHCards()
+            for k in _PARAMS_ARRAYS:
+                setattr(params, k, arrays[k])
+            self._count('loads')
+        else:
+            params = _atp.parse_line_params_pch(text)
+            self._save(key, 'params', dict((k, getattr(params, k))
+                                           for k in _PARAMS_ARRAYS))
+            self._count('misses')
+        with self._lock:
+            params = self._params.setdefault(key, params)
+        return key, params
+
+    def params(self, PCH_file):
+        ''' The LineConstPCHCards of PCH_file, as read_line_params_pch
+            returns. '''
+        return self.lookup(PCH_file)[1]
+
+    def get_line_params(self, atp_pch_folder, seg_list):
+        '''
+        Returns (seg_data_dict, summary_data_dict) as
+        get_line_params_from_pch does. The PCH files of the segments are
+        read concurrently, and the summary is cached by the keys of the
+        segments, in order.
+        '''
+        files = [os.path.join(atp_pch_folder, seg + '.pch')
+                 for seg in seg_list]
+        if len(files) > 1 and self.workers > 1:
+            with ThreadPoolExecutor(min(self.workers, len(files))) as pool:
+                found = list(pool.map(self.lookup, files))
+        else:
+            found = [self.lookup(f) for f in files]
+        seg_data_dict = dict(zip(seg_list, [p for _, p in found]))
+
+        h = hashlib.sha256(('pyATP line params summary %d\0' %
+                            LINE_PARAMS_CACHE_VERSION).encode('utf-8'))
+        for key, _ in found:
+            h.update(('%s\0' % key).encode('ascii'))
+        key = h.hexdigest()
+        with self._lock:
+            summary = self._summaries.get(key)
+        if summary is not None:
+            self._count('summary_hits')
+        else:
+            summary = self._load(key, 'summary')
+            if summary is not None:
+                self._count('summary_loads')
+            else:
+                summary = _atp.summarize_line_params(seg_data_dict)
+                self._save(key, 'summary', summary)
+                self._count('summary_misses')
+            with self._lock:
+                summary = self._summaries.setdefault(key, summary)
+        return seg_data_dict, dict(summary)
+
+    def clear(self, memory_only=False):
+        ''' Forgets the cached parameters and, unless memory_only is True,
+            removes the NPZ files of cache_dir. '''
+        with self._lock:
+            self._keys.clear()
+            self._params.clear()
+            self._summaries.clear()
+        if memory_only or self.cache_dir is None:
+            return
+        for d in os.listdir(self.cache_dir):
+            d = os.path.join(self.cache_dir, d)
+            if not os.path.isdir(d):
+                continue
+            for name in os.listdir(d):
+                if name.endswith('.npz'):
+                    try:
+                        os.remove(os.path.join(d, name))
+                    except OSError:
+                        # Removed by another thread or process
+                        pass
@@ -0,0 +1,108 @@
+'''
+Vectorized parsing of the R, L, C matrices punched by LINE CONSTANTS cases.
+
+With $VINTAGE, 1 ATP punches the lower triangle of the matrices row by row,
+one (I2, 4A6, 3E16.0) card per element. read_RLC gathers the three real
+columns of all these cards at once with the fixed-width helpers of the lis
+module and converts them in bulk, and ZY_from_RLC scatters them into the
+symmetric Z and Y matrices. Cards in other layouts raise ValueError, so that
+callers can fall back to the LineConstPCHCards card stack.
+'''
+
+from __future__ import print_function, unicode_literals
+
+from math import sqrt
+
+import numpy as np
+
+from . import lis
+
+__all__ = ['read_RLC', 'ZY_from_RLC', 'RLC_from_ZY']
+
+# Slices of the columns of an RLC card
+PH_COLS = slice(0, 2)
+NAME_COLS = slice(0, 26)
+RLC_COLS = [slice(26, 42), slice(42, 58), slice(58, 74)]
+CARD_COLS = slice(0, 74)
+
+
+def _card_lines(buf):
+    ''' Returns the start and end offsets of the RLC cards of the first case
+        in buf: the cards after the $VINTAGE, 1 card, up to the next card
+        starting with $. Raises ValueError if there is no $VINTAGE, 1
+        card. '''
+    pos = lis.find_line(buf, b'$VINTAGE')
+    if pos < 0:
+        raise ValueError('No $VINTAGE card')
+    line_end = lis.next_line(buf, pos)
+    flag = buf[pos:line_end].split(b',')[1:2]
+    if [f.strip() for f in flag] != [b'1']:
+        raise ValueError('Not a $VINTAGE, 1 punch file')
+    pos = line_end
+    if buf[pos:pos + 6].upper() == b'$UNITS':
+        pos = lis.next_line(buf, pos)
+    end = lis.find_line(buf, b'$', pos)
+    if end < 0:
+        end = len(buf)
+    return lis.line_bounds(buf, pos, end)
+
+
+def read_RLC(text):
+    '''
+    Returns the (n, 3) float64 array of the R, L and C values of the n cards
+    punched by a LINE CONSTANTS case of n_ph phases, n = n_ph*(n_ph + 1)/2,
+    in the order of the lower triangle of the matrices read by rows. text is
+    the text (or bytes) of the PCH file of the case. Raises ValueError if
+    the cards are not in the layout punched with $VINTAGE, 1.
+    '''
+    buf = text.encode('iso-8859-1') if not isinstance(text, bytes) else text
+    starts, ends = _card_lines(buf)
+    cards = lis.fixed_width(buf, starts, ends, CARD_COLS)
+    cards = cards[~lis.is_blank(cards)]
+    n = len(cards)
+    n_ph = int(round((sqrt(1 + 8*n) - 1) / 2))
+    if n == 0 or n_ph*(n_ph + 1) // 2 != n:
+        raise ValueError('%d RLC cards do not make a triangular matrix' % n)
+
+    # Rows of the matrices start with a card holding the phase number and
+    # the bus names; the other cards of a row are blank there.
+    row_starts = np.cumsum(np.arange(n_ph))
+    named = ~lis.is_blank(cards[:, NAME_COLS])
+    if not np.array_equal(np.flatnonzero(named), row_starts) or \
+            not np.array_equal(lis.to_float(cards[row_starts, PH_COLS]),
+                               np.arange(1, n_ph + 1)):
+        raise ValueError('RLC cards out of order')
+
+    RLC = np.empty((n, 3), dtype=np.float64)
+    for k, sl in enumerate(RLC_COLS):
+        # Blank fields and D exponents make the conversion raise ValueError
+        RLC[:, k] = lis.to_float(cards[:, sl])
+    return RLC
+
+
+def ZY_from_RLC(RLC):
+    '''
+    Returns the symmetric (n_ph, n_ph) complex series impedance matrix
+    Z = R + jL and shunt admittance matrix Y = jC*1e-6 from the (n, 3)
+    array of read_RLC. L is in Ohms and C in microSiemens, as punched at
+    the nominal frequency.
+    '''
+    RLC = np.asarray(RLC, dtype=np.float64)
+    n_ph = int(round((sqrt(1 + 8*len(RLC)) - 1) / 2))
+    r, c = np.tril_indices(n_ph)
+    Z = np.zeros((n_ph, n_ph), dtype=np.complex128)
+    Y = np.zeros((n_ph, n_ph), dtype=np.complex128)
+    Z[r, c] = Z[c, r] = RLC[:, 0] + 1j*RLC[:, 1]
+    Y[r, c] = Y[c, r] = 1e-6j*RLC[:, 2]
+    return Z, Y
+
+
+def RLC_from_ZY(Z, Y):
+    '''
+    Returns the (n, 3) array of R, L and C values of the symmetric
+    (n_ph, n_ph) matrices Z and Y in the order punched by ATP, the inverse
+    of ZY_from_RLC.
+    '''
+    r, c = np.tril_indices(len(Z))
+    Z = np.asarray(Z)[r, c]
+    return np.column_stack([Z.real, Z.imag, np.asarray(Y)[r, c].imag*1e6])
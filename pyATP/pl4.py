@@ -0,0 +1,254 @@
+'''
+Reader for the binary PL4 transient output files written by ATP.
+
+The file is memory-mapped and each output variable is exposed as a NumPy view
+of its column, so nothing is read until the values are used. The layout is
+the one used by ATPDraw's default binary PL4 output:
+
+    bytes 0-79      header; float32 time step at byte 40, int32 twice the
+                    number of variables at byte 48 and int32 file size + 1 at
+                    byte 56
+    80 + 16*k       one 16-byte record per variable: int32 variable type,
+                    6 bytes from node, 6 bytes to node
+    (5 + nvar)*16   float32 rows of [time, var1, var2, ...], one per step
+
+The header is only read when it is first needed, and the variable table is
+only decoded when a variable is looked up by name. Compressed PL4 files (see
+the compression module) cannot be memory-mapped; they are decompressed into
+memory when first used.
+'''
+
+from __future__ import print_function, unicode_literals
+
+from collections import namedtuple
+import os
+import struct
+
+import numpy as np
+
+from . import compression
+
+__all__ = ['PL4File', 'PL4Variable', 'write_PL4', 'PL4_TYPES']
+
+# Variable type codes found in the variable records
+PL4_TYPES = {4: 'V-node', 7: 'E-bran', 8: 'V-bran', 9: 'I-bran'}
+# Short type names accepted by PL4File.find
+_TYPE_CODES = {'V': 4, 'V-node': 4, 'E-bran': 7, 'V-bran': 8,
+               'I': 9, 'I-bran': 9}
+
+HEADER_SIZE = 5*16
+VAR_RECORD = np.dtype([('type', '<i4'), ('from_node', 'S6'),
+                       ('to_node', 'S6')])
+
+PL4Variable = namedtuple('PL4Variable', ['type', 'from_node', 'to_node'])
+
+
+class PL4File(object):
+    '''
+    Memory-mapped PL4 file. Variables can be selected by column number or by
+    name:
+
+        pl4['BUSA']            node voltage of BUSA
+        pl4['BUSA', 'BUSB']    branch current from BUSA to BUSB
+        pl4['V', 'BUSA', 'BUSB']
+                               variable of type 'V' (node voltage), 'I'
+                               (branch current) or a PL4_TYPES name
+
+    Each returns a 1-D float32 view of the memory map, so selecting a few
+    variables out of thousands does not copy anything. Rows are stored
+    interleaved, so reading one column touches every page when a row is
+    shorter than a page (4 kB, about 1000 variables); with more variables,
+    only the pages holding the selected columns are read.
+    '''
+    def __init__(self, filename):
+        self.filename = filename
+        self._header = None
+        self._variables = None
+        self._index = None
+        self._data = None
+        self._contents = None
+
+    def _decompressed(self):
+        ''' Contents of a compressed file, or None if it is not
+            compressed. '''
+        if self._contents is None:
+            if compression.file_compression(self.filename) is None:
+                self._contents = False
+            else:
+                with compression.open_file(self.filename) as f:
+                    self._contents = f.read()
+        return self._contents or None
+
+    def _read_header(self):
+        contents = self._decompressed()
+        if contents is None:
+            with open(self.filename, 'rb') as f:
+                head = f.read(HEADER_SIZE)
+            file_size = os.path.getsize(self.filename)
+        else:
+            head = contents[:HEADER_SIZE]
+            file_size = len(contents)
+        if len(head) < HEADER_SIZE:
+            raise ValueError('%s is not a PL4 file' % self.filename)
+        deltat, = struct.unpack('<f', head[40:44])
+        nvar = struct.unpack('<i', head[48:52])[0] // 2
+        pl4size = struct.unpack('<I', head[56:60])[0] - 1
+        data_offset = (5 + nvar)*16
+        row_bytes = (nvar + 1)*4
+        steps = (file_size - data_offset) // row_bytes
+        # Some files have null bytes between the variable table and the
+        # data. The size stored in the header is then larger than the size
+        # of the table and the data. The stored size is 32 bits, so it is
+        # only compared modulo 2**32 for very large files.
+        extra = file_size - data_offset - steps*row_bytes
+        if extra and pl4size == file_size % 2**32:
+            data_offset += extra
+        self._header = {'deltat': deltat, 'nvar': nvar, 'steps': steps,
+                        'data_offset': data_offset}
+
+    @property
+    def header(self):
+        ''' Dict of deltat, nvar, steps and data_offset. '''
+        if self._header is None:
+            self._read_header()
+        return self._header
+
+    @property
+    def deltat(self):
+        return self.header['deltat']
+
+    @property
+    def nvar(self):
+        return self.header['nvar']
+
+    @property
+    def steps(self):
+        return self.header['steps']
+
+    @property
+    def data(self):
+        ''' (steps, nvar + 1) float32 memory map of the time column followed
+            by all variables. '''
+        if self._data is None:
+            h = self.header
+            shape = (h['steps'], h['nvar'] + 1)
+            contents = self._decompressed()
+            if contents is None:
+                self._data = np.memmap(self.filename, dtype='<f4', mode='r',
+                                       offset=h['data_offset'], shape=shape)
+            else:
+                self._data = np.frombuffer(
+                    contents, dtype='<f4', count=shape[0]*shape[1],
+                    offset=h['data_offset']).reshape(shape)
+        return self._data
+
+    @property
+    def time(self):
+        return self.data[:, 0]
+
+    @property
+    def variables(self):
+        ''' List of PL4Variable(type, from_node, to_node), one per column. '''
+        if self._variables is None:
+            contents = self._decompressed()
+            if contents is None:
+                table = np.memmap(self.filename, dtype=VAR_RECORD, mode='r',
+                                  offset=HEADER_SIZE, shape=(self.nvar,))
+            else:
+                table = np.frombuffer(contents, dtype=VAR_RECORD,
+                                      count=self.nvar, offset=HEADER_SIZE)
+            types = table['type'].tolist()
+            from_node = np.char.strip(table['from_node']).astype('U')
+            to_node = np.char.strip(table['to_node']).astype('U')
+            self._variables = [
+                PL4Variable(t, fr, to)
+                for t, fr, to in zip(types, from_node.tolist(),
+                                     to_node.tolist())]
+            del table
+        return self._variables
+
+    def find(self, type=None, from_node=None, to_node=None):
+        ''' Returns the column numbers (0-based, not counting time) of the
+            variables matching all the given criteria. '''
+        if isinstance(type, str) and type in _TYPE_CODES:
+            type = _TYPE_CODES[type]
+        return [k for k, v in enumerate(self.variables)
+                if (type is None or v.type == type)
+                and (from_node is None or v.from_node == from_node)
+                and (to_node is None or v.to_node == to_node)]
+
+    def index(self, key):
+        ''' Column number of the variable selected by key, as described in
+            the class docstring. Raises KeyError if it is not found. '''
+        if isinstance(key, (int, np.integer)):
+            if not -self.nvar <= key < self.nvar:
+                raise IndexError(key)
+            return int(key) % self.nvar
+        if self._index is None:
+            self._index = {}
+            for k, v in enumerate(self.variables):
+                # The first of repeated variables is kept
+                self._index.setdefault((v.type, v.from_node, v.to_node), k)
+                if v.type == 4:
+                    self._index.setdefault(v.from_node, k)
+                elif v.type == 9:
+                    self._index.setdefault((v.from_node, v.to_node), k)
+        if isinstance(key, tuple) and len(key) == 3:
+            key = (_TYPE_CODES.get(key[0], key[0]), key[1], key[2])
+        try:
+            return self._index[key]
+        except (KeyError, TypeError):
+            raise KeyError(key)
+
+    def __getitem__(self, key):
+        return self.data[:, self.index(key) + 1]
+
+    def __len__(self):
+        return self.nvar
+
+    def select(self, keys):
+        ''' List of views of the variables selected by keys. '''
+        return [self[k] for k in keys]
+
+    def close(self):
+        ''' Drop the memory map, or the decompressed contents. Views already
+            handed out stay valid. '''
+        self._data = None
+        self._contents = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def write_PL4(filename, time, variables, data):
+    '''
+    Write a PL4 file in the layout read by PL4File. time is a vector of the
+    time steps, variables a list of (type, from_node, to_node), with type a
+    PL4_TYPES code or a name accepted by PL4File.find, and data a
+    (steps, nvar) array of the variable values. Mostly useful for tests and
+    for converting results from other sources.
+    '''
+    time = np.asarray(time, dtype='<f4')
+    data = np.asarray(data, dtype='<f4').reshape(len(time), len(variables))
+    nvar = len(variables)
+    table = np.zeros(nvar, dtype=VAR_RECORD)
+    for k, (t, fr, to) in enumerate(variables):
+        # Names are padded with blanks, as by ATP
+        table[k] = (_TYPE_CODES.get(t, t), fr.ljust(6).encode('ascii'),
+                    to.ljust(6).encode('ascii'))
+    rows = np.empty((len(time), nvar + 1), dtype='<f4')
+    rows[:, 0] = time
+    rows[:, 1:] = data
+    size = HEADER_SIZE + table.nbytes + rows.nbytes
+    deltat = time[1] - time[0] if len(time) > 1 else 0.
+    header = bytearray(HEADER_SIZE)
+    header[40:44] = struct.pack('<f', deltat)
+    header[48:52] = struct.pack('<i', 2*nvar)
+    header[56:60] = struct.pack('<I', (size + 1) % 2**32)
+    with open(filename, 'wb') as f:
+        f.write(bytes(header))
+        f.write(table.tobytes())
+        f.write(rows.tobytes())
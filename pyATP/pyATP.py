@@ -1,7 +1,8 @@
 #! /usr/bin/python
 '''
 Module of utility functions to drive ATP from Python and extract results
-At this time, only steady-state result extraction is supported.
+Steady-state results are extracted from the LIS file. Transient results can be
+read from binary PL4 files with PL4File (see the pl4 module).
 '''
 
 from __future__ import print_function, unicode_literals
@@ -25,20 +26,79 @@ cdtype = np.dtype('complex'+str(2*nbits))
 # It is currently under development.
 import text_data_cards as tdc
 
-import itertools, copy, os
+import itertools, copy, os, threading
+from collections import OrderedDict
 
 import subprocess, re, csv, codecs, shutil
 
+from . import batch
+from . import compression
+from . import lineconst
+from . import lis
+from . import pch
+from . import ssdata
+
 ATP_path = 'C:\ATP\gigmingw'
 ATP_exe = 'runATP_G.bat'
 
 be_quiet = True
 
-def run_ATP(ATP_file, quiet=None):
+# Parser used by get_SS_results when no engine is specified. 'numpy' uses the
+# memory-mapped, vectorized parser in the lis module. 'python' uses the
+# original line-by-line parser.
+SS_engine = 'numpy'
+
+# Reader used by read_line_params_pch when no engine is specified. 'numpy'
+# reads the RLC cards directly into arrays with the pch module, and falls
+# back to the LineConstPCHCards card stack, 'python', for other layouts.
+PCH_engine = 'numpy'
+
+# RunCache used by run_ATP, see set_run_cache. None runs ATP every time.
+run_cache = None
+
+def set_run_cache(cache):
+    '''
+    Sets the runcache.RunCache used by run_ATP, or None to stop using one.
+    Returns the cache used before.
+    '''
+    global run_cache
+    previous, run_cache = run_cache, cache
+    return previous
+
+# paramcache.LineParamsCache used by get_line_params_from_pch, see
+# set_line_params_cache. None reads the PCH files every time.
+line_params_cache = None
+
+def set_line_params_cache(cache):
+    '''
+    Sets the paramcache.LineParamsCache used by get_line_params_from_pch, or
+    None to stop using one. Returns the cache used before.
+    '''
+    global line_params_cache
+    previous, line_params_cache = line_params_cache, cache
+    return previous
+
+def run_ATP(ATP_file, quiet=None, cwd=None, use_cache=True):
+    '''
+    Runs ATP on ATP_file and waits for it to finish. Output to the console is
+    suppressed if quiet is True (the module variable be_quiet by default).
+    cwd is the working directory of the ATP process, by default the current
+    one. Returns the return code of the ATP process.
+
+    If a run cache is set with set_run_cache, the outputs of a deck already
+    run are copied from it instead of running ATP, unless use_cache is False.
+    '''
+    if use_cache and run_cache is not None:
+        return run_cache.run(ATP_file, quiet=quiet, cwd=cwd)
     kwargs = {}
+    if cwd is not None:
+        kwargs['cwd'] = cwd
     if quiet is not None and quiet or quiet is None and be_quiet:
-        kwargs['stdout'] = open(os.devnull, 'w')
-    rtn = subprocess.call((os.path.join(ATP_path, ATP_exe), ATP_file), **kwargs)
+        with open(os.devnull, 'w') as devnull:
+            return subprocess.call((os.path.join(ATP_path, ATP_exe),
+                                    ATP_file), stdout=devnull, **kwargs)
+    return subprocess.call((os.path.join(ATP_path, ATP_exe), ATP_file),
+                           **kwargs)
     
 def atp_basename(ATP_file):
     '''
@@ -51,9 +111,10 @@ def lis_filename(ATP_file):
     '''
     Returns the LIS filename corresponding to the ATP filename provided.
     This does not verify that the LIS file exists or that it is in the expected
-    format.
+    format. If there is no LIS file but there is a compressed copy of it (see
+    compression.SUFFIXES), the name of the compressed copy is returned.
     '''
-    return atp_basename(ATP_file) + '.lis'
+    return compression.find_file(atp_basename(ATP_file) + '.lis')
     
 def replace_text(ATP_file, old_text, new_text, outfile=None, n=None):
     '''
@@ -69,8 +130,7 @@ def replace_text(ATP_file, old_text, new_text, outfile=None, n=None):
     
     If the old text is not found, ValueError is raised and the file is not written.
     '''
-    new_text_fixed = ' '*max(0, len(old_text)-len(new_text)) + \
-                    new_text[:len(old_text)]
+    new_text_fixed = fixed_width(old_text, new_text)
     
     i = 0
     with codecs.open(ATP_file, 'r', encoding='iso-8859-1', errors='replace') as f:
@@ -90,10 +150,118 @@ def replace_text(ATP_file, old_text, new_text, outfile=None, n=None):
             encoding='iso-8859-1', errors='replace') as f:
         f.write(''.join(infile))
     
+def fixed_width(old_text, new_text):
+    '''
+    Returns new_text fitted to the width of old_text as replace_text does:
+    left padded with spaces if shorter, truncated on the right if longer.
+    '''
+    return ' '*max(0, len(old_text)-len(new_text)) + new_text[:len(old_text)]
+
+def format_value(value, width):
+    '''
+    Text of value for a deck field width characters wide. Strings are used
+    as they are. Numbers are written with as many significant digits as fit
+    and always with a decimal point or exponent, as ATP reads real fields.
+    Raises ValueError if the number does not fit.
+    '''
+    if isinstance(value, (str, type(''), np.str_)):
+        return value
+    for digits in range(width, 0, -1):
+        text = '%.*G' % (digits, value)
+        if '.' not in text and 'E' not in text:
+            text += '.'
+        if len(text) <= width:
+            return text
+    raise ValueError('%r does not fit in %d characters' % (value, width))
+
+
+class ATPDeckTemplate(object):
+    '''
+    An ATP deck read once, with placeholder keys replaced in memory to make
+    new decks. Every occurrence of a key is found when the key is first used,
+    and render and write only join the unchanged text around the
+    occurrences with the new values, fitted to the width of the key as by
+    replace_text:
+
+        template = ATPDeckTemplate('model.atp')
+        template.write('case.atp', {'IAMP': '500.', 'TCLOSE': ['-1', '1']})
+
+    The deck is read from ATP_file, or given as the text deck.
+    '''
+    def __init__(self, ATP_file=None, deck=None):
+        if deck is None:
+            with codecs.open(ATP_file, 'r', encoding='iso-8859-1',
+                             errors='replace') as f:
+                deck = f.read()
+        self.ATP_file = ATP_file
+        self.deck = deck
+        self._positions = {}
+
+    def positions(self, key):
+        ''' Returns the list of offsets in the deck of the occurrences of key.
+            Raises ValueError if there are none. '''
+        try:
+            return self._positions[key]
+        except KeyError:
+            pass
+        pos = []
+        k = self.deck.find(key)
+        while k >= 0:
+            pos.append(k)
+            k = self.deck.find(key, k + len(key))
+        if not pos:
+            raise ValueError('Text to replace not found: %s' % key)
+        self._positions[key] = pos
+        return pos
+
+    def count(self, key):
+        ''' Number of occurrences of key in the deck. '''
+        try:
+            return len(self.positions(key))
+        except ValueError:
+            return 0
+
+    def render(self, values):
+        '''
+        Returns the text of the deck with keys replaced by values, a dict of
+        {key: new text}. The new text replaces every occurrence of the key,
+        unless it is a list or tuple of texts for each occurrence in order,
+        where None leaves that occurrence unchanged.
+        '''
+        edits = []
+        for key, new in values.items():
+            pos = self.positions(key)
+            if isinstance(new, (list, tuple)):
+                if len(new) != len(pos):
+                    raise ValueError('%d values given for %d occurrences of '
+                                     '%s' % (len(new), len(pos), key))
+            else:
+                new = [new] * len(pos)
+            edits.extend((p, len(key), fixed_width(key, v))
+                         for p, v in zip(pos, new) if v is not None)
+        edits.sort()
+        pieces = []
+        last = 0
+        for p, width, text in edits:
+            if p < last:
+                raise ValueError('Keys overlap at offset %d of the deck' % p)
+            pieces.append(self.deck[last:p])
+            pieces.append(text)
+            last = p + width
+        pieces.append(self.deck[last:])
+        return ''.join(pieces)
+
+    def write(self, outfile, values):
+        ''' Writes the deck rendered with values to outfile. '''
+        with codecs.open(outfile, 'w', encoding='iso-8859-1',
+                         errors='replace') as f:
+            f.write(self.render(values))
+        return outfile
+
 def node_ph(node_name, ph):
         return node_name + (ph if node_name != "TERRA" else "")
         
-def get_SS_results(LIS_file, RMS_scale=False):
+def get_SS_results(LIS_file, RMS_scale=False, engine=None):
     '''
     Extract steady-state results from LIS file. Results are returned as a 
     tuple in the following structure:
@@ -108,19 +276,34 @@ def get_SS_results(LIS_file, RMS_scale=False):
     { (<From Node>, <To Node>): <Branch Current> }
     Where <From Node> and <To Node> are strings of the node name and
     <Branch Current> is a complex number representing the phasor branch current.
+
+    With the numpy engine, both are read-only dict-compatible views of a
+    compact lis.SteadyStateArrays instead of dicts.
     
     By default the phasor values returned are NOT scaled from the ATP output to
     convert from peak values to RMS values. They can be scaled down by a factor
     of sqrt(2) by passing RMS_scale as True.
+
+    engine selects the parser, 'numpy' or 'python'. The default is set by the
+    module variable SS_engine. Both return the same results.
+
+    LIS_file may be compressed with gzip, bzip2, xz or zstd. It is then
+    decompressed as it is read.
     
     TODO: Detect if ATP throws an error and raise an exception
     '''
     s = 1./sqrt(2) if RMS_scale else 1.0 # set scaling factor
+
+    engine = engine or SS_engine
+    if engine == 'numpy':
+        return lis.read_SS_results(LIS_file, s)
+    elif engine != 'python':
+        raise ValueError('Unknown steady-state parser engine %r' % engine)
     
     node_voltages = {}
     branch_currents = {}
     
-    with open(LIS_file, 'r') as f:
+    with compression.open_file(LIS_file, 'r') as f:
         iter_input = f # No pre-processing needed, but it could be done here
         
         ss_res_start = re.compile('^Sinusoidal steady-state phasor solution, branch by branch')
@@ -215,56 +398,259 @@ def get_SS_results(LIS_file, RMS_scale=False):
         return node_voltages, branch_currents
 
 
+class SteadyStateResult(object):
+    '''
+    Steady-state phasor solution of one LIS file. The LIS file is parsed once
+    and the node voltages and branch currents are then used to compute bus
+    sequence quantities and branch power flows as often as needed.
+
+    node_voltages and branch_currents have the same structure as the tuple
+    returned by get_SS_results. They are shared with the cache used by
+    from_lis, so they should be treated as read-only. When the numpy parser
+    engine is used they are views of a lis.SteadyStateArrays, available as
+    the arrays attribute, and the calculations below are vectorized.
+    '''
+    # Parsed results keyed by absolute LIS filename, least recently used
+    # first. Each entry holds the (mtime, size) stamp of the file when it was
+    # parsed and a dict of results keyed by RMS_scale. At most cache_size
+    # files are kept, see set_cache_size.
+    _cache = OrderedDict()
+    _cache_lock = threading.Lock()
+    cache_size = 8
+
+    def __init__(self, node_voltages, branch_currents, LIS_file=None):
+        self.node_voltages = node_voltages
+        self.branch_currents = branch_currents
+        self.LIS_file = LIS_file
+        self.arrays = getattr(node_voltages, 'arrays', None)
+
+    @classmethod
+    def from_lis(cls, LIS_file, RMS_scale=False):
+        '''
+        Returns the SteadyStateResult for LIS_file. Results are memoized by
+        path, modification time and size, so asking for the same unchanged
+        file again does not re-read it. The RMS-scaled result is derived
+        from the cached peak-value result without parsing the file again.
+        Only the results of the cache_size most recently used files are
+        kept. This may be called from several threads.
+        '''
+        key = os.path.abspath(LIS_file)
+        st = os.stat(LIS_file)
+        stamp = (getattr(st, 'st_mtime_ns', st.st_mtime), st.st_size)
+        with cls._cache_lock:
+            stamp_cached, results = cls._cache.get(key, (None, None))
+            if stamp_cached == stamp:
+                cls._cache.move_to_end(key)
+        if stamp_cached != stamp:
+            # Parsed without holding the lock; a concurrent parse of the
+            # same file just stores the same results.
+            results = {False: cls(*get_SS_results(LIS_file),
+                                  LIS_file=LIS_file)}
+            with cls._cache_lock:
+                cls._cache[key] = (stamp, results)
+                cls._cache.move_to_end(key)
+                cls._evict()
+        with cls._cache_lock:
+            if RMS_scale not in results:
+                results[RMS_scale] = results[False].scaled(1./sqrt(2))
+            return results[RMS_scale]
+
+    @classmethod
+    def _evict(cls):
+        ''' Drops the results of files that no longer exist, then the least
+            recently used ones beyond cache_size. Called with the lock
+            held. '''
+        for key in [k for k in cls._cache if not os.path.exists(k)]:
+            del cls._cache[key]
+        while len(cls._cache) > max(cls.cache_size, 0):
+            cls._cache.popitem(last=False)
+
+    @classmethod
+    def set_cache_size(cls, cache_size):
+        ''' Sets the number of LIS files whose results from_lis keeps, 0 to
+            keep none, and returns the previous one. '''
+        with cls._cache_lock:
+            previous, cls.cache_size = cls.cache_size, cache_size
+            cls._evict()
+        return previous
+
+    @classmethod
+    def from_arrays(cls, arrays, LIS_file=None):
+        ''' Returns a SteadyStateResult for a lis.SteadyStateArrays. '''
+        return cls(arrays.node_voltages, arrays.branch_currents,
+                   LIS_file=LIS_file)
+
+    @classmethod
+    def clear_cache(cls):
+        ''' Forget all memoized LIS file results. '''
+        with cls._cache_lock:
+            cls._cache.clear()
+
+    def scaled(self, s):
+        ''' Returns a new SteadyStateResult with all phasors multiplied
+            by s. '''
+        if self.arrays is not None:
+            arrays = self.arrays.scaled(s)
+            return self.__class__(arrays.node_voltages,
+                                  arrays.branch_currents,
+                                  LIS_file=self.LIS_file)
+        return self.__class__(
+            {k: v*s for k, v in self.node_voltages.items()},
+            {k: v*s for k, v in self.branch_currents.items()},
+            LIS_file=self.LIS_file)
+
+    def _node_voltage_array(self, names):
+        if self.arrays is not None:
+            return self.arrays.node_voltage_array(names)
+        return np.array([self.node_voltages[n] for n in names])
+
+    def _branch_current_array(self, pairs):
+        if self.arrays is not None:
+            return self.arrays.branch_current_array(pairs)
+        return np.array([self.branch_currents[p] for p in pairs])
+
+    def process_bus_voltages(self, buses, phases=('A', 'B', 'C')):
+        ''' Creates vectors of voltage phasors at the specified buses.
+            Returns ph_voltages, seq_voltages, neg_seq_imbalance as tuple of
+            arrays in same order as buses.
+        '''
+        ph_voltages = self._node_voltage_array(
+            [b+p for b in buses for p in phases]).reshape(-1, len(phases)).T
+        seq_voltages = np.array(lineZ.ph_to_seq_v(ph_voltages))
+        neg_seq_imbalance = np.abs(seq_voltages[2]/seq_voltages[1])*100
+
+        return ph_voltages, seq_voltages, neg_seq_imbalance
+
+    def process_branch_currents(self, branches, phases=('A', 'B', 'C')):
+        ''' Creates vectors of branch current phasors on the specified
+            branches. Returns ph_br_currents, seq_br_currents, S_3ph as tuple
+            of arrays in same order as the list of branches. S_3ph is the
+            three-phase complex power flow in MVA at the from bus.
+        '''
+        ph_br_currents = self._branch_current_array(
+            [(fr_b + p, to_b + p) for fr_b, to_b in branches
+             for p in phases]).reshape(-1, len(phases)).T
+        seq_br_currents = np.array(lineZ.ph_to_seq_v(ph_br_currents))
+        # Voltages for power calculation
+        ph_voltages = self._node_voltage_array(
+            [fr_b + p for fr_b, to_b in branches
+             for p in phases]).reshape(-1, len(phases)).T
+        S_3ph = np.sum(ph_voltages * np.conj(ph_br_currents), axis=0) / 1e6
+
+        return ph_br_currents, seq_br_currents, S_3ph
+
+
+def iter_SS_results(LIS_file, RMS_scale=False):
+    '''
+    Generator of (<Case Number>, <SteadyStateResult>) for each data case of a
+    LIS file with stacked BEGIN NEW DATA CASE cases. The file is read in a
+    single pass and results are produced as the generator is consumed, so a
+    LIS file with many cases does not need to be split or read again. Case
+    numbers count the data cases of the deck from 1; cases without a
+    steady-state solution are skipped.
+    '''
+    s = 1./sqrt(2) if RMS_scale else 1.0
+    for case, arrays in lis.iter_SS_arrays(LIS_file):
+        if RMS_scale:
+            arrays = arrays.scaled(s)
+        yield case, SteadyStateResult.from_arrays(arrays, LIS_file)
+
+
+def get_all_SS_results(LIS_file, RMS_scale=False, workers=None):
+    ''' Returns an OrderedDict of {<Case Number>: <SteadyStateResult>} for all
+        data cases of the LIS file. See iter_SS_results. If workers is given,
+        the cases are parsed in parallel by that many threads (0 for one per
+        CPU) using the sidecar index of the LIS file, see lis.build_index. '''
+    if workers is None:
+        return OrderedDict(iter_SS_results(LIS_file, RMS_scale))
+    rtn = OrderedDict()
+    for case, arrays in lis.read_all_SS_arrays(LIS_file, workers or None):
+        if RMS_scale:
+            arrays = arrays.scaled(1./sqrt(2))
+        rtn[case] = SteadyStateResult.from_arrays(arrays, LIS_file)
+    return rtn
+
+
+def get_FS_results(LIS_file, fs_output=None):
+    '''
+    Extract the results of a FREQUENCY SCAN from LIS file. Returns a
+    lis.FrequencyScan with the vector of frequencies freq, an
+    (n_freq, n_var) complex array values of the output variables and their
+    names, or None if there is no scan. fs_output describes the columns
+    printed for each variable, 'polar', 'rect', 'mag' or 'both'; by default
+    it is inferred from the table and its heading. See lis.parse_FS_block.
+    '''
+    return lis.read_FS_results(LIS_file, fs_output)
+
+
+def get_all_FS_results(LIS_file, fs_output=None):
+    ''' Returns an OrderedDict of {<Case Number>: <FrequencyScan>} for all
+        data cases of the LIS file. '''
+    return OrderedDict(lis.iter_FS_results(LIS_file, fs_output))
+
+
+def _as_SS_result(LIS_file, RMS_scale=False):
+    ''' Accept either a LIS filename, an already parsed SteadyStateResult or
+        a (node_voltages, branch_currents) tuple such as the one returned by
+        get_SS_results. Parsed results are taken to be peak values, and are
+        scaled to RMS values if RMS_scale is True, as when reading the LIS
+        file. '''
+    if isinstance(LIS_file, tuple):
+        LIS_file = SteadyStateResult(*LIS_file)
+    if isinstance(LIS_file, SteadyStateResult):
+        return LIS_file.scaled(1./sqrt(2)) if RMS_scale else LIS_file
+    return SteadyStateResult.from_lis(LIS_file, RMS_scale)
+
+
 def output_ss_file(LIS_file, SS_file=None, pickle_file=None,
                    buses=None, branches=None,
                    phases=('A','B', 'C'), RMS_scale=False):
     '''
     Extract steady-state phasor results from LIS file and output them to a _ss.csv
     file in comma-separated format.
+
+    The results are also saved to the binary file pickle_file (_ss.npz by
+    default) in the columnar NPZ format of ssdata.write_SS_npz, which can be
+    read back with SSResultFile. If pickle_file ends in .p, .pkl or .pickle, a
+    Python pickle of nested dicts is written instead, as in earlier versions.
     '''
-    data_list = {} # Data to save to pickle file
-    node_voltages, branch_currents = get_SS_results(LIS_file, RMS_scale)
-    data_list['node_voltages'] = node_voltages
-    data_list['branch_currents'] = branch_currents
+    ss = SteadyStateResult.from_lis(LIS_file, RMS_scale)
+    arrays = ssdata._SS_arrays(ss)
 
+    bus_results = branch_results = None
     if buses is not None:
-        ph_voltages, seq_voltages, neg_seq_imbalance = \
-                process_SS_bus_voltages(LIS_file, buses, phases, RMS_scale)
-        bus_data = {}
-        for n, bus in enumerate(buses):
-            bus_data[bus] = {}
-            bus_data[bus]['ph_voltages'] = ph_voltages[:, n]
-            bus_data[bus]['seq_voltages'] = seq_voltages[:, n]
-            bus_data[bus]['neg_seq_imbalance'] = neg_seq_imbalance[n]
-        data_list['bus_data'] = bus_data
-
+        bus_results = ss.process_bus_voltages(buses, phases)
     if branches is not None:
-        ph_br_currents, seq_br_currents, S_3ph = \
-            process_SS_branch_currents(LIS_file, branches, phases, RMS_scale)
-        branch_data = {}
-        for n, branch in enumerate(branches):
-            branch = tuple(branch) # convert to tuple for indexing
-            branch_data[branch] = {}
-            branch_data[branch]['ph_br_currents'] = ph_br_currents[:, n]
-            branch_data[branch]['seq_br_currents'] = seq_br_currents[:, n]
-            branch_data[branch]['S_3ph'] = S_3ph[n]
-        data_list['branch_data'] = branch_data
+        branch_results = ss.process_branch_currents(branches, phases)
 
-    # Reorganize data_list to be easier to key into bus or branch data
-    bus_data = {}
-    
+    LIS_base = re.match('(.*)\.lis$', compression.strip_suffix(LIS_file),
+                        flags=re.I).group(1)
     if SS_file is None:
-        SS_file = re.match('(.*)\.lis$',LIS_file, flags=re.I).group(1) + '_ss.csv'
+        SS_file = LIS_base + '_ss.csv'
 
     if pickle_file is None:
-        pickle_file = re.match('(.*)\.lis$',LIS_file, flags=re.I).group(1) + '_ss.p'
+        pickle_file = LIS_base + '_ss.npz'
 
-    with open(pickle_file, 'wb') as binfile:
-        pickle.dump(data_list, binfile)
+    if re.search(r'\.(p|pkl|pickle)$', pickle_file, flags=re.I):
+        _output_ss_pickle(pickle_file, ss, buses, branches, bus_results,
+                          branch_results)
+    else:
+        ssdata.write_SS_npz(pickle_file, ss, buses, branches, phases,
+                            bus_results, branch_results)
+
+    def polar_columns(x):
+        ''' (n, 2*n_ph) columns of magnitude and angle of each phasor in
+            the rows of x '''
+        return np.dstack((np.absolute(x), np.angle(x, deg=True))).reshape(
+            len(x), -1)
+
+    def rect_columns(x):
+        return np.dstack((x.real, x.imag)).reshape(len(x), -1)
 
     with open(SS_file, 'w') as csvfile:
         sswriter = csv.writer(csvfile, lineterminator='\n')
         if buses is not None:
+            ph_voltages, seq_voltages, neg_seq_imbalance = bus_results
             # Output bus voltage results
             sswriter.writerow(list(itertools.chain(('Bus',),
                 itertools.chain(*[('%s-phase Voltage (Real)' % ph,  
@@ -276,21 +662,18 @@ def output_ss_file(LIS_file, SS_file=None, pickle_file=None,
                 itertools.chain(*[('%s-sequence Voltage (Mag)' % ph,
                   '%s-sequence Voltage (Ang)' % ph) for ph in ('Zero', 'Positive', 'Negative')]),
                 ('Neg. Seq. Unbalance Factor (%%)',))))
-            for n, bus in enumerate(buses):
-                sswriter.writerow(list(itertools.chain((bus,), 
-                        itertools.chain(*zip(np.real(ph_voltages[:, n]),
-                            np.imag(ph_voltages[:,n]))),
-                        itertools.chain(*zip(np.real(seq_voltages[:, n]),
-                            np.imag(seq_voltages[:,n]))),
-                        itertools.chain(*zip(np.absolute(ph_voltages[:, n]),
-                           np.angle(ph_voltages[:, n], deg=True))),
-                        itertools.chain(*zip(np.absolute(seq_voltages[:, n]),
-                           np.angle(seq_voltages[:, n], deg=True))),
-                        (neg_seq_imbalance[n],))))
+            table = np.hstack((rect_columns(ph_voltages.T),
+                               rect_columns(seq_voltages.T),
+                               polar_columns(ph_voltages.T),
+                               polar_columns(seq_voltages.T),
+                               neg_seq_imbalance[:, np.newaxis]))
+            sswriter.writerows([bus] + row
+                               for bus, row in zip(buses, table.tolist()))
         
             sswriter.writerow(['--------']*26)
 
         if branches is not None:
+            ph_br_currents, seq_br_currents, S_3ph = branch_results
             # Output branch current results
             sswriter.writerow(list(itertools.chain(('From Bus', 'To Bus',
                                                     '3PH MW', '3PH Mvar'),
@@ -302,24 +685,23 @@ def output_ss_file(LIS_file, SS_file=None, pickle_file=None,
                   '%s-phase Voltage (Ang)' % ph) for ph in phases]),
                 itertools.chain(*[('%s-sequence Voltage (Mag)' % ph,
                   '%s-sequence Voltage (Ang)' % ph) for ph in ('Zero', 'Positive', 'Negative')]))))
-            for n, branch in enumerate(branches):
-                sswriter.writerow(list(itertools.chain(branch,
-                        (S_3ph.real[n], S_3ph.imag[n]),
-                        itertools.chain(*zip(np.real(ph_br_currents[:, n]),
-                            np.imag(ph_br_currents[:,n]))),
-                        itertools.chain(*zip(np.real(seq_br_currents[:, n]),
-                            np.imag(seq_br_currents[:,n]))),
-                        itertools.chain(*zip(np.absolute(ph_br_currents[:, n]),
-                           np.angle(ph_br_currents[:, n], deg=True))),
-                        itertools.chain(*zip(np.absolute(seq_br_currents[:, n]),
-                           np.angle(seq_br_currents[:, n], deg=True))))))
+            table = np.hstack((rect_columns(S_3ph[:, np.newaxis]),
+                               rect_columns(ph_br_currents.T),
+                               rect_columns(seq_br_currents.T),
+                               polar_columns(ph_br_currents.T),
+                               polar_columns(seq_br_currents.T)))
+            sswriter.writerows(list(branch) + row
+                               for branch, row in zip(branches,
+                                                      table.tolist()))
 
             sswriter.writerow(['--------']*28)
 
         # Output node voltage results
         sswriter.writerow(['Bus', 'Bus Voltage (Real)', 'Bus Voltage (Imag)'])
-        for node, voltage in node_voltages.items():
-            sswriter.writerow([node, voltage.real, voltage.imag])
+        names = arrays.node_names[:arrays.n_v].astype('U').tolist()
+        voltages = arrays.voltages[:arrays.n_v]
+        sswriter.writerows(zip(names, voltages.real.tolist(),
+                               voltages.imag.tolist()))
             
         # Output file section separator
         sswriter.writerow([])
@@ -328,22 +710,58 @@ def output_ss_file(LIS_file, SS_file=None, pickle_file=None,
             
         # Output branch current results
         sswriter.writerow(['From Bus', 'To Bus', 'Branch Current (Real)', 'Branch Current (Imag)'])
-        for nodes, current in branch_currents.items():
-            sswriter.writerow([nodes[0], nodes[1], current.real, current.imag])
+        keys = arrays.branch_keys()
+        currents = arrays.branch_current_array(keys)
+        sswriter.writerows((fr, to, i_re, i_im) for (fr, to), i_re, i_im in
+                           zip(keys, currents.real.tolist(),
+                               currents.imag.tolist()))
             
     return SS_file
+
+
+def _output_ss_pickle(pickle_file, ss, buses, branches, bus_results,
+                      branch_results):
+    ''' Write the results of output_ss_file as a pickle of nested dicts. '''
+    data_list = {} # Data to save to pickle file
+    # Save plain dicts so the pickle file does not depend on the storage
+    # used by the parser.
+    data_list['node_voltages'] = dict(ss.node_voltages)
+    data_list['branch_currents'] = dict(ss.branch_currents)
+
+    if buses is not None:
+        ph_voltages, seq_voltages, neg_seq_imbalance = bus_results
+        bus_data = {}
+        for n, bus in enumerate(buses):
+            bus_data[bus] = {}
+            bus_data[bus]['ph_voltages'] = ph_voltages[:, n]
+            bus_data[bus]['seq_voltages'] = seq_voltages[:, n]
+            bus_data[bus]['neg_seq_imbalance'] = neg_seq_imbalance[n]
+        data_list['bus_data'] = bus_data
+
+    if branches is not None:
+        ph_br_currents, seq_br_currents, S_3ph = branch_results
+        branch_data = {}
+        for n, branch in enumerate(branches):
+            branch = tuple(branch) # convert to tuple for indexing
+            branch_data[branch] = {}
+            branch_data[branch]['ph_br_currents'] = ph_br_currents[:, n]
+            branch_data[branch]['seq_br_currents'] = seq_br_currents[:, n]
+            branch_data[branch]['S_3ph'] = S_3ph[n]
+        data_list['branch_data'] = branch_data
+
+    with open(pickle_file, 'wb') as binfile:
+        pickle.dump(data_list, binfile)
+
             
 def process_SS_bus_voltages(LIS_file, buses, phases=('A', 'B', 'C'), RMS_scale=False):
     ''' Parses LIS_file to get steady state results, then creates vectors of
         voltage phasors at the specified buses. Returns ph_voltages, 
         seq_voltages, neg_seq_imbalance as tuple of lists in same order as buses.
+        LIS_file may also be a SteadyStateResult that has already been parsed
+        or a (node_voltages, branch_currents) tuple of peak values.
     '''
-    node_voltages, branch_currents = get_SS_results(LIS_file, RMS_scale)
-    ph_voltages = np.array([[node_voltages[b+p] for p in phases] for b in buses]).T
-    seq_voltages = np.array(lineZ.ph_to_seq_v(ph_voltages))
-    neg_seq_imbalance = np.abs(seq_voltages[2]/seq_voltages[1])*100
-    
-    return ph_voltages, seq_voltages, neg_seq_imbalance
+    return _as_SS_result(LIS_file, RMS_scale).process_bus_voltages(
+        buses, phases)
 
 
 def process_SS_branch_currents(LIS_file, branches, phases=('A', 'B', 'C'),
@@ -351,27 +769,19 @@ def process_SS_branch_currents(LIS_file, branches, phases=('A', 'B', 'C'),
     ''' Parses LIS_file to get steady state results, then creates vectors of
         branch current phasors on the specified branches. Returns
         ph_br_currents, seq_br_currents as tuple of lists in same order as
-        the list of branches.
+        the list of branches. LIS_file may also be a SteadyStateResult that
+        has already been parsed or a (node_voltages, branch_currents) tuple
+        of peak values.
     '''
-    node_voltages, branch_currents = get_SS_results(LIS_file, RMS_scale)
-
-    ph_br_currents = np.array(
-        [[branch_currents[(fr_b + p, to_b + p)] for p in phases]
-         for fr_b, to_b in branches]).T
-    seq_br_currents = np.array(lineZ.ph_to_seq_v(ph_br_currents))
-    # Voltages for power calculation
-    ph_voltages = np.array(
-        [[node_voltages[fr_b + p] for p in phases]
-         for fr_b, to_b in branches]).T
-    S_3ph = np.sum(ph_voltages * np.conj(ph_br_currents), axis=0) / 1e6
-
-    return ph_br_currents, seq_br_currents, S_3ph
+    return _as_SS_result(LIS_file, RMS_scale).process_branch_currents(
+        branches, phases)
 
 
 def get_line_params_from_pch(atp_pch_folder, seg_list):
     """ Reads in line parameters from PCH files, saves the data, and combines
-        data into an aggregate summary of several parameters. Returns two
-        dicts as a tuple:
+        data into an aggregate summary of several parameters. A compressed
+        PCH file, e.g. <seg>.pch.gz, is used if there is no <seg>.pch.
+        Returns two dicts as a tuple:
         seg_data_dict: {seg: params} returns the segment name and
             LineConstPCHCards object for each segment.
         summary_data_dict: Returns various parameters with the line segments
@@ -383,16 +793,51 @@ def get_line_params_from_pch(atp_pch_folder, seg_list):
             ABCD: Transfer matrix in phase quantities
             Zeq: Equivalent Z matrix from ABCD
             Yeq: Equivalent Y matrix from ABCD
-            ABCD_s, Zeq_s, Yeq_s: Symmetrical components of prev. three."""
+            ABCD_s, Zeq_s, Yeq_s: Symmetrical components of prev. three.
+        If a LineParamsCache is set with set_line_params_cache, the results
+        are looked up in it, and the objects returned are shared with other
+        callers."""
+    if line_params_cache is not None:
+        return line_params_cache.get_line_params(atp_pch_folder, seg_list)
     seg_data_dict = {}
     for seg in seg_list:
-        with open(os.path.join(atp_pch_folder, seg + '.pch')) as \
-                pch_file:
-            pch_lines = pch_file.readlines()
-            params = LineConstPCHCards()
-            params.read(pch_lines)
-        seg_data_dict[seg] = params
+        seg_data_dict[seg] = read_line_params_pch(
+            os.path.join(atp_pch_folder, seg + '.pch'))
+
+    return seg_data_dict, summarize_line_params(seg_data_dict)
 
+
+def read_line_params_pch(PCH_file, engine=None):
+    ''' Reads the line parameters punched by a line constants run to PCH_file
+        and returns them as a LineConstPCHCards object. engine is as for
+        parse_line_params_pch. '''
+    with compression.open_file(compression.find_file(PCH_file), 'r') as \
+            pch_file:
+        return parse_line_params_pch(pch_file.read(), engine)
+
+
+def parse_line_params_pch(pch_text, engine=None):
+    '''
+    Returns the LineConstPCHCards object of the line parameters in the text
+    of a PCH file. engine selects the reader, 'numpy' or 'python', by
+    default the module variable PCH_engine. The numpy reader only sets the
+    RLC array and the Z, Y and ABCD matrices, not the data of the cards, and
+    uses the python reader for files it cannot read.
+    '''
+    if (engine or PCH_engine) == 'numpy':
+        try:
+            return LineConstPCHCards.from_RLC(pch.read_RLC(pch_text))
+        except ValueError:
+            pass
+    params = LineConstPCHCards()
+    params.read(pch_text.splitlines(True))
+    return params
+
+
+def summarize_line_params(seg_data_dict):
+    ''' Combines the LineConstPCHCards objects of the line segments in
+        seg_data_dict into the summary_data_dict described in
+        get_line_params_from_pch. '''
     summary_data_dict = {}
     summary_data_dict['Zsum'] = np.sum([p.Z for _, p in seg_data_dict.items()],
                                        axis=0)
@@ -409,14 +854,25 @@ def get_line_params_from_pch(atp_pch_folder, seg_list):
     Z, Y1, Y2 = lineZ.ABCD_to_ZY(summary_data_dict['ABCD_s'])
     summary_data_dict['Zeq_s'] = Z
     summary_data_dict['Yeq_s'] = Y1 + Y2
-    return seg_data_dict, summary_data_dict
+    return summary_data_dict
 
 
 
 def extract_ABCD(ATP_template, ATP_tmp, current_key, switch_key,
                  in_port, out_port,
                  test_current = 500., switch_close_t = '999.',
-                 phases =  ('A', 'B', 'C')):
+                 phases =  ('A', 'B', 'C'), scheduler=None,
+                 batch_cases=False):
+    '''
+    Extracts the ABCD transfer matrix between in_port and out_port of the
+    model in ATP_template from six steady-state runs, three with out_port
+    shorted and three with it open, exciting one phase at a time.
+
+    If an ATPScheduler is given, the six runs are made concurrently by it,
+    each in its own scratch directory. Otherwise they are made one after the
+    other in ATP_tmp. If batch_cases is True, the six cases are run as one
+    deck of six data cases, see batch.ATPBatch, so ATP is started only once.
+    '''
 
     # ATP_tmp should be in the same directory as ATP_template since most likely
     # the model will include includes of .lib files for line parameters.
@@ -429,35 +885,61 @@ def extract_ABCD(ATP_template, ATP_tmp, current_key, switch_key,
     V2_o = np.zeros((3,3), dtype=np.complex128)
     I2_s = np.zeros((3,3), dtype=np.complex128)
 
+    template = ATPDeckTemplate(ATP_template)
+    cases = []
+    decks = []
     for out_port_short in (True, False):
         for n, ph in enumerate(phases):
-            shutil.copyfile(ATP_template, ATP_tmp_full)
-            # Find/replace code numbers in template ATP file and copy to new file
-            for n2, ph2 in enumerate(phases):
-                replace_text(ATP_tmp_full, current_key,
-                        ('%6f.' % (test_current if n2==n else test_current/1000.)),
-                        n=n+1)
-            replace_text(ATP_tmp_full, switch_key, '-1' if out_port_short else '1')
-
-            # Run ATP on new file
+            # The nth occurrence of current_key gets the test current and
+            # the others a small current.
+            values = {current_key: ['%6f.' % (test_current if n2 == n
+                                              else test_current/1000.)
+                                    for n2 in range(len(phases))],
+                      switch_key: '-1' if out_port_short else '1'}
+            cases.append((out_port_short, n))
+            decks.append(template.render(values))
+
+    name = os.path.basename(ATP_tmp_full)
+    include_dir = os.path.dirname(ATP_tmp_full)
+    if batch_cases:
+        cases_batch = batch.ATPBatch(decks)
+        if scheduler is None:
+            results = cases_batch.run_SS(ATP_tmp_full)
+        else:
+            results = cases_batch.submit(scheduler, name,
+                                         include_dir).result()
+    elif scheduler is None:
+        # Run ATP on new file and extract steady-state results
+        results = []
+        for deck in decks:
+            with codecs.open(ATP_tmp_full, 'w', encoding='iso-8859-1',
+                             errors='replace') as f:
+                f.write(deck)
             run_ATP(ATP_tmp_full)
-
-            # Extract steady-state results
-            LIS_results = lis_filename(ATP_tmp_full)
-            node_voltages, branch_currents = get_SS_results(LIS_results)
-            
-            if out_port_short:
-                for n2, ph2 in enumerate(phases):
-                    V1_s[n2, n] = node_voltages[node_ph(in_port[0], ph2)]
-                    I1_s[n2, n] = branch_currents[(node_ph(in_port[0], ph2),
-                                        node_ph(in_port[1], ph2))]
-                    I2_s[n2, n] = branch_currents[(node_ph(out_port[0], ph2),
-                                        node_ph(out_port[1], ph2))] # removed +ph2 because 'TERRA'
-            else:
-                for n2, ph2 in enumerate(phases):
-                    V1_o[n2, n] = node_voltages[node_ph(in_port[0], ph2)]
-                    I1_o[n2, n] = branch_currents[(node_ph(in_port[0], ph2), node_ph(in_port[1], ph2))]
-                    V2_o[n2, n] = node_voltages[node_ph(out_port[0], ph2)]
+            results.append(get_SS_results(lis_filename(ATP_tmp_full)))
+    else:
+        futures = [scheduler.submit(deck=deck, name=name,
+                                    include_dir=include_dir)
+                   for deck in decks]
+        results = [f.result() for f in futures]
+
+    for (out_port_short, n), result in zip(cases, results):
+        if isinstance(result, SteadyStateResult):
+            result = result.node_voltages, result.branch_currents
+        node_voltages, branch_currents = result
+
+        if out_port_short:
+            for n2, ph2 in enumerate(phases):
+                V1_s[n2, n] = node_voltages[node_ph(in_port[0], ph2)]
+                I1_s[n2, n] = branch_currents[(node_ph(in_port[0], ph2),
+                                    node_ph(in_port[1], ph2))]
+                I2_s[n2, n] = branch_currents[(node_ph(out_port[0], ph2),
+                                    node_ph(out_port[1], ph2))] # removed +ph2 because 'TERRA'
+        else:
+            for n2, ph2 in enumerate(phases):
+                V1_o[n2, n] = node_voltages[node_ph(in_port[0], ph2)]
+                I1_o[n2, n] = branch_currents[(node_ph(in_port[0], ph2), node_ph(in_port[1], ph2))]
+                V2_o[n2, n] = node_voltages[node_ph(out_port[0], ph2)]
 
     A = V1_o.dot(inv(V2_o))
     B = V1_s.dot(inv(I2_s))
@@ -490,12 +972,54 @@ BEGIN NEW DATA CASE
 BLANK CARD
 '''
 
+def fortran_fields(fmt):
+    ''' Returns the list of (kind, start, width) of the fields of the
+        Fortran format fmt, e.g. '(I3, 2F8.5, A6)', with 0-based starting
+        columns. Only A, I, F and E descriptors are handled. '''
+    rtn = []
+    col = 0
+    for count, kind, width in re.findall(r'(\d*)\s*([AIFE])(\d+)(?:\.\d+)?',
+                                         fmt.upper()):
+        for _ in range(int(count or 1)):
+            rtn.append((kind, col, int(width)))
+            col += int(width)
+    return rtn
+
+
 class LineConstCards(tdc.DataCardStack):
     ''' Stack of cards for a line constants case.
-        This is Based on what ATPDraw creates.'''
+        This is Based on what ATPDraw creates.
+
+        read also records the columns of the fields of the branch, units,
+        conductor and parameter cards in the lines read, so that patch can
+        change a field by rewriting only its columns, and patched_text
+        returns the lines read with the changes. This is much faster than
+        changing data and calling write when many variants of a case are
+        made. '''
+    branch_format = '(A8,6A6)'
+    branch_fields = ['branch_card', 'in1', 'out1', 'in2', 'out2', 'in3',
+                     'out3']
+    units_format = '(A80)'
+    units_fields = ['units']
+    conductor_format = '(I3, F5.4, F8.5, I2, F8.5, F8.5, F8.3, F8.3, F8.3)'
+    conductor_fields = ['IP', 'SKIN', 'RESIS', 'IX', 'REACT', 'DIAM',
+                        'HORIZ', 'VTOWER', 'VMID']
+    params_format = ('(F8.2, F10.2, A10, A1, 6I1, A1, 6I1, A1, I1, F8.3, A1, '
+                     '4I1, I1, A7, I3)')
+    params_fields = ['RHO', 'FREQ', 'FCAR', '_1',
+                     'inv_C', 'inv_Ce', 'inv_Cs',
+                     'C', 'Ce', 'Cs', '_2',
+                     'Z', 'Ze', 'Zs',
+                     'inv_Z', 'inv_Ze', 'inv_Zg', '_3',
+                     'ICAP',
+                     'DIST', '_4',
+                     'pi_Y', 'pi_Ys', 'pi_Z', 'pi_Zs',
+                     'ISEG', '_5',
+                     'PUN']
+
     def __init__(self):
-        conductor_card = tdc.DataCard('(I3, F5.4, F8.5, I2, F8.5, F8.5, F8.3, F8.3, F8.3)',
-                                 ['IP', 'SKIN', 'RESIS', 'IX', 'REACT', 'DIAM', 'HORIZ', 'VTOWER', 'VMID'])
+        conductor_card = tdc.DataCard(self.conductor_format,
+                                      self.conductor_fields)
         end_conductors = tdc.DataCardFixedText('BLANK CARD ENDING CONDUCTOR CARDS')
         conductor_cards = tdc.DataCardRepeat(conductor_card, end_record = end_conductors,
                                          name = 'conductors')
@@ -504,27 +1028,142 @@ class LineConstCards(tdc.DataCardStack):
             [tdc.DataCardFixedText('BEGIN NEW DATA CASE'),
              tdc.DataCardFixedText('LINE CONSTANTS'),
              tdc.DataCardFixedText('$ERASE'),
-             tdc.DataCard('(A8,6A6)', ['branch_card', 'in1', 'out1', 'in2',
-                                       'out2', 'in3', 'out3']),
-             tdc.DataCard('(A80)', ['units']),
+             tdc.DataCard(self.branch_format, self.branch_fields),
+             tdc.DataCard(self.units_format, self.units_fields),
                         conductor_cards,
-             tdc.DataCard('(F8.2, F10.2, A10, A1, 6I1, A1, 6I1, A1, I1, F8.3, A1, 4I1, I1, A7, I3)',
-                                       ['RHO', 'FREQ', 'FCAR', '_1',
-                                        'inv_C', 'inv_Ce', 'inv_Cs',
-                                        'C', 'Ce', 'Cs', '_2',
-                                        'Z', 'Ze', 'Zs',
-                                        'inv_Z', 'inv_Ze', 'inv_Zg', '_3', 
-                                        'ICAP',
-                                        'DIST', '_4',
-                                        'pi_Y', 'pi_Ys', 'pi_Z', 'pi_Zs',
-                                        'ISEG', '_5',
-                                        'PUN']),
+             tdc.DataCard(self.params_format, self.params_fields),
              tdc.DataCardFixedText('$PUNCH'),
              tdc.DataCardFixedText('BLANK CARD ENDING FREQUENCY CARDS'),
              tdc.DataCardFixedText('BLANK CARD ENDING LINE CONSTANT'),
              tdc.DataCardFixedText('BEGIN NEW DATA CASE'),
              tdc.DataCardFixedText('BLANK CARD')
             ])
+        self._lines = None
+        self._spans = None
+
+    def read(self, lines, *args, **kwargs):
+        rtn = tdc.DataCardStack.read(self, lines, *args, **kwargs)
+        self.index_fields(lines)
+        return rtn
+
+    def index_fields(self, lines):
+        '''
+        Records lines, the cards of a line constants case, and the columns
+        of the fields of its cards for patch. read does this; it is only
+        needed to patch lines without parsing them. Raises ValueError if
+        the cards are not found.
+        '''
+        lines = [line.rstrip('\r\n') for line in lines]
+        cards = [k for k, line in enumerate(lines)
+                 if line[:2].upper() != 'C ' and line.rstrip().upper() != 'C']
+        try:
+            k = next(n for n, c in enumerate(cards)
+                     if lines[c].upper().startswith('BRANCH'))
+            end = next(n for n, c in enumerate(cards) if n > k + 1 and
+                       lines[c].upper().startswith('BLANK CARD ENDING '
+                                                   'CONDUCTOR'))
+        except StopIteration:
+            raise ValueError('Branch or conductor cards not found')
+        if end + 1 >= len(cards):
+            raise ValueError('Line constants parameter card not found')
+
+        spans = {}
+        def add(line_no, fmt, names, row=None):
+            for name, (kind, start, width) in zip(names,
+                                                   fortran_fields(fmt)):
+                spans[(name, row)] = (line_no, start, start + width, kind)
+        add(cards[k], self.branch_format, self.branch_fields)
+        add(cards[k + 1], self.units_format, self.units_fields)
+        for row, line_no in enumerate(cards[k + 2:end]):
+            add(line_no, self.conductor_format, self.conductor_fields, row)
+        add(cards[end + 1], self.params_format, self.params_fields)
+        self._lines = lines
+        self._spans = spans
+
+    def patch(self, field, value, row=None):
+        '''
+        Sets field to value in the lines read by rewriting only the columns
+        of the field. row is the index of the conductor card for conductor
+        fields, and None for the fields of the other cards. Numbers are
+        right justified, with a decimal point for real fields, and text is
+        left justified. Raises ValueError if the value does not fit. The
+        conductor data read is changed too, as write would need.
+        '''
+        if self._spans is None:
+            raise ValueError('No cards read to patch')
+        try:
+            line_no, start, end, kind = self._spans[(field, row)]
+        except KeyError:
+            raise KeyError('No field %s%s' % (
+                field, '' if row is None else ' in conductor card %d' % row))
+        width = end - start
+        if kind == 'A':
+            text = ('%s' % value).ljust(width)
+        elif kind == 'I':
+            text = ('%d' % value).rjust(width)
+        else:
+            text = format_value(value, width).rjust(width)
+        if len(text) > width:
+            raise ValueError('%r does not fit in the %d columns of %s' %
+                             (value, width, field))
+        line = self._lines[line_no]
+        if len(line) < end:
+            line = line.ljust(start)
+        self._lines[line_no] = line[:start] + text + line[end:]
+        conductors = (getattr(self, 'data', None) or {}).get('conductors')
+        if row is not None and row < len(conductors or ()):
+            conductors[row][field] = value
+
+    def patched_text(self, newline='\n'):
+        ''' Returns the text of the lines read, with the patched fields. '''
+        if self._lines is None:
+            raise ValueError('No cards read to patch')
+        return newline.join(self._lines) + newline
+
+    def field(self, field, row=None):
+        '''
+        Returns the value of field in the lines read, with the patches, as
+        for patch: a float for real fields, an int for integer fields (blank
+        fields are 0) and the stripped text for text fields. Real fields
+        must have a decimal point or an exponent if not blank.
+        '''
+        if self._spans is None:
+            raise ValueError('No cards read')
+        try:
+            line_no, start, end, kind = self._spans[(field, row)]
+        except KeyError:
+            raise KeyError('No field %s%s' % (
+                field, '' if row is None else ' in conductor card %d' % row))
+        text = self._lines[line_no][start:end].strip()
+        if kind == 'A':
+            return text
+        if not text:
+            return 0 if kind == 'I' else 0.
+        if kind == 'I':
+            return int(text)
+        return float(text.upper().replace('D', 'E'))
+
+    def conductors(self):
+        ''' Returns the list of dicts of the fields of the conductor cards
+            in the lines read, with the patches. '''
+        n = len([k for k in self._spans or () if k[0] == 'IP'])
+        return [dict((f, self.field(f, row)) for f in self.conductor_fields)
+                for row in range(n)]
+
+    def line_params(self):
+        '''
+        Computes the parameters of the case in the lines read, with the
+        patches, with lineconst.line_constants instead of running ATP.
+        Returns a LineConstPCHCards holding the RLC, Z, Y and ABCD arrays
+        that read_line_params_pch would return for the PCH file punched by
+        ATP, at the frequency FREQ of the case. Raises ValueError for
+        conductor data that line_constants does not handle.
+        '''
+        Z, Y = lineconst.line_constants(
+            self.conductors(), self.field('RHO'), self.field('FREQ'),
+            self.field('DIST'),
+            metric=self.field('units').upper().startswith('METRIC'))
+        return LineConstPCHCards.from_RLC(pch.RLC_from_ZY(Z, Y))
 
 comment_card = tdc.DataCard('A2, A78', ['C ', 'Comment'], fixed_fields=(0,))
 vintage_card = tdc.DataCard('A9, A71', ['$VINTAGE,', 'Flag'], fixed_fields=(0,))
@@ -550,9 +1189,22 @@ class LineConstPCHCards(tdc.DataCardStack):
                  vintage_card, name='RLC_params'),
              units_card],
              post_read_hook=self._get_ZY_and_ABCD)
+        self.RLC = None
         self.Z = None
         self.Y = None
 
+    @classmethod
+    def from_RLC(cls, RLC):
+        """ Object holding the parameters of the (n, 3) array of R, L and C
+            values RLC, as returned by pch.read_RLC, without card data. """
+        rtn = cls()
+        rtn.RLC = np.asarray(RLC, dtype=fdtype)
+        Z, Y = pch.ZY_from_RLC(rtn.RLC)
+        rtn.Z = Z.astype(cdtype)
+        rtn.Y = Y.astype(cdtype)
+        rtn.get_ABCD()
+        return rtn
+
     @staticmethod
     def _get_ZY_and_ABCD(pch_card):
         """ Callback for reading. """
@@ -563,27 +1215,16 @@ class LineConstPCHCards(tdc.DataCardStack):
         """ Convert R, L, C parameters to Z and Y matrices
             It is assumed that PI parameters are calculated at nominal
             frequency. """
-        # First compute the number of phases
-        n = len(self.data['RLC_params'])
-        # n = (n_ph+1)*n_ph/2
-        # Solve for n_ph using quadratic formula
-        n_ph = int((sqrt(1+8*n) - 1)/2)
-        Z = np.zeros((n_ph, n_ph), dtype=cdtype)
-        Y = np.zeros((n_ph, n_ph), dtype=cdtype)
-        idx = 0
-        for r in range(n_ph):
-            for c in range(r+1):
-                # R & L assumed to be in Ohms. (Ref R.B. IV.B.3)
-                Z[r, c] = Z[c, r] = self.data['RLC_params'][idx]['R'] \
-                                    + 1j*self.data['RLC_params'][idx]['L']
-                # C assumed to be in microSiemens. (Ref R.B. IV.B.3)
-                # C value is total capacitance, which ATP then divides by
-                # two for the pi model.
-                Y[r, c] = Y[c, r] = 1e-6j*self.data['RLC_params'][idx]['C']
-                idx += 1
-        self.Z = Z
-        self.Y = Y
-        return Z, Y
+        # R & L assumed to be in Ohms. (Ref R.B. IV.B.3)
+        # C assumed to be in microSiemens. (Ref R.B. IV.B.3)
+        # C value is total capacitance, which ATP then divides by
+        # two for the pi model.
+        self.RLC = np.array([[p['R'], p['L'], p['C']]
+                             for p in self.data['RLC_params']], dtype=fdtype)
+        Z, Y = pch.ZY_from_RLC(self.RLC)
+        self.Z = Z.astype(cdtype)
+        self.Y = Y.astype(cdtype)
+        return self.Z, self.Y
 
     def get_ABCD(self):
         self.ABCD = lineZ.ZY_to_ABCD(self.Z, self.Y)
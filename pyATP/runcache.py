@@ -0,0 +1,228 @@
+'''
+Persistent cache of ATP run outputs.
+
+RunCache stores the output files (LIS, PCH, PL4, ...) of ATP runs in a
+directory, keyed by a SHA-256 hash of the deck, of every file it includes with
+$INCLUDE and of the ATP executable used. When run_ATP is given a deck whose
+key is already in the cache, the stored outputs are copied next to the deck
+instead of running ATP. To use a cache for all runs:
+
+    pyATP.set_run_cache(pyATP.RunCache('C:/ATP/cache', max_size=2**30))
+
+The total size of the cache is kept under max_size bytes by removing the least
+recently used entries.
+'''
+
+from __future__ import print_function, unicode_literals
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+
+from . import pyATP as _atp
+from .scheduler import find_includes
+
+__all__ = ['RunCache']
+
+# Incremented whenever the layout of cache entries or the key changes, so that
+# old entries are not used.
+RUN_CACHE_VERSION = 1
+
+# Outputs of an ATP run collected into the cache: files named after the deck
+# with one of these extensions that the run created or modified.
+OUTPUT_EXTENSIONS = ('.lis', '.pch', '.pl4', '.dbg')
+
+_META = 'meta.json'
+
+
+def _hash_file(filename, h):
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+
+
+class RunCache(object):
+    '''
+    Cache of ATP run outputs in the directory cache_dir (created if needed).
+    max_size is the largest total size in bytes of the stored outputs, or
+    None for no limit. Statistics of the cache use in this process are kept
+    in the stats dict: hits, misses, stores and evictions.
+    '''
+    def __init__(self, cache_dir, max_size=None):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        self.stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+        self._lock = threading.Lock()
+
+    def key(self, ATP_file, cwd=None):
+        '''
+        Returns the hex key of the deck ATP_file, relative to cwd if given.
+        Included files are looked for relative to the directory of the deck,
+        and then to the working directory, as are the files they include.
+        '''
+        deck_file = os.path.join(cwd or '', ATP_file)
+        dirs = [os.path.dirname(os.path.abspath(deck_file)),
+                os.path.abspath(cwd or os.getcwd())]
+        h = hashlib.sha256()
+        h.update(('pyATP run cache %d\0%s\0' % (
+            RUN_CACHE_VERSION,
+            os.path.join(_atp.ATP_path, _atp.ATP_exe))).encode('utf-8'))
+        _hash_file(deck_file, h)
+
+        todo = [deck_file]
+        seen = set()
+        while todo:
+            with open(todo.pop(0), 'rb') as f:
+                text = f.read().decode('iso-8859-1')
+            for name in find_includes(text):
+                if name in seen:
+                    continue
+                seen.add(name)
+                h.update(('\0include\0%s\0' % name).encode('utf-8'))
+                for d in dirs:
+                    path = os.path.join(d, name)
+                    if os.path.isfile(path):
+                        _hash_file(path, h)
+                        todo.append(path)
+                        break
+                else:
+                    h.update(b'\0missing\0')
+        return h.hexdigest()
+
+    def _entry(self, key):
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def run(self, ATP_file, quiet=None, cwd=None):
+        '''
+        Runs ATP on ATP_file as run_ATP does, unless its outputs are in the
+        cache, in which case they are copied next to the deck instead.
+        Successful runs that write outputs are added to the cache. Returns
+        the return code of the ATP process.
+        '''
+        key = self.key(ATP_file, cwd)
+        base = os.path.splitext(os.path.join(cwd or '', ATP_file))[0]
+        rtn = self.restore(key, base)
+        if rtn is not None:
+            return rtn
+        before = self.output_times(base)
+        rtn = _atp.run_ATP(ATP_file, quiet=quiet, cwd=cwd, use_cache=False)
+        self.save(key, base, before, rtn)
+        return rtn
+
+    def restore(self, key, base):
+        '''
+        Copies the outputs stored under key to base + extension and returns
+        the return code of the run, or returns None if key is not in the
+        cache. Counts a hit or a miss.
+        '''
+        entry = self._entry(key)
+        try:
+            with open(os.path.join(entry, _META)) as f:
+                meta = json.load(f)
+            for ext in meta['outputs']:
+                shutil.copyfile(os.path.join(entry, 'out' + ext), base + ext)
+        except (IOError, OSError, ValueError, KeyError):
+            with self._lock:
+                self.stats['misses'] += 1
+            return None
+        # The modification time of the entry records its last use
+        os.utime(entry, None)
+        with self._lock:
+            self.stats['hits'] += 1
+        return meta['returncode']
+
+    @staticmethod
+    def output_times(base):
+        ''' Modification times of the existing outputs of the deck named
+            base + '.atp', to pass to save once ATP has run. '''
+        return {ext: os.path.getmtime(base + ext)
+                for ext in OUTPUT_EXTENSIONS if os.path.exists(base + ext)}
+
+    def save(self, key, base, before, returncode):
+        '''
+        Stores under key the outputs of a run of the deck named base + '.atp'
+        that were created or modified since output_times returned before.
+        Nothing is stored unless returncode is 0 and there are outputs.
+        '''
+        outputs = [ext for ext in OUTPUT_EXTENSIONS
+                   if os.path.exists(base + ext)
+                   and os.path.getmtime(base + ext) != before.get(ext)]
+        if returncode == 0 and outputs:
+            self._store(key, base, outputs, returncode)
+
+    def _store(self, key, base, outputs, returncode):
+        entry = self._entry(key)
+        parent = os.path.dirname(entry)
+        if not os.path.isdir(parent):
+            try:
+                os.makedirs(parent)
+            except OSError:
+                # Made by another thread or process in the meantime
+                pass
+        # Entries are written to a temporary directory and renamed, so a
+        # concurrent reader never sees half of one.
+        tmp = tempfile.mkdtemp(prefix='tmp_', dir=parent)
+        for ext in outputs:
+            shutil.copyfile(base + ext, os.path.join(tmp, 'out' + ext))
+        with open(os.path.join(tmp, _META), 'w') as f:
+            json.dump({'outputs': outputs, 'returncode': returncode}, f)
+        try:
+            os.rename(tmp, entry)
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors=True)
+            return
+        with self._lock:
+            self.stats['stores'] += 1
+        if self.max_size is not None:
+            self.evict(self.max_size)
+
+    def entries(self):
+        ''' Returns a list of (last use time, size in bytes, path) of the
+            entries in the cache, least recently used first. '''
+        rtn = []
+        for d in os.listdir(self.cache_dir):
+            d = os.path.join(self.cache_dir, d)
+            if not os.path.isdir(d):
+                continue
+            for key in os.listdir(d):
+                entry = os.path.join(d, key)
+                if key.startswith('tmp_'):
+                    continue
+                try:
+                    size = sum(os.path.getsize(os.path.join(entry, f))
+                               for f in os.listdir(entry))
+                    rtn.append((os.path.getmtime(entry), size, entry))
+                except OSError:
+                    # Removed by another thread or process
+                    pass
+        rtn.sort()
+        return rtn
+
+    def size(self):
+        ''' Total size in bytes of the entries in the cache. '''
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self, max_size):
+        ''' Removes the least recently used entries until the cache holds at
+            most max_size bytes. Returns the number of entries removed. '''
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, entry in entries:
+            if total <= max_size:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+            removed += 1
+        with self._lock:
+            self.stats['evictions'] += removed
+        return removed
+
+    def clear(self):
+        ''' Removes all entries from the cache. '''
+        self.evict(0)
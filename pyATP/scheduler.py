@@ -0,0 +1,169 @@
+'''
+Concurrent execution of ATP runs.
+
+ATPScheduler runs several ATP processes at once, each in its own scratch
+directory so that the output files of different runs cannot collide. The
+files a deck includes with $INCLUDE are linked (or copied) into the scratch
+directory, and the results are parsed there before it is removed. Results
+are returned as concurrent.futures.Future objects.
+'''
+
+from __future__ import print_function, unicode_literals
+
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import codecs
+import os
+import re
+import shutil
+import tempfile
+
+from .pyATP import run_ATP, get_SS_results, read_line_params_pch, \
+    SteadyStateResult
+
+__all__ = ['ATPScheduler', 'ATPRun', 'find_includes', 'parse_SS',
+           'parse_pch']
+
+ATPRun = namedtuple('ATPRun', ['name', 'ATP_file', 'returncode', 'workdir'])
+ATPRun.__doc__ = ''' A finished ATP run. ATP_file is the deck in the scratch
+    directory workdir, where ATP wrote its output files, and returncode is
+    the return code of the ATP process. '''
+
+# Files included by a deck: $INCLUDE followed by a comma or blanks and the
+# file name, which ends at the next comma or blank.
+_include = re.compile(r'^\$INCLUDE[ ,]+([^ ,\r\n]+)', re.I | re.M)
+
+
+def find_includes(deck):
+    ''' Returns the list of file names included with $INCLUDE in the text of
+        an ATP deck. '''
+    return _include.findall(deck)
+
+
+def parse_SS(run):
+    ''' Default parser of ATPScheduler: returns the SteadyStateResult of the
+        LIS file of the run. Raises RuntimeError if ATP did not write one. '''
+    LIS_file = os.path.splitext(run.ATP_file)[0] + '.lis'
+    if not os.path.exists(LIS_file):
+        raise RuntimeError('ATP run %s failed with return code %s and wrote '
+                           'no LIS file' % (run.name, run.returncode))
+    return SteadyStateResult(*get_SS_results(LIS_file), LIS_file=LIS_file)
+
+
+def parse_pch(run):
+    ''' Parser for line constants runs: returns the LineConstPCHCards of the
+        PCH file punched by the run. '''
+    PCH_file = os.path.splitext(run.ATP_file)[0] + '.pch'
+    if not os.path.exists(PCH_file):
+        raise RuntimeError('ATP run %s failed with return code %s and wrote '
+                           'no PCH file' % (run.name, run.returncode))
+    return read_line_params_pch(PCH_file)
+
+
+# Default of submit's parse argument, as None has a meaning of its own
+_default = object()
+
+
+def _link_or_copy(src, dst):
+    if os.path.exists(dst):
+        return
+    dst_dir = os.path.dirname(dst)
+    if not os.path.isdir(dst_dir):
+        os.makedirs(dst_dir)
+    try:
+        os.link(src, dst)
+    except (OSError, AttributeError):
+        shutil.copy2(src, dst)
+
+
+class ATPScheduler(object):
+    '''
+    Runs ATP cases concurrently, each in its own scratch directory:
+
+        with ATPScheduler() as scheduler:
+            futures = [scheduler.submit(f) for f in ATP_files]
+            results = [f.result() for f in futures]
+
+    workers is the number of ATP processes run at once, by default the number
+    of CPUs. Scratch directories are created in scratch_dir (the system
+    temporary directory by default) and removed once the run is parsed,
+    unless keep_files is True. includes is a list of files linked into every
+    scratch directory in addition to those found in each deck.
+
+    parse is called with the ATPRun of each finished run, in the worker
+    thread, and its return value is the result of the run's future. The
+    default, parse_SS, returns the SteadyStateResult of the LIS file.
+    '''
+    def __init__(self, workers=None, scratch_dir=None, includes=(),
+                 keep_files=False, parse=parse_SS):
+        if workers is None:
+            workers = os.cpu_count() or 1
+        self.workers = workers
+        self.scratch_dir = scratch_dir
+        self.includes = list(includes)
+        self.keep_files = keep_files
+        self.parse = parse
+        self._pool = ThreadPoolExecutor(workers)
+
+    def submit(self, ATP_file=None, deck=None, name=None, include_dir=None,
+               includes=(), parse=_default, use_cache=True):
+        '''
+        Queue an ATP run and return a Future of its parsed result.
+
+        The deck is read from ATP_file, or given as the text deck, in which
+        case name is its file name (e.g. 'case.atp'). Files it includes with
+        relative names are taken from include_dir, by default the directory
+        of ATP_file (or the current directory). includes lists more files to
+        link into the scratch directory. parse overrides the parser given to
+        the scheduler. If it is None, the result is the ATPRun itself and
+        the scratch directory is kept for the caller to use and remove.
+        use_cache=False runs ATP even if a run cache holds the outputs.
+        '''
+        if deck is None:
+            with codecs.open(ATP_file, 'r', encoding='iso-8859-1') as f:
+                deck = f.read()
+        if name is None:
+            name = os.path.basename(ATP_file) if ATP_file else 'case.atp'
+        if include_dir is None:
+            include_dir = os.path.dirname(os.path.abspath(ATP_file)) \
+                if ATP_file else os.getcwd()
+        files = [os.path.join(include_dir, f) for f in find_includes(deck)
+                 if not os.path.isabs(f)
+                 and os.path.exists(os.path.join(include_dir, f))]
+        links = [(f, os.path.relpath(f, include_dir)) for f in files]
+        links += [(f, os.path.basename(f))
+                  for f in self.includes + list(includes)]
+        if parse is _default:
+            parse = self.parse
+        return self._pool.submit(self._run, name, deck, links, parse,
+                                 use_cache)
+
+    def map(self, ATP_files, parse=_default):
+        ''' Submit every file of ATP_files. Returns the list of futures. '''
+        return [self.submit(f, parse=parse) for f in ATP_files]
+
+    def _run(self, name, deck, links, parse, use_cache):
+        workdir = tempfile.mkdtemp(prefix='atp_', dir=self.scratch_dir)
+        try:
+            for src, rel in links:
+                _link_or_copy(src, os.path.join(workdir, rel))
+            ATP_file = os.path.join(workdir, name)
+            with codecs.open(ATP_file, 'w', encoding='iso-8859-1') as f:
+                f.write(deck)
+            rtn = run_ATP(name, cwd=workdir, use_cache=use_cache)
+            run = ATPRun(name, ATP_file, rtn, workdir)
+            return run if parse is None else parse(run)
+        finally:
+            if not (self.keep_files or parse is None):
+                shutil.rmtree(workdir, ignore_errors=True)
+
+    def shutdown(self, wait=True):
+        ''' Stop accepting runs. If wait is True, wait for the queued runs to
+            finish. '''
+        self._pool.shutdown(wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
@@ -0,0 +1,235 @@
+'''
+Columnar binary storage of steady-state results.
+
+A SteadyStateResult and the bus and branch quantities computed from it are
+saved as named arrays in an uncompressed NPZ file. Each array is stored as a
+plain .npy member of the zip archive, so SSResultFile can memory-map any of
+them without reading the rest of the file. The arrays are:
+
+    format_version          scalar, SS_NPZ_VERSION of the writer
+    phases                  phase letters used for buses and branches
+    node_names              bytes names of all nodes, voltages first
+    node_voltages           complex node voltages, NaN for switch-only nodes
+    branch_nodes            (n, 2) indices into node_names of each branch
+    branch_currents         (n, 2) complex currents at the from and to end
+    node_order, branch_keys, branch_key_pos
+                            lookup tables of lis.SteadyStateArrays
+
+and, when buses or branches were given, one row per bus or branch of:
+
+    bus_names, bus_ph_voltages, bus_seq_voltages, bus_neg_seq_imbalance
+    branch_names, branch_ph_currents, branch_seq_currents, branch_S_3ph
+'''
+
+from __future__ import print_function, unicode_literals
+
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+import struct
+import zipfile
+
+import numpy as np
+
+from . import lis
+
+__all__ = ['SS_NPZ_VERSION', 'write_SS_npz', 'SSResultFile']
+
+# Incremented whenever arrays are renamed or change meaning. Readers refuse
+# files written by a newer version.
+SS_NPZ_VERSION = 1
+
+
+def _SS_arrays(ss):
+    ''' lis.SteadyStateArrays of a SteadyStateResult. '''
+    if ss.arrays is not None:
+        return ss.arrays
+    return lis.SteadyStateArrays.from_dicts(ss.node_voltages,
+                                            ss.branch_currents)
+
+
+def write_SS_npz(filename, ss, buses=None, branches=None,
+                 phases=('A', 'B', 'C'), bus_results=None,
+                 branch_results=None):
+    '''
+    Save the SteadyStateResult ss to the NPZ file filename, together with the
+    phase and sequence quantities of buses and branches if given.
+    bus_results and branch_results may be the tuples already returned by
+    ss.process_bus_voltages and ss.process_branch_currents for the same buses
+    and branches, so they are not computed again.
+    '''
+    arrays = _SS_arrays(ss)
+    data = {'format_version': np.array(SS_NPZ_VERSION),
+            'phases': np.array(phases, dtype='S'),
+            'node_names': arrays.node_names,
+            'node_voltages': arrays.voltages,
+            'branch_nodes': arrays.br_nodes,
+            'branch_currents': arrays.br_current,
+            'node_order': arrays._name_order,
+            'branch_keys': arrays._keys,
+            'branch_key_pos': arrays._key_pos}
+
+    if buses is not None:
+        if bus_results is None:
+            bus_results = ss.process_bus_voltages(buses, phases)
+        ph_voltages, seq_voltages, neg_seq_imbalance = bus_results
+        data['bus_names'] = np.array(buses, dtype='S')
+        data['bus_ph_voltages'] = np.ascontiguousarray(ph_voltages.T)
+        data['bus_seq_voltages'] = np.ascontiguousarray(seq_voltages.T)
+        data['bus_neg_seq_imbalance'] = neg_seq_imbalance
+
+    if branches is not None:
+        if branch_results is None:
+            branch_results = ss.process_branch_currents(branches, phases)
+        ph_br_currents, seq_br_currents, S_3ph = branch_results
+        data['branch_names'] = np.array(
+            [tuple(b) for b in branches], dtype='S').reshape(-1, 2)
+        data['branch_ph_currents'] = np.ascontiguousarray(ph_br_currents.T)
+        data['branch_seq_currents'] = np.ascontiguousarray(seq_br_currents.T)
+        data['branch_S_3ph'] = S_3ph
+
+    with open(filename, 'wb') as f:
+        np.savez(f, **data)
+    return filename
+
+
+def _member_array(f, filename, info):
+    ''' Memory map of the .npy member described by ZipInfo info. '''
+    # The data follows the local file header, whose name and extra field
+    # lengths may differ from those in the central directory.
+    f.seek(info.header_offset + 26)
+    name_len, extra_len = struct.unpack('<HH', f.read(4))
+    f.seek(info.header_offset + 30 + name_len + extra_len)
+    version = np.lib.format.read_magic(f)
+    if version == (1, 0):
+        header = np.lib.format.read_array_header_1_0(f)
+    else:
+        header = np.lib.format.read_array_header_2_0(f)
+    shape, fortran_order, dtype = header
+    if dtype.hasobject:
+        raise ValueError('%s: object arrays are not supported' % info.filename)
+    if 0 in shape:
+        return np.empty(shape, dtype=dtype)
+    return np.memmap(filename, dtype=dtype, mode='r', offset=f.tell(),
+                     shape=shape, order='F' if fortran_order else 'C')
+
+
+class SSResultFile(Mapping):
+    '''
+    Read-only {array name: array} mapping of an NPZ file written by
+    write_SS_npz. Arrays are memory-mapped when first used, so pulling the
+    results of one bus only reads the pages that hold it:
+
+        ss = SSResultFile('case_ss.npz')
+        ss.bus_data['BUS1']['seq_voltages']
+        ss.branch_data['BUS1', 'BUS2']['S_3ph']
+        ss.node_voltages['BUS1A']
+
+    bus_data and branch_data hold the same dicts as the pickle file written by
+    earlier versions of output_ss_file. Compressed members are decompressed
+    into memory instead.
+    '''
+    def __init__(self, filename):
+        self.filename = filename
+        with zipfile.ZipFile(filename) as z:
+            self._members = {i.filename[:-4]: i for i in z.infolist()
+                             if i.filename.endswith('.npy')}
+        self._cache = {}
+        self._arrays = None
+        version = int(self['format_version'])
+        if version > SS_NPZ_VERSION:
+            raise ValueError('%s was written by a newer version (format %d)'
+                             % (filename, version))
+        self.version = version
+        self.phases = tuple(self['phases'].astype('U').tolist())
+
+    def __getitem__(self, name):
+        try:
+            return self._cache[name]
+        except KeyError:
+            pass
+        info = self._members[name]
+        if info.compress_type == zipfile.ZIP_STORED:
+            with open(self.filename, 'rb') as f:
+                a = _member_array(f, self.filename, info)
+        else:
+            with zipfile.ZipFile(self.filename) as z:
+                with z.open(info) as f:
+                    a = np.lib.format.read_array(f)
+        self._cache[name] = a
+        return a
+
+    def __iter__(self):
+        return iter(self._members)
+
+    def __len__(self):
+        return len(self._members)
+
+    @property
+    def arrays(self):
+        ''' The lis.SteadyStateArrays of the node voltages and branch
+            currents. '''
+        if self._arrays is None:
+            names = self['node_names']
+            order = self['node_order']
+            self._arrays = lis.SteadyStateArrays(
+                names, self['node_voltages'], self['branch_nodes'],
+                self['branch_currents'],
+                _lookup=(names[order], order, self['branch_keys'],
+                         self['branch_key_pos']))
+        return self._arrays
+
+    @property
+    def node_voltages(self):
+        return self.arrays.node_voltages
+
+    @property
+    def branch_currents(self):
+        return self.arrays.branch_currents
+
+    @property
+    def bus_data(self):
+        ''' {bus: {'ph_voltages', 'seq_voltages', 'neg_seq_imbalance'}} '''
+        return _RowView(self, 'bus_names', 'bus_',
+                        ('ph_voltages', 'seq_voltages', 'neg_seq_imbalance'))
+
+    @property
+    def branch_data(self):
+        ''' {(from bus, to bus): {'ph_br_currents', 'seq_br_currents',
+            'S_3ph'}} '''
+        return _RowView(self, 'branch_names', 'branch_',
+                        ('ph_currents', 'seq_currents', 'S_3ph'),
+                        ('ph_br_currents', 'seq_br_currents', 'S_3ph'))
+
+
+class _RowView(Mapping):
+    ''' Read-only mapping of bus or branch names to a dict of one row of
+        each of the given arrays. '''
+    def __init__(self, ss, names, prefix, fields, keys=None):
+        self._ss = ss
+        self._arrays = [prefix + f for f in fields]
+        self._keys = keys if keys is not None else fields
+        if names not in ss:
+            self._names = []
+        else:
+            self._names = [tuple(n) if isinstance(n, list) else n
+                           for n in ss[names].astype('U').tolist()]
+        self._index = {n: k for k, n in enumerate(self._names)}
+
+    def __getitem__(self, name):
+        if isinstance(name, list):
+            name = tuple(name)
+        k = self._index[name]
+        row = {}
+        for key, a in zip(self._keys, self._arrays):
+            v = self._ss[a][k]
+            # Copy rows out of the memory map; scalars are already copies
+            row[key] = np.array(v) if isinstance(v, np.ndarray) else v
+        return row
+
+    def __iter__(self):
+        return iter(self._names)
+
+    def __len__(self):
+        return len(self._names)
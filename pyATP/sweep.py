@@ -0,0 +1,275 @@
+'''
+Parametric sweeps over fields of an ATP deck.
+
+A sweep renders one deck per point from an ATPDeckTemplate, with placeholder
+keys of the template replaced by the values of the point, runs the decks
+concurrently with an ATPScheduler and stores the node voltages and branch
+currents of interest of each point as one row of a SweepResults table:
+
+    points = grid([('IAMP', [100., 200., 500.]), ('TCLOSE', [0.01, 0.02])])
+    results = run_sweep('model.atp', points, nodes=['BUS1A', 'BUS2A'],
+                        branches=[('BUS1A', 'BUS2A')])
+    results.node_voltages       # (6, 2) complex array
+
+Points are given as an OrderedDict of {parameter name: array of values}, as
+made by grid, zipped or latin_hypercube. Only the selected quantities of each
+run are kept, and only a few decks are rendered ahead of the runs, so memory
+use does not grow with the number of parsed results.
+'''
+
+from __future__ import print_function, unicode_literals
+
+from collections import OrderedDict
+from concurrent.futures import wait, FIRST_COMPLETED
+import itertools
+import os
+from math import sqrt
+
+import numpy as np
+
+from . import lis
+from . import pyATP as _atp
+from .pyATP import format_value
+from .scheduler import ATPScheduler
+
+__all__ = ['grid', 'zipped', 'latin_hypercube', 'format_value',
+           'run_sweep', 'SweepResults']
+
+
+def _items(values):
+    return list(values.items()) if hasattr(values, 'items') else list(values)
+
+
+def grid(values):
+    '''
+    Points of the Cartesian product of the values of each parameter. values
+    is an OrderedDict or a list of (name, sequence of values); the last
+    parameter varies fastest.
+    '''
+    items = _items(values)
+    names = [name for name, _ in items]
+    product = list(itertools.product(*[v for _, v in items]))
+    return OrderedDict((name, np.array([p[k] for p in product]))
+                       for k, name in enumerate(names))
+
+
+def zipped(values):
+    ''' Points taking the kth value of every parameter for the kth point. The
+        sequences of values must have the same length. '''
+    items = _items(values)
+    if len(set(len(v) for _, v in items)) > 1:
+        raise ValueError('Zipped parameters need the same number of values')
+    return OrderedDict((name, np.asarray(v)) for name, v in items)
+
+
+def latin_hypercube(ranges, n, seed=None):
+    '''
+    n points of a Latin hypercube sample of the (low, high) range of each
+    parameter: each range is split into n equal intervals and every interval
+    holds exactly one point, at a random position.
+    '''
+    rng = np.random.RandomState(seed)
+    points = OrderedDict()
+    for name, (low, high) in _items(ranges):
+        u = (rng.permutation(n) + rng.uniform(size=n)) / n
+        points[name] = low + u * (high - low)
+    return points
+
+
+class SweepResults(object):
+    '''
+    Table of the results of a sweep, one row per point. points holds the
+    values of the parameters of each point. node_voltages and
+    branch_currents are (n_points, n) complex arrays of the voltages of the
+    nodes node_names and the currents of the branches branch_names, NaN for
+    points whose run failed. ok tells which runs succeeded and errors maps
+    the index of each failed point to its error message.
+    '''
+    def __init__(self, points, node_names=(), branch_names=()):
+        self.points = OrderedDict((name, np.asarray(v))
+                                  for name, v in _items(points))
+        n = len(self)
+        self.node_names = list(node_names)
+        self.branch_names = [tuple(b) for b in branch_names]
+        self.node_voltages = np.full((n, len(self.node_names)),
+                                     complex(np.nan, np.nan))
+        self.branch_currents = np.full((n, len(self.branch_names)),
+                                       complex(np.nan, np.nan))
+        self.ok = np.zeros(n, dtype=bool)
+        self.errors = {}
+
+    def __len__(self):
+        for v in self.points.values():
+            return len(v)
+        return 0
+
+    def point(self, k):
+        ''' {parameter name: value} of point k. '''
+        return OrderedDict((name, v[k]) for name, v in self.points.items())
+
+    @classmethod
+    def concatenate(cls, tables):
+        ''' One table of the rows of all tables, which must have the same
+            parameters, nodes and branches. '''
+        tables = list(tables)
+        first = tables[0]
+        points = [(name, np.concatenate([t.points[name] for t in tables]))
+                  for name in first.points]
+        rtn = cls(points, first.node_names, first.branch_names)
+        rtn.node_voltages[:] = np.concatenate([t.node_voltages
+                                               for t in tables])
+        rtn.branch_currents[:] = np.concatenate([t.branch_currents
+                                                 for t in tables])
+        rtn.ok[:] = np.concatenate([t.ok for t in tables])
+        offset = 0
+        for t in tables:
+            rtn.errors.update((k + offset, e) for k, e in t.errors.items())
+            offset += len(t)
+        return rtn
+
+    def save(self, filename):
+        ''' Save the table to the NPZ file filename. '''
+        data = {'parameters': np.array(list(self.points), dtype='U'),
+                'node_names': np.array(self.node_names, dtype='U'),
+                'branch_names': np.array(self.branch_names,
+                                         dtype='U').reshape(-1, 2),
+                'node_voltages': self.node_voltages,
+                'branch_currents': self.branch_currents,
+                'ok': self.ok,
+                'error_index': np.array(sorted(self.errors), dtype=np.int64),
+                'error_message': np.array([self.errors[k] for k in
+                                           sorted(self.errors)], dtype='U')}
+        for k, v in enumerate(self.points.values()):
+            data['point_%d' % k] = v
+        with open(filename, 'wb') as f:
+            np.savez(f, **data)
+        return filename
+
+    @classmethod
+    def load(cls, filename):
+        ''' Read a table saved with save. '''
+        with np.load(filename) as data:
+            points = [(name, data['point_%d' % k])
+                      for k, name in enumerate(data['parameters'].tolist())]
+            rtn = cls(points, data['node_names'].tolist(),
+                      data['branch_names'].tolist())
+            rtn.node_voltages[:] = data['node_voltages']
+            rtn.branch_currents[:] = data['branch_currents']
+            rtn.ok[:] = data['ok']
+            rtn.errors = dict(zip(data['error_index'].tolist(),
+                                  data['error_message'].tolist()))
+        return rtn
+
+
+def _extractor(nodes, branches, scale):
+    ''' Parser for ATPScheduler returning the voltages of nodes and the
+        currents of branches from the LIS file of a run. '''
+    def extract(run):
+        LIS_file = _atp.lis_filename(run.ATP_file)
+        if not os.path.exists(LIS_file):
+            raise RuntimeError('ATP failed with return code %s and wrote no '
+                               'LIS file' % run.returncode)
+        arrays = lis.read_SS_arrays(LIS_file)
+        if arrays is None:
+            raise RuntimeError('Steady-state phasor solution not found')
+        v = arrays.node_voltage_array(nodes) if nodes else []
+        i = arrays.branch_current_array(branches) if branches else []
+        return np.multiply(v, scale), np.multiply(i, scale)
+    return extract
+
+
+def _template_setup(template, name, include_dir):
+    ''' The ATPDeckTemplate of template, and the deck name and include
+        directory of its runs, by default those of the template file. '''
+    if not isinstance(template, _atp.ATPDeckTemplate):
+        template = _atp.ATPDeckTemplate(template)
+    if name is None:
+        name = os.path.basename(template.ATP_file or 'sweep.atp')
+    if include_dir is None and template.ATP_file:
+        include_dir = os.path.dirname(os.path.abspath(template.ATP_file))
+    return template, name, include_dir
+
+
+def _renderer(template, points, fields, formats):
+    ''' Function of k returning the deck of point k of points. '''
+    fields = dict((p, p) for p in points) if fields is None else fields
+    formats = formats or {}
+
+    def render(k):
+        values = {}
+        for p in points:
+            key = fields[p]
+            fmt = formats.get(p, format_value)
+            values[key] = fmt(points[p][k], len(key))
+        return template.render(values)
+    return render
+
+
+def run_sweep(template, points, fields=None, nodes=(), branches=(),
+              scheduler=None, formats=None, RMS_scale=False, name=None,
+              include_dir=None, ahead=None):
+    '''
+    Run the deck template (an ATPDeckTemplate or the name of an ATP file) at
+    every point of points and return the SweepResults of the node voltages
+    of nodes and branch currents of branches.
+
+    fields maps parameter names to the placeholder keys they replace in the
+    deck, by default the parameter name itself. formats maps parameter
+    names to functions of (value, width) returning the text of a field, by
+    default format_value. Runs are made by scheduler, or by a new
+    ATPScheduler with one worker per CPU, in decks named name (the name of
+    the template by default) with includes from include_dir (the directory
+    of the template by default). At most ahead decks (twice the number of
+    workers by default) are rendered and queued at a time.
+    '''
+    template, name, include_dir = _template_setup(template, name,
+                                                  include_dir)
+    results = SweepResults(points, nodes, branches)
+    render = _renderer(template, results.points, fields, formats)
+    extract = _extractor(results.node_names, results.branch_names,
+                         1. / sqrt(2) if RMS_scale else 1.)
+
+    own_scheduler = scheduler is None
+    if own_scheduler:
+        scheduler = ATPScheduler()
+    if ahead is None:
+        ahead = 2 * scheduler.workers
+
+    def submit(k):
+        return scheduler.submit(deck=render(k), name=name,
+                                include_dir=include_dir, parse=extract)
+
+    def store(k, future):
+        try:
+            v, i = future.result()
+        except Exception as e:
+            results.errors[k] = _error_message(e)
+            return
+        results.node_voltages[k] = v
+        results.branch_currents[k] = i
+        results.ok[k] = True
+
+    try:
+        _run_bounded(len(results), submit, store, ahead)
+    finally:
+        if own_scheduler:
+            scheduler.shutdown()
+    return results
+
+
+def _error_message(e):
+    return '%s: %s' % (type(e).__name__, e)
+
+
+def _run_bounded(n, submit, store, ahead):
+    ''' Calls submit(k) for k in range(n), keeping at most ahead of the
+        returned futures pending, and store(k, future) as each completes. '''
+    pending = {}
+    for k in range(n):
+        if len(pending) >= ahead:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                store(pending.pop(future), future)
+        pending[submit(k)] = k
+    for future in list(pending):
+        store(pending.pop(future), future)
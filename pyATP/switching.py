@@ -0,0 +1,332 @@
+'''
+Statistical switching studies.
+
+An overvoltage distribution is estimated by running many cases of a deck
+with random closing times of the switches. run_switching_study renders the
+closing times into a deck template, runs the cases concurrently with an
+ATPScheduler, reads the peak value of each selected PL4 variable of every
+case, and folds the peaks into streaming sketches instead of keeping them:
+
+    study = run_switching_study(
+        'energize.atp', [('TCLA', (0.02, 0.001)), ('TCLB', (0.02, 0.001)),
+                         ('TCLC', (0.02, 0.001))],
+        ['RECA', 'RECB', 'RECC'], 2000, base=400e3*sqrt(2./3))
+    study.overvoltage(0.02)     # 2% overvoltage of each node, in per unit
+
+P2Quantile tracks a few chosen quantiles exactly as the P-square algorithm
+does, with five markers per quantile and variable. StreamingHistogram keeps
+a fixed number of bins whose width doubles as needed to cover the largest
+peak, for any other quantile or exceedance probability. Memory use depends
+on the number of variables, not on the number of cases.
+'''
+
+from __future__ import print_function, unicode_literals
+
+from collections import OrderedDict
+import os
+
+import numpy as np
+
+from . import compression
+from . import pyATP as _atp
+from .pl4 import PL4File
+from .scheduler import ATPScheduler
+from .sweep import _items, _error_message, _renderer, _run_bounded, \
+    _template_setup
+from .transient import iter_chunks
+
+__all__ = ['random_close_times', 'P2Quantile', 'StreamingHistogram',
+           'SwitchingStudy', 'run_switching_study']
+
+
+def random_close_times(switches, n, f0=60., window=None, seed=None):
+    '''
+    Closing times of n cases for the switches, a list of (name, (mean,
+    std)). Each case shifts all switches by a common time drawn uniformly
+    over window (one cycle of f0 by default), then each pole closes at its
+    mean time plus this shift plus a normally distributed scatter of
+    standard deviation std. Times below zero are set to zero. Returns an
+    OrderedDict of {name: array of n times}, as the points of a sweep.
+    '''
+    if window is None:
+        window = 1. / f0
+    rng = np.random.RandomState(seed)
+    items = _items(switches)
+    shift = rng.uniform(0., window, n)
+    scatter = rng.standard_normal((len(items), n))
+    return OrderedDict((name, np.maximum(mean + shift + std * scatter[k], 0.))
+                       for k, (name, (mean, std)) in enumerate(items))
+
+
+class P2Quantile(object):
+    '''
+    Streaming estimate of the quantiles probabilities of n_streams variables
+    observed together, with the P-square algorithm of Jain and Chlamtac
+    (1985). Each update takes one value of every variable; the estimate of
+    each quantile and variable is held by five markers, updated for all
+    quantiles and variables at once.
+    '''
+    def __init__(self, probabilities, n_streams):
+        self.probabilities = np.atleast_1d(
+            np.asarray(probabilities, dtype=np.float64))
+        self.n_streams = n_streams
+        self.count = 0
+        p = self.probabilities[:, np.newaxis]
+        shape = (len(self.probabilities), n_streams, 5)
+        self._heights = np.zeros(shape)
+        self._positions = np.zeros(shape)
+        self._desired = np.hstack([np.ones_like(p), 1 + 2*p, 1 + 4*p,
+                                   3 + 2*p, np.full_like(p, 5.)])
+        self._increments = np.hstack([np.zeros_like(p), p/2, p, (1 + p)/2,
+                                      np.ones_like(p)])
+        self._first = []
+
+    def update(self, x):
+        ''' Adds the n_streams values x. '''
+        x = np.asarray(x, dtype=np.float64).reshape(self.n_streams)
+        self.count += 1
+        if self.count <= 5:
+            self._first.append(x)
+            if self.count == 5:
+                self._heights[:] = np.sort(self._first, axis=0).T
+                self._positions[:] = np.arange(1., 6.)
+                self._desired = self._desired[:, np.newaxis, :].repeat(
+                    self.n_streams, axis=1)
+                self._first = None
+            return
+
+        q, n = self._heights, self._positions
+        x = np.broadcast_to(x, q.shape[:2])
+        np.minimum(q[..., 0], x, out=q[..., 0])
+        np.maximum(q[..., 4], x, out=q[..., 4])
+        # Cell of x between the markers, 0 to 3
+        k = (x[..., np.newaxis] >= q[..., 1:4]).sum(axis=-1)
+        n += np.arange(5) > k[..., np.newaxis]
+        self._desired += self._increments[:, np.newaxis, :]
+
+        for i in (1, 2, 3):
+            d = self._desired[..., i] - n[..., i]
+            up = (d >= 1) & (n[..., i + 1] - n[..., i] > 1)
+            down = (d <= -1) & (n[..., i - 1] - n[..., i] < -1)
+            move = up | down
+            if not move.any():
+                continue
+            s = np.where(up, 1., -1.)
+            qm, qi, qp = q[..., i - 1], q[..., i], q[..., i + 1]
+            nm, ni, np_ = n[..., i - 1], n[..., i], n[..., i + 1]
+            parabolic = qi + s / (np_ - nm) * (
+                (ni - nm + s) * (qp - qi) / (np_ - ni) +
+                (np_ - ni - s) * (qi - qm) / (ni - nm))
+            linear = qi + s * (np.where(up, qp, qm) - qi) \
+                / (np.where(up, np_, nm) - ni)
+            new = np.where((qm < parabolic) & (parabolic < qp), parabolic,
+                           linear)
+            q[..., i] = np.where(move, new, qi)
+            n[..., i] += np.where(move, s, 0.)
+
+    def quantiles(self):
+        ''' (n_probabilities, n_streams) array of the estimated quantiles,
+            NaN before the first update. '''
+        if self.count == 0:
+            return np.full(self._heights.shape[:2], np.nan)
+        if self.count < 5:
+            return np.percentile(self._first, 100 * self.probabilities,
+                                 axis=0)
+        return self._heights[..., 2].copy()
+
+
+class StreamingHistogram(object):
+    '''
+    Histogram of n_bins bins from zero of non-negative values of n_streams
+    variables observed together. The bin width of each variable is set by
+    its first positive value, and doubled, merging pairs of bins, whenever a
+    value is beyond the last bin. The resolution is thus always between
+    1/n_bins and 2/n_bins of the largest value.
+    '''
+    def __init__(self, n_streams, n_bins=512):
+        if n_bins % 2:
+            raise ValueError('The number of bins must be even')
+        self.n_streams = n_streams
+        self.n_bins = n_bins
+        self.count = 0
+        self.counts = np.zeros((n_streams, n_bins), dtype=np.int64)
+        self.width = np.zeros(n_streams)
+
+    @property
+    def edges(self):
+        ''' (n_streams, n_bins + 1) array of the bin edges. '''
+        return np.arange(self.n_bins + 1) * self.width[:, np.newaxis]
+
+    def update(self, x):
+        ''' Adds the n_streams values x. '''
+        x = np.asarray(x, dtype=np.float64).reshape(self.n_streams)
+        if (x < 0).any():
+            raise ValueError('Histogram values must not be negative')
+        first = (self.width == 0) & (x > 0)
+        self.width[first] = x[first] * 2 / self.n_bins
+        while True:
+            over = (self.width > 0) & (x >= self.width * self.n_bins)
+            if not over.any():
+                break
+            merged = self.counts[over].reshape(
+                -1, self.n_bins // 2, 2).sum(axis=-1)
+            self.counts[over] = np.hstack([merged, np.zeros_like(merged)])
+            self.width[over] *= 2
+        width = np.where(self.width > 0, self.width, 1.)
+        k = np.where(self.width > 0, x // width, 0).astype(np.int64)
+        self.counts[np.arange(self.n_streams), k] += 1
+        self.count += 1
+
+    def quantile(self, p):
+        ''' (n_streams,) quantile p of the values, interpolated linearly
+            within its bin. '''
+        target = p * self.count
+        cum = self.counts.cumsum(axis=1)
+        k = np.minimum((cum < target).sum(axis=1), self.n_bins - 1)
+        rows = np.arange(self.n_streams)
+        below = np.where(k > 0, cum[rows, k - 1], 0)
+        in_bin = self.counts[rows, k]
+        frac = np.where(in_bin > 0, (target - below) / np.maximum(in_bin, 1),
+                        0.)
+        return (k + frac) * self.width
+
+    def exceedance(self, level):
+        ''' (n_streams,) fraction of the values above level, which may be a
+            scalar or one level per variable. '''
+        level = np.broadcast_to(np.asarray(level, dtype=np.float64),
+                                (self.n_streams,))
+        width = np.where(self.width > 0, self.width, np.inf)
+        pos = np.minimum(level / width, self.n_bins)
+        k = np.minimum(np.floor(pos).astype(np.int64), self.n_bins - 1)
+        rows = np.arange(self.n_streams)
+        cum = self.counts.cumsum(axis=1)
+        below = np.where(k > 0, cum[rows, k - 1], 0) \
+            + self.counts[rows, k] * (pos - k)
+        return 1. - below / max(self.count, 1)
+
+
+class SwitchingStudy(object):
+    '''
+    Running statistics of the peaks of the variables keys over the cases of
+    a statistical switching study. quantiles is a P2Quantile of the
+    probabilities and histogram a StreamingHistogram of n_bins bins.
+    peak_max is the largest peak of each variable, worst_case the index of
+    the case it occurred in and worst_times the closing times of that case.
+    Failed cases are counted in n_failed and the messages of the first
+    max_errors are kept in errors, by case index.
+    '''
+    def __init__(self, keys, switches, probabilities=(0.5, 0.9, 0.98),
+                 n_bins=512, max_errors=100):
+        self.keys = list(keys)
+        self.switches = list(switches)
+        n = len(self.keys)
+        self.quantiles = P2Quantile(probabilities, n)
+        self.histogram = StreamingHistogram(n, n_bins)
+        self.peak_max = np.full(n, -np.inf)
+        self.worst_case = np.full(n, -1, dtype=np.int64)
+        self.worst_times = OrderedDict((s, np.full(n, np.nan))
+                                       for s in self.switches)
+        self.n_cases = 0
+        self.n_failed = 0
+        self.errors = {}
+        self.max_errors = max_errors
+
+    def add(self, k, peaks, times):
+        ''' Folds the peaks of case k, run with the closing times times, a
+            {switch: time} mapping, into the statistics. '''
+        peaks = np.asarray(peaks, dtype=np.float64)
+        self.quantiles.update(peaks)
+        self.histogram.update(peaks)
+        worse = peaks > self.peak_max
+        self.peak_max[worse] = peaks[worse]
+        self.worst_case[worse] = k
+        for s in self.switches:
+            self.worst_times[s][worse] = times[s]
+        self.n_cases += 1
+
+    def add_error(self, k, message):
+        ''' Records the failure of case k. '''
+        self.n_failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors[k] = message
+
+    def overvoltage(self, probability=0.02):
+        '''
+        (n_keys,) peak value exceeded with the given probability in a case,
+        the 2% statistical overvoltage by default. The P-square estimate is
+        used if 1 - probability is one of the tracked quantiles, otherwise
+        the histogram.
+        '''
+        match = np.isclose(self.quantiles.probabilities, 1 - probability)
+        if match.any():
+            return self.quantiles.quantiles()[np.argmax(match)]
+        return self.histogram.quantile(1 - probability)
+
+
+def _peak_extractor(keys, scale):
+    ''' Parser for ATPScheduler returning the largest absolute value of the
+        PL4 variables keys of a run. '''
+    def extract(run):
+        PL4_file = compression.find_file(_atp.atp_basename(run.ATP_file) +
+                                         '.pl4')
+        if not os.path.exists(PL4_file):
+            raise RuntimeError('ATP failed with return code %s and wrote no '
+                               'PL4 file' % run.returncode)
+        peaks = np.zeros(len(keys))
+        with PL4File(PL4_file) as pl4:
+            if pl4.steps == 0:
+                raise RuntimeError('%s holds no time steps' % PL4_file)
+            for _, _, x in iter_chunks(pl4, keys):
+                np.maximum(peaks, np.abs(x).max(axis=0), out=peaks)
+        return peaks * scale
+    return extract
+
+
+def run_switching_study(template, switches, keys, n_cases, fields=None,
+                        f0=60., window=None, base=1.,
+                        probabilities=(0.5, 0.9, 0.98), n_bins=512,
+                        scheduler=None, formats=None, name=None,
+                        include_dir=None, ahead=None, seed=None):
+    '''
+    Runs n_cases cases of the deck template (an ATPDeckTemplate or the name
+    of an ATP file) with the closing times of random_close_times(switches,
+    n_cases, f0, window, seed) and returns the SwitchingStudy of the peaks
+    of the PL4 variables keys (as selected by PL4File.__getitem__), divided
+    by base (a scalar or one base per key).
+
+    fields maps switch names to the placeholder keys of their closing times
+    in the deck, by default the switch name itself. formats, scheduler,
+    name, include_dir and ahead are as for run_sweep. Only the peaks of the
+    cases are kept, and they are folded into the study as the cases finish.
+    '''
+    template, name, include_dir = _template_setup(template, name,
+                                                  include_dir)
+    times = random_close_times(switches, n_cases, f0, window, seed)
+    study = SwitchingStudy(keys, times, probabilities, n_bins)
+    render = _renderer(template, times, fields, formats)
+    extract = _peak_extractor(study.keys, 1. / np.asarray(base))
+
+    own_scheduler = scheduler is None
+    if own_scheduler:
+        scheduler = ATPScheduler()
+    if ahead is None:
+        ahead = 2 * scheduler.workers
+
+    def submit(k):
+        return scheduler.submit(deck=render(k), name=name,
+                                include_dir=include_dir, parse=extract)
+
+    def store(k, future):
+        try:
+            peaks = future.result()
+        except Exception as e:
+            study.add_error(k, _error_message(e))
+            return
+        study.add(k, peaks, dict((s, t[k]) for s, t in times.items()))
+
+    try:
+        _run_bounded(n_cases, submit, store, ahead)
+    finally:
+        if own_scheduler:
+            scheduler.shutdown()
+    return study
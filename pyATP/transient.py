@@ -0,0 +1,243 @@
+'''
+Processing of transient simulation results, such as those read from PL4 files
+with PL4File. Functions work through the signals in chunks of time steps so
+that memory use is bounded no matter how long the simulation is.
+'''
+
+from __future__ import print_function, unicode_literals
+
+from collections import namedtuple
+from math import sqrt
+
+import numpy as np
+
+from .pl4 import PL4File
+
+__all__ = ['Envelope', 'envelope', 'iter_chunks', 'sliding_phasors',
+           'get_transient_phasors']
+
+Envelope = namedtuple('Envelope', ['time', 'min', 'max', 'mean',
+                                   'peak', 'peak_time', 'keys'])
+Envelope.__doc__ = ''' Result of envelope. time holds the start time of each
+    bin and min, max and mean are (n_bins, n_signals) arrays. peak is the
+    value of largest magnitude of each signal over the whole simulation, with
+    its sign, and peak_time the time it occurred. keys lists the signals in
+    column order. '''
+
+
+def _columns(source, keys):
+    ''' Returns (n_steps, keys, read(a, b, sel)) where read returns the time
+        vector and the (b - a, n_signals) values of rows a to b, or only of
+        the signals selected by the slice sel. '''
+    every = slice(None)
+    if isinstance(source, PL4File):
+        if keys is None:
+            keys = list(range(source.nvar))
+        cols = np.array([source.index(k) + 1 for k in keys], dtype=np.intp)
+        data = source.data
+        whole = cols.tolist() == list(range(1, source.nvar + 1))
+
+        def read(a, b, sel=every):
+            rows = data[a:b]
+            return rows[:, 0], rows[:, slice(1, None) if whole and
+                                    sel == every else cols[sel]]
+        return source.steps, keys, read
+
+    time, values = source
+    values = np.asarray(values)
+    if values.ndim == 1:
+        values = values[:, np.newaxis]
+    if keys is None:
+        keys = list(range(values.shape[1]))
+        cols = np.arange(values.shape[1])
+        whole = True
+    else:
+        cols = np.asarray(keys)
+        whole = False
+
+    def read(a, b, sel=every):
+        return np.asarray(time[a:b]), values[a:b, every if whole and
+                                             sel == every else cols[sel]]
+    return len(time), keys, read
+
+
+def iter_chunks(source, keys=None, chunk_steps=65536):
+    '''
+    Generator of (first_step, time, values) chunks of at most chunk_steps time
+    steps. source is a PL4File, in which case keys selects variables as in
+    PL4File.__getitem__, or a (time, values) tuple of arrays, in which case
+    keys are column numbers of values. keys=None selects all signals.
+    '''
+    n_steps, keys, read = _columns(source, keys)
+    for a in range(0, n_steps, chunk_steps):
+        t, x = read(a, min(a + chunk_steps, n_steps))
+        yield a, t, np.asarray(x, dtype=np.float64)
+
+
+def envelope(source, keys=None, n_bins=1000, chunk_steps=65536):
+    '''
+    Streaming min/max/mean decimation of transient signals into n_bins bins
+    of (nearly) equal numbers of time steps, plus the global peak of each
+    signal and its time. source and keys are as for iter_chunks.
+
+    The signals are read chunk_steps time steps at a time, so memory use is
+    proportional to chunk_steps * n_signals + n_bins * n_signals and run time
+    is linear in the number of time steps. Returns an Envelope.
+    '''
+    n_steps, keys, _ = _columns(source, keys)
+    n_sig = len(keys)
+    n_bins = max(1, min(n_bins, n_steps))
+    edges = np.linspace(0, n_steps, n_bins + 1).astype(np.int64)
+    bin_time = np.zeros(n_bins)
+    b_min = np.full((n_bins, n_sig), np.inf)
+    b_max = np.full((n_bins, n_sig), -np.inf)
+    b_sum = np.zeros((n_bins, n_sig))
+    peak = np.zeros(n_sig)
+    peak_time = np.zeros(n_sig)
+
+    for a, t, x in iter_chunks(source, keys, chunk_steps):
+        b = a + len(t)
+        # Bins starting within the chunk, plus the bin continuing into it
+        first_bin = np.searchsorted(edges, a, side='right') - 1
+        inner = edges[(edges > a) & (edges < b)]
+        starts = np.concatenate(([0], inner - a))
+        bins = first_bin + np.arange(len(starts))
+        b_min[bins] = np.minimum(b_min[bins],
+                                 np.minimum.reduceat(x, starts, axis=0))
+        b_max[bins] = np.maximum(b_max[bins],
+                                 np.maximum.reduceat(x, starts, axis=0))
+        b_sum[bins] += np.add.reduceat(x, starts, axis=0)
+        starting = (edges[:-1] >= a) & (edges[:-1] < b)
+        bin_time[starting] = t[edges[:-1][starting] - a]
+
+        k = np.argmax(np.abs(x), axis=0)
+        chunk_peak = x[k, np.arange(n_sig)]
+        better = np.abs(chunk_peak) > np.abs(peak)
+        peak[better] = chunk_peak[better]
+        peak_time[better] = t[k[better]]
+
+    counts = np.diff(edges)[:, np.newaxis]
+    return Envelope(bin_time, b_min, b_max, b_sum / counts, peak, peak_time,
+                    keys)
+
+
+def _window_length(t, f0):
+    ''' Number of time steps in one cycle of f0 and the time step, from the
+        first two values of the time vector t. '''
+    if len(t) < 2:
+        raise ValueError('At least two time steps are needed')
+    deltat = float(t[1]) - float(t[0])
+    return int(round(1. / (f0 * deltat))), deltat
+
+
+def sliding_phasors(source, f0=60., keys=None, harmonic=1, step=None,
+                    start=0, stop=None, chunk_bytes=2**26):
+    '''
+    Phasors of transient signals over sliding one-cycle windows, computed with
+    a DFT of every window of every signal in one batched FFT. source and keys
+    are as for iter_chunks. The signals must have a constant time step.
+
+    f0 is the fundamental frequency. harmonic is the harmonic number, or a
+    sequence of them, of the phasors to return (0 gives the DC component).
+    Windows of one cycle start every step time steps (one cycle by default)
+    from time step start, and all end before time step stop.
+
+    Phasors are peak values with the cosine as reference and angles measured
+    from time zero, as in the ATP steady-state solution, so a steady sinusoid
+    gives the same phasor in every window. Returns (time, phasors) where time
+    is the time at the end of each window and phasors has shape
+    (n_windows, n_signals), or (n_windows, n_harmonics, n_signals) when
+    harmonic is a sequence.
+
+    Windows are transformed a chunk at a time, with as many windows and
+    signals as fit in about chunk_bytes of float64 samples, so memory use
+    does not grow with the window length or the number of signals. When one
+    window of every signal does not fit, the signals are taken in blocks.
+    '''
+    n_steps, keys, read = _columns(source, keys)
+    N, deltat = _window_length(read(0, 2)[0], f0)
+    h = np.atleast_1d(harmonic)
+    if N < 2 or (h < 0).any() or (h > N // 2).any():
+        raise ValueError('Harmonics must be between 0 and %d for a window of '
+                         '%d time steps' % (N // 2, N))
+    step = N if step is None else step
+    stop = n_steps if stop is None else min(stop, n_steps)
+    starts = np.arange(start, stop - N + 1, step)
+    # Frequency of each DFT bin, which differs slightly from h*f0 when a
+    # cycle is not a whole number of time steps
+    omega = 2*np.pi * h / (N * deltat)
+    scale = np.where(h == 0, 1. / N, 2. / N)
+
+    n_sig = len(keys)
+    block = max(1, min(n_sig, chunk_bytes // (8*N)))
+    # Rows read per window, which exceed N when windows are spaced apart
+    span = max(N, step)
+    chunk_windows = max(1, chunk_bytes // (8*span*block))
+
+    time = np.empty(len(starts))
+    phasors = np.empty((len(starts), len(h), n_sig), dtype=complex)
+    for c in range(0, n_sig, block):
+        sel = slice(c, c + block)
+        for i in range(0, len(starts), chunk_windows):
+            s = starts[i:i + chunk_windows]
+            a = s[0]
+            t, x = read(a, s[-1] + N, sel)
+            x = np.asarray(x, dtype=np.float64)
+            windows = x[(s - a)[:, np.newaxis] + np.arange(N)]
+            X = np.fft.rfft(windows, axis=1)[:, h, :]
+            t0 = np.asarray(t[s - a], dtype=np.float64)
+            rot = scale * np.exp(-1j * np.outer(t0, omega))
+            phasors[i:i + len(s), :, sel] = X * rot[:, :, np.newaxis]
+            time[i:i + len(s)] = t[s - a + N - 1]
+
+    if np.ndim(harmonic) == 0:
+        phasors = phasors[:, 0, :]
+    return time, phasors
+
+
+def get_transient_phasors(pl4, f0=60., at=None, harmonic=1,
+                          RMS_scale=False):
+    '''
+    Phasors of all node voltages and branch currents of a PL4File from the
+    one-cycle window ending at time at (the end of the simulation by
+    default). Results are returned in the same structure as get_SS_results:
+
+        ({<Node Name>: <Node Voltage>},
+         {(<From Node>, <To Node>): <Branch Current>})
+
+    Each branch current is also given from its to node, negated, as in the
+    LIS file, and branches to ground have 'TERRA' as their to node. The
+    tuple can be passed as the LIS_file argument of process_SS_bus_voltages
+    and process_SS_branch_currents. Phasors are peak values unless
+    RMS_scale is True. Other variable types are ignored. harmonic is a
+    single harmonic number; ValueError is raised for a sequence.
+    '''
+    if np.ndim(harmonic) != 0:
+        raise ValueError('harmonic must be a single harmonic number')
+    if not isinstance(pl4, PL4File):
+        pl4 = PL4File(pl4)
+    cols = [k for k, v in enumerate(pl4.variables) if v.type in (4, 9)]
+    if at is None:
+        stop = pl4.steps
+    else:
+        stop = int(np.searchsorted(pl4.time, at, side='right'))
+    N, _ = _window_length(pl4.time[:2], f0)
+    if stop < N:
+        raise ValueError('Less than one cycle of results before t = %g' %
+                         (pl4.time[stop - 1] if stop else 0.))
+    _, ph = sliding_phasors(pl4, f0, cols, harmonic, start=stop - N,
+                            stop=stop)
+    ph = ph[0] / sqrt(2) if RMS_scale else ph[0]
+
+    node_voltages = {}
+    branch_currents = {}
+    for k, value in zip(cols, ph.tolist()):
+        v = pl4.variables[k]
+        # The first of repeated variables is kept, as in PL4File.index
+        if v.type == 4:
+            node_voltages.setdefault(v.from_node, value)
+        else:
+            to_node = v.to_node or 'TERRA'
+            branch_currents.setdefault((v.from_node, to_node), value)
+            branch_currents.setdefault((to_node, v.from_node), -value)
+    return node_voltages, branch_currents
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_adaptive
+----------------------------------
+
+Tests for `pyATP.adaptive` module.
+"""
+from __future__ import print_function, unicode_literals
+
+from concurrent.futures import Future
+import re
+
+import pytest
+
+import numpy as np
+
+import pyATP
+
+
+class FunctionScheduler(object):
+    """ Stands in for an ATPScheduler: the "node voltage" of a run is the
+        function f of the X and Y fields of the deck. """
+    workers = 4
+
+    def __init__(self, f):
+        self.f = f
+        self.runs = 0
+
+    def submit(self, deck, name, include_dir, parse):
+        self.runs += 1
+        future = Future()
+        try:
+            x, y = [float(v) for v in re.findall(r'=\s*(\S+)', deck)]
+        except ValueError as e:
+            future.set_exception(e)
+        else:
+            future.set_result((np.array([self.f(x, y)]), np.array([])))
+        return future
+
+
+template = pyATP.ATPDeckTemplate(deck='C X=XXXXXXXXXX Y=YYYYYYYYYY\n')
+ranges = [('X', (0., 1.)), ('Y', (0., 1.))]
+fields = {'X': 'XXXXXXXXXX', 'Y': 'YYYYYYYYYY'}
+
+
+def test_surrogate():
+    x = pyATP.latin_hypercube(ranges, 30, seed=0)
+    x = np.column_stack(list(x.values())) * [2., 1.] + [1., 0.]
+    y = np.column_stack([np.sin(x[:, 0]) + x[:, 1], x[:, 1]**2])
+    gp = pyATP.GPSurrogate(x, y, [(1., 3.), (0., 1.)])
+    mean, std = gp.predict(x)
+    np.testing.assert_allclose(mean, y, atol=1e-3)
+    assert (std < 1e-2).all()
+
+    u = np.array([[2., 0.5], [1.5, 0.25]])
+    mean, std, grad = gp.predict(u, gradient=True)
+    np.testing.assert_allclose(mean[:, 0], np.sin(u[:, 0]) + u[:, 1],
+                               atol=1e-3)
+    # Gradient in unit cube coordinates
+    np.testing.assert_allclose(grad[:, :, 0], np.column_stack(
+        [2. * np.cos(u[:, 0]), np.ones(2)]), atol=2e-2)
+    assert std.shape == (2, 2)
+
+
+def response(v, i):
+    return v[0].real
+
+
+def test_adaptive_sweep_stops_at_tolerance():
+    scheduler = FunctionScheduler(lambda x, y: 0.3*x + 0.1*y)
+    results, gp = pyATP.adaptive_sweep(template, ranges, response, fields,
+                                       ['N'], scheduler=scheduler,
+                                       max_runs=100, tol=0.01, seed=1)
+    assert len(results) == scheduler.runs < 20
+    assert results.ok.all()
+    x = np.random.RandomState(2).uniform(size=(100, 2))
+    np.testing.assert_allclose(gp.predict(x)[0][:, 0],
+                               0.3*x[:, 0] + 0.1*x[:, 1], atol=0.01)
+
+
+def test_adaptive_sweep_refines_steep_regions():
+    def f(x, y):
+        return np.tanh(20*(x - 0.5)) + 0.1*y
+    scheduler = FunctionScheduler(f)
+    results, gp = pyATP.adaptive_sweep(template, ranges, response, fields,
+                                       ['N'], scheduler=scheduler,
+                                       max_runs=40, seed=1)
+    assert len(results) == 40
+    x = results.points['X']
+    # More samples near the step than the 30% a uniform design would give
+    assert np.mean(abs(x - 0.5) < 0.15) > 0.4
+
+    # and a better fit than a Latin hypercube design of as many runs
+    lhs = pyATP.latin_hypercube(ranges, 40, seed=3)
+    lhs_gp = pyATP.GPSurrogate(np.column_stack([lhs['X'], lhs['Y']]),
+                               f(lhs['X'], lhs['Y']), [(0., 1.), (0., 1.)])
+    u = np.random.RandomState(5).uniform(size=(2000, 2))
+    exact = f(u[:, 0], u[:, 1])
+    err = np.abs(gp.predict(u)[0][:, 0] - exact).max()
+    assert err < np.abs(lhs_gp.predict(u)[0][:, 0] - exact).max()
+
+
+def test_adaptive_sweep_failed_runs():
+    scheduler = FunctionScheduler(lambda x, y: x)
+    with pytest.raises(RuntimeError):
+        pyATP.adaptive_sweep(template, ranges, response, fields, ['N'],
+                             scheduler=scheduler, seed=1,
+                             formats={'X': lambda v, w: 'bad'})
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_fakeatp
+----------------------------------
+
+Tests for `pyATP.fakeatp` module.
+"""
+from __future__ import print_function, unicode_literals
+
+import pytest
+
+import pyATP
+from pyATP import fakeatp
+
+
+line_const_case = """
+BEGIN NEW DATA CASE
+LINE CONSTANTS
+$ERASE
+BRANCH  IN___AOUT__AIN___BOUT__BIN___COUT__C
+ENGLISH
+  3  0.0   .1357 0   .3959    1.18      5.     42.     30.
+  1  0.0   .1357 0   .3959    1.18     -5.     49.     37.
+  2  0.0   .1357 0   .3959    1.18      5.     56.     44.
+  0  0.0   .6609 0   .4883    .551     -.5     65.     58.
+BLANK CARD ENDING CONDUCTOR CARDS
+     50.       60.           000001 001000 0    5.98     0        44
+$PUNCH
+BLANK CARD ENDING FREQUENCY CARDS
+BLANK CARD ENDING LINE CONSTANT
+BEGIN NEW DATA CASE
+BLANK CARD
+"""[1:]
+
+
+@pytest.fixture
+def fake(tmpdir):
+    previous = fakeatp.install(str(tmpdir), n_branches=20, n_switches=4)
+    yield tmpdir
+    pyATP.pyATP.ATP_path, pyATP.pyATP.ATP_exe = previous
+
+
+def test_SS_run(fake):
+    deck = fake.join('case.atp')
+    deck.write('BEGIN NEW DATA CASE\nC model\nBEGIN NEW DATA CASE\nBLANK\n')
+    assert pyATP.run_ATP(str(deck)) == 0
+    node_voltages, branch_currents = pyATP.get_SS_results(
+        pyATP.lis_filename(str(deck)))
+    assert len(node_voltages) == 40
+    assert len(branch_currents) == 2 * (20 + 4)
+
+    # Outputs are deterministic and depend on the deck
+    lis = fake.join('case.lis').read()
+    pyATP.run_ATP(str(deck))
+    assert fake.join('case.lis').read() == lis
+    deck.write('BEGIN NEW DATA CASE\nC model 2\nBEGIN NEW DATA CASE\n')
+    pyATP.run_ATP(str(deck))
+    assert fake.join('case.lis').read() != lis
+
+
+def test_batch_run(fake):
+    batch = pyATP.ATPBatch(['C case %d\n' % k for k in range(3)])
+    results = batch.run_SS(str(fake.join('batch.atp')))
+    assert len(results) == 3
+    assert dict(results[0].node_voltages) != dict(results[1].node_voltages)
+
+
+def test_line_constants_run(fake):
+    decks = [line_const_case, line_const_case.replace('IN___A', 'IN___X')]
+    batch = pyATP.ATPBatch(decks)
+    batch.write(str(fake.join('lc.atp')))
+    pyATP.run_ATP(str(fake.join('lc.atp')))
+    punched = pyATP.split_pch(str(fake.join('lc.pch')))
+    assert len(punched) == 2
+    assert punched[0] != punched[1]
+    assert ' 1IN___XOUT__A' in punched[1]
+    lines = punched[0].splitlines()
+    assert lines[0].startswith('C  <++++++>  Cards punched')
+    assert lines.index('$VINTAGE, 1') == 13
+    assert lines[15] == (' 1IN___AOUT__A' + ' '*12 + lines[15][26:])
+    assert len(lines[15]) == 26 + 3*16
+    assert [l[:2] for l in lines[15:21]] == [' 1', ' 2', '  ', ' 3', '  ',
+                                             '  ']
@@ -67,4 +67,26 @@ class TestPhToSeq:
         assert_round_equals(lineZ.seq_to_ph(lineZ.ph_to_seq(qty_ph)), qty_ph)
 
     def test_round_trip_seq(self, qty_seq, qty_ph):
-        assert_round_equals(lineZ.ph_to_seq(lineZ.seq_to_ph(qty_seq)), qty_seq)
\ No newline at end of file
+        assert_round_equals(lineZ.ph_to_seq(lineZ.seq_to_ph(qty_seq)), qty_seq)
+
+def test_stacked_criteria():
+    # Matrices of a stack give the same results as one by one
+    Z = np.array([Z_abc_BergenVittal, Z_abc_BergenVittal.T,
+                  np.diag([1., 1., 1.]) + 0.5j])
+    Y = 1e-6j*np.array([np.eye(3), 2*np.eye(3), np.ones((3, 3)) + np.eye(3)])
+    ABCD = lineZ.ZY_to_ABCD(Z, Y)
+    assert ABCD.shape == (3, 6, 6)
+    for f in (lineZ.impedance_imbalance, lineZ.neg_seq_unbalance_factor,
+              lineZ.zero_seq_unbalance_factor, lineZ.neg_seq_voltage):
+        assert f(Z).shape == (3,)
+    for k in range(3):
+        assert np.allclose(ABCD[k], lineZ.ZY_to_ABCD(Z[k], Y[k]))
+        assert np.allclose(lineZ.phase_impedances(Z)[k],
+                           lineZ.phase_impedances(Z[k]))
+        for f in (lineZ.impedance_imbalance, lineZ.neg_seq_unbalance_factor,
+                  lineZ.zero_seq_unbalance_factor, lineZ.neg_seq_voltage):
+            assert np.allclose(f(Z)[k], f(Z[k]))
+    assert np.allclose(lineZ.seq_impedances(Z[0]),
+                       lineZ.A_inv.dot(Z[0]).dot(lineZ.A))
+    # Balanced matrices have no imbalance
+    assert np.allclose(lineZ.impedance_imbalance(Z[2]), 0.)
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_pl4
+----------------------------------
+
+Tests for `pyATP.pl4` module.
+"""
+from __future__ import print_function, unicode_literals
+
+import pytest
+
+import numpy as np
+
+import pyATP
+
+
+variables = [(4, 'BUSA', ''), (4, 'BUSB', ''), (9, 'BUSA', 'BUSB'),
+             (8, 'BUSA', 'BUSB')]
+
+
+@pytest.fixture
+def pl4_data():
+    t = np.arange(1000) * 1e-5
+    data = np.column_stack([np.cos(2*np.pi*60*t + k) * (k + 1)
+                            for k in range(len(variables))])
+    return t, data
+
+
+@pytest.fixture
+def pl4_file(tmpdir, pl4_data):
+    f = str(tmpdir.join('test.pl4'))
+    pyATP.write_PL4(f, pl4_data[0], variables, pl4_data[1])
+    return f
+
+
+def test_header(pl4_file):
+    pl4 = pyATP.PL4File(pl4_file)
+    # Nothing is read until it is needed
+    assert pl4._header is None and pl4._data is None
+    assert pl4.nvar == 4
+    assert pl4.steps == 1000
+    assert pl4.deltat == pytest.approx(1e-5)
+    assert pl4._data is None
+    assert pl4.variables[2] == pyATP.PL4Variable(9, 'BUSA', 'BUSB')
+
+
+# Header and variable table of a PL4 file written by ATP for a node voltage
+# and a branch current, 3 steps of 50 us. Each variable record starts with
+# the type as a little-endian int32.
+atp_pl4_header = (
+    b'16-May-16  10:22:15  ' + b' '*19 +
+    b'\x17\xb7\x51\x38' + b'\x00'*4 +      # deltat = 5e-5 as float32
+    b'\x04\x00\x00\x00' + b'\x00'*4 +      # twice the number of variables
+    b'\x95\x00\x00\x00' + b'\x00'*20 +     # file size + 1
+    b'\x04\x00\x00\x00' b'BUSA  ' b'      ' +
+    b'\x09\x00\x00\x00' b'BUSA  ' b'LOADA ')
+
+
+def test_atp_header(tmpdir):
+    rows = np.array([[0., 1., -1.], [5e-5, 2., -2.], [1e-4, 3., -3.]],
+                    dtype='<f4')
+    f = tmpdir.join('atp.pl4')
+    f.write_binary(atp_pl4_header + rows.tobytes())
+    pl4 = pyATP.PL4File(str(f))
+    assert pl4.nvar == 2
+    assert pl4.steps == 3
+    assert pl4.deltat == pytest.approx(5e-5)
+    assert pl4.variables == [pyATP.PL4Variable(4, 'BUSA', ''),
+                             pyATP.PL4Variable(9, 'BUSA', 'LOADA')]
+    assert np.array_equal(pl4['BUSA', 'LOADA'], [-1., -2., -3.])
+    # write_PL4 writes the same variable table
+    g = str(tmpdir.join('written.pl4'))
+    pyATP.write_PL4(g, rows[:, 0], [('V', 'BUSA', ''), (9, 'BUSA', 'LOADA')],
+                    rows[:, 1:])
+    with open(g, 'rb') as written:
+        assert written.read()[80:] == f.read_binary()[80:]
+
+
+def test_columns(pl4_file, pl4_data):
+    t, data = pl4_data
+    with pyATP.PL4File(pl4_file) as pl4:
+        assert np.allclose(pl4.time, t)
+        assert np.allclose(pl4['BUSB'], data[:, 1], atol=1e-6)
+        assert np.allclose(pl4['BUSA', 'BUSB'], data[:, 2], atol=1e-6)
+        assert np.allclose(pl4['V-bran', 'BUSA', 'BUSB'], data[:, 3],
+                           atol=1e-6)
+        assert np.allclose(pl4[0], data[:, 0], atol=1e-6)
+        # Columns are views of the memory map, not copies
+        v = pl4['BUSA']
+        assert isinstance(v.base, np.memmap) or \
+            isinstance(v.base.base, np.memmap)
+        assert pl4.find('V') == [0, 1]
+        assert pl4.find(from_node='BUSA') == [0, 2, 3]
+        with pytest.raises(KeyError):
+            pl4['BUSC']
+
+
+def test_compressed(tmpdir, pl4_data):
+    import gzip
+    t, data = pl4_data
+    f = str(tmpdir.join('test.pl4'))
+    pyATP.write_PL4(f, t, variables, data)
+    with open(f, 'rb') as src, gzip.open(f + '.gz', 'wb') as dst:
+        dst.write(src.read())
+    pl4 = pyATP.PL4File(f + '.gz')
+    assert pl4.nvar == len(variables)
+    assert pl4.steps == len(t)
+    assert np.allclose(pl4['BUSA', 'BUSB'], data[:, 2])
+    assert np.array_equal(pl4.data, pyATP.PL4File(f).data)
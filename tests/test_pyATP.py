@@ -11,10 +11,16 @@ from __future__ import print_function, unicode_literals
 
 import pytest
 
+import io
 import os
+import sys
+import time
+
+import py
 
 
 import pyATP
+from pyATP import fakeatp
 import lineZ
 import numpy as np
 
@@ -161,4 +167,1008 @@ class TestParseCard:
 
     def test_ABCD(self, test_card, card_text, values_dict_list, Z, Y):
         test_card.read(card_text, read_all_or_none=False)
-        assert_round_equals(test_card.ABCD, lineZ.ZY_to_ABCD(Z, Y))
\ No newline at end of file
+        assert_round_equals(test_card.ABCD, lineZ.ZY_to_ABCD(Z, Y))
+
+@pytest.mark.parametrize("newline", ['\n', '\r\n'])
+def test_read_RLC(newline):
+    text = newline.join(tt_line_const_pch) + newline
+    RLC = pyATP.pch.read_RLC(text)
+    assert RLC.shape == (6, 3)
+    assert_round_equals(RLC, [[v['R'], v['L'], v['C']]
+                              for v in line_const_values])
+    params = pyATP.parse_line_params_pch(text, engine='numpy')
+    assert_round_equals(params.Z, line_const_Z_mat)
+    assert_round_equals(params.Y, line_const_Y_mat)
+    assert_round_equals(params.ABCD,
+                        lineZ.ZY_to_ABCD(line_const_Z_mat, line_const_Y_mat))
+
+
+def test_read_RLC_phases():
+    f = io.StringIO()
+    case = 'LINE CONSTANTS\nBRANCH\n' + ''.join(
+        '%3d\n' % (k + 1) for k in range(6)) + \
+        'BLANK CARD ENDING CONDUCTOR CARDS\n'
+    fakeatp.write_synthetic_pch(f, case, seed=3)
+    RLC = pyATP.pch.read_RLC(f.getvalue())
+    assert RLC.shape == (21, 3)
+    Z, Y = pyATP.pch.ZY_from_RLC(RLC)
+    assert Z.shape == Y.shape == (6, 6)
+    assert_round_equals(Z, Z.T)
+    r, c = np.tril_indices(6)
+    assert_round_equals(Z[r, c], RLC[:, 0] + 1j*RLC[:, 1])
+    assert_round_equals(Y[r, c], 1e-6j*RLC[:, 2])
+
+
+@pytest.mark.parametrize("old, new", [
+    ('$VINTAGE, 1', ''),
+    ('$VINTAGE, 1', '$VINTAGE, 0'),
+    ('5.86703718E+00', '5.86703718D+00'),
+    ('1.93343406E+01', '              '),
+    (' 3IN___COUT__C', '              '),
+])
+def test_read_RLC_unusual(old, new):
+    text = '\n'.join(tt_line_const_pch).replace(old, new, 1)
+    with pytest.raises(ValueError):
+        pyATP.pch.read_RLC(text)
+
+
+def test_line_params_cache(tmpdir):
+    pch = '\n'.join(tt_line_const_pch) + '\n'
+    tmpdir.join('S1.pch').write(pch)
+    tmpdir.join('S2.pch').write(pch.replace('1.91723657E+01', '2.10000000E+01'))
+    folder = str(tmpdir)
+    segs = ['S1', 'S2']
+    expected_segs, expected = pyATP.get_line_params_from_pch(folder, segs)
+
+    def check(cache):
+        seg_data, summary = cache.get_line_params(folder, segs)
+        assert list(seg_data) == segs
+        for seg in segs:
+            assert_round_equals(seg_data[seg].ABCD, expected_segs[seg].ABCD)
+        assert sorted(summary) == sorted(expected)
+        for k, v in expected.items():
+            assert_round_equals(summary[k], v)
+
+    cache_dir = str(tmpdir.join('cache'))
+    cache = pyATP.LineParamsCache(cache_dir, workers=2)
+    check(cache)
+    check(cache)
+    assert cache.stats['misses'] == 2 and cache.stats['hits'] == 2
+    assert cache.stats['summary_misses'] == 1
+    assert cache.stats['summary_hits'] == 1
+
+    # A new process finds the parameters on disk
+    cache = pyATP.LineParamsCache(cache_dir, workers=1)
+    check(cache)
+    assert cache.stats['loads'] == 2 and cache.stats['misses'] == 0
+    assert cache.stats['summary_loads'] == 1
+
+    # A changed file is parsed again, a touched one is not
+    os.utime(str(tmpdir.join('S1.pch')), (1e9, 1e9))
+    tmpdir.join('S2.pch').write(pch.replace('1.91723657E+01', '2.20000000E+01'))
+    previous = pyATP.set_line_params_cache(cache)
+    try:
+        seg_data, _ = pyATP.get_line_params_from_pch(folder, segs)
+    finally:
+        pyATP.set_line_params_cache(previous)
+    assert cache.stats['hits'] == 1 and cache.stats['misses'] == 1
+    assert cache.stats['summary_misses'] == 1
+    assert seg_data['S2'].Z[0, 0] == 2.2e1 + 5.20611375E+01j
+
+    cache.clear()
+    assert not [f for _, _, files in os.walk(cache_dir) for f in files]
+
+
+tt_line_const = """BEGIN NEW DATA CASE
+LINE CONSTANTS
+$ERASE
+BRANCH  IN___AOUT__AIN___BOUT__BIN___COUT__C
+ENGLISH
+  3  0.0   .1357 0   .3959    1.18      5.     42.     30.
+C comment
+  1  0.0   .1357 0   .3959    1.18     -5.     49.     37.
+  2  0.0   .1357 0   .3959    1.18      5.     56.     44.
+  0  0.0   .6609 0   .4883    .551     -.5     65.     58.
+BLANK CARD ENDING CONDUCTOR CARDS
+     50.       60.           000001 001000 0    5.98     0        44
+$PUNCH
+BLANK CARD ENDING FREQUENCY CARDS
+BLANK CARD ENDING LINE CONSTANT
+BEGIN NEW DATA CASE
+BLANK CARD
+"""
+
+
+def test_fortran_fields():
+    assert pyATP.fortran_fields('(I3, F5.4, 2A6)') == [
+        ('I', 0, 3), ('F', 3, 5), ('A', 8, 6), ('A', 14, 6)]
+    fields = pyATP.fortran_fields(pyATP.LineConstCards.params_format)
+    assert len(fields) == len(pyATP.LineConstCards.params_fields)
+
+
+def test_line_const_patch():
+    cards = pyATP.LineConstCards()
+    with pytest.raises(ValueError):
+        cards.patch('IP', 1, 0)
+    cards.index_fields(tt_line_const.splitlines())
+    assert cards.patched_text() == tt_line_const
+
+    for row, ph in enumerate([2, 3, 1]):
+        cards.patch('IP', ph, row)
+    cards.patch('DIST', 12.5)
+    cards.patch('in1', 'BUSX_A')
+    cards.patch('HORIZ', -5.25, 3)
+    lines = tt_line_const.splitlines()
+    lines[3] = 'BRANCH  BUSX_AOUT__AIN___BOUT__BIN___COUT__C'
+    lines[5] = '  2' + lines[5][3:]
+    lines[7] = '  3' + lines[7][3:]
+    lines[8] = '  1' + lines[8][3:]
+    lines[9] = '  0  0.0   .6609 0   .4883    .551   -5.25     65.     58.'
+    lines[11] = lines[11].replace('    5.98', '    12.5')
+    assert cards.patched_text('\r\n') == '\r\n'.join(lines) + '\r\n'
+
+    with pytest.raises(ValueError):
+        cards.patch('IP', 1000, 0)
+    with pytest.raises(KeyError):
+        cards.patch('IP', 1, 4)
+    with pytest.raises(KeyError):
+        cards.patch('IP', 1)
+    with pytest.raises(ValueError):
+        cards.index_fields(lines[:10])
+
+
+# The case echoed in tt_line_const_pch
+tt_line_const_case = ['BEGIN NEW DATA CASE'] + [
+    line[2:] for line in tt_line_const_pch[1:12]] + tt_line_const.splitlines()[-5:]
+
+
+def test_line_params():
+    cards = pyATP.LineConstCards()
+    cards.index_fields(tt_line_const_case)
+    assert cards.field('units') == 'ENGLISH'
+    assert cards.field('DIST') == 38.9
+    assert cards.field('IP', 3) == 0
+    assert cards.conductors()[1]['HORIZ'] == 0.
+    params = cards.line_params()
+    assert np.allclose(params.Z, line_const_Z_mat, rtol=1e-5, atol=0)
+    assert np.allclose(params.Y, line_const_Y_mat, rtol=1e-5, atol=0)
+    assert np.allclose(params.RLC, [[v['R'], v['L'], v['C']]
+                                    for v in line_const_values], rtol=1e-5)
+    assert np.allclose(params.ABCD, lineZ.ZY_to_ABCD(params.Z, params.Y))
+
+    # Swapping phases 1 and 2 swaps their rows and columns
+    cards.patch('IP', 2, 0)
+    cards.patch('IP', 1, 1)
+    swapped = cards.line_params()
+    assert np.allclose(swapped.Z, params.Z[np.ix_([1, 0, 2], [1, 0, 2])])
+
+    # A bundle of two conductors has a lower impedance than one conductor
+    lines = list(tt_line_const_case)
+    lines.insert(9, '  2  0.0    .344 0    .465    .642     1.5     50.     25.')
+    cards.index_fields(lines)
+    bundled = cards.line_params()
+    assert bundled.Z[1, 1].real < 0.7*params.Z[1, 1].real
+    assert bundled.Z[1, 1].imag < 0.9*params.Z[1, 1].imag
+    assert np.allclose(bundled.Z[0, 0], params.Z[0, 0], rtol=0.1)
+
+    cards.patch('IX', 2, 0)
+    with pytest.raises(ValueError):
+        cards.line_params()
+
+
+def test_line_constants_stack():
+    # The geometry of tt_line_const_case and variants with wider phase
+    # spacings, in SI units
+    ft, mile = 0.3048, 1609.344
+    phases = [1, 2, 3, 0, 0]
+    x = np.array([-14.5, 0., 14.5, -8.75, 8.75])*ft
+    h = np.array([100., 100., 100., 159.75, 159.75])/3*ft
+    radius = np.array([.642, .642, .642, .36, .36])/2*0.0254
+    resistance = np.array([.344, .344, .344, 6.93, 6.93])/mile
+    gmr = ft*np.exp(-np.array([.465, .465, .465, 1.44, 1.44]) /
+                    (mile*120*np.pi*2e-7))
+    spread = np.array([1., 1.1, 1.25, 1.5])[:, np.newaxis]
+    xs = x*np.where(np.array(phases) > 0, spread, 1.)
+    Z, Y = pyATP.line_constants_stack(phases, xs, h, radius, resistance, 50.,
+                                      60., length=38.9*mile, gmr=gmr)
+    assert Z.shape == Y.shape == (4, 3, 3)
+    assert np.allclose(Z[0], line_const_Z_mat, rtol=1e-5, atol=0)
+    assert np.allclose(Y[0], line_const_Y_mat, rtol=1e-5, atol=0)
+    for k in range(4):
+        Zk, Yk = pyATP.line_constants_stack(phases, xs[k], h, radius,
+                                            resistance, 50., 60.,
+                                            length=38.9*mile, gmr=gmr)
+        assert np.allclose(Z[k], Zk) and np.allclose(Y[k], Yk)
+    # Wider spacings have higher positive-sequence impedances
+    Z1 = lineZ.seq_impedances(Z)[:, 1, 1]
+    assert (np.diff(Z1.imag) > 0).all()
+
+    ABCD = lineZ.ZY_to_ABCD(Z, Y)
+    assert ABCD.shape == (4, 6, 6)
+    assert np.allclose(ABCD[2], lineZ.ZY_to_ABCD(Z[2], Y[2]))
+    imbalance = lineZ.impedance_imbalance(Z)
+    assert imbalance.shape == (4,)
+    assert np.allclose(imbalance[3], lineZ.impedance_imbalance(Z[3]))
+
+    # One earth resistivity per geometry
+    Z, _ = pyATP.line_constants_stack(phases, xs[:2], h, radius, resistance,
+                                      [50., 1000.], 60., gmr=gmr)
+    Zk, _ = pyATP.line_constants_stack(phases, xs[1], h, radius, resistance,
+                                       1000., 60., gmr=gmr)
+    assert np.allclose(Z[1], Zk)
+
+
+@pytest.mark.parametrize("h, x, f, rho", [(20., 0., 60., 100.),
+                                          (66.7, 10., 60., 50.),
+                                          (400., 50., 5000., 10.)])
+def test_carson_correction(h, x, f, rho):
+    # Carson's integral for conductors at heights adding to h and x apart
+    omega = 2*np.pi*f
+    D = np.hypot(h, x)
+    lam = np.linspace(0., 3000./D, 1000001)
+    g = np.exp(-lam*h)*np.cos(lam*x)/(lam + np.sqrt(lam**2 + 4e-7j*np.pi*omega/rho))
+    exact = 4e-7j*omega*np.sum((g[1:] + g[:-1])/2*np.diff(lam))
+    a = 4*np.pi*np.sqrt(5)*1e-4*D*np.sqrt(f/rho)
+    dZ = pyATP.carson_correction([a], [np.arctan2(x, h)], omega)[0]
+    assert abs(dZ - exact) < 2e-3*abs(exact)
+
+
+def test_internal_impedance():
+    # Solid conductor at low frequency: DC resistance and mu0/8pi
+    omega = 2*np.pi*1e-3
+    Z = pyATP.internal_impedance(1e-4, 0.01, 0.5, omega)
+    assert np.allclose(Z, 1e-4 + 0.5e-7j*omega)
+    # R/R_dc = 1 + x**4/192 for small x
+    omega = 2*np.pi*60
+    x4 = (0.01**2*omega*4e-7*np.pi/(1e-4*np.pi*0.01**2))**2
+    Z = pyATP.internal_impedance([1e-4, 1e-4], 0.01, [0.5, 0.01], omega)
+    assert np.allclose(Z[0].real, 1e-4*(1 + x4/192), rtol=1e-4)
+    # Thin tube: no skin effect
+    assert np.allclose(Z[1].real, 1e-4, rtol=1e-4)
+    # Large arguments: surface impedance of a half space
+    omega = 2*np.pi*1e6
+    Z = pyATP.internal_impedance(1e-6, 0.05, 0.5, omega)
+    rho_dc = 1e-6*np.pi*0.05**2
+    assert np.allclose(Z, np.sqrt(1j*omega*4e-7*np.pi*rho_dc)/(2*np.pi*0.05),
+                       rtol=1e-2)
+
+
+def test_kron_reduce():
+    M = np.array([[4., 1., 2.], [1., 3., 0.5], [2., 0.5, 5.]])
+    reduced = pyATP.kron_reduce(M, [True, True, False])
+    assert np.allclose(reduced, np.linalg.inv(np.linalg.inv(M)[:2, :2]))
+
+
+tt_lis_ss = """
+Sinusoidal steady-state phasor solution, branch by branch.  All flows are away from a bus, and the real part, magnitude, or "P"
+is printed above the imaginary part, the angle, or "Q".  The first solution frequency =   6.00000000E+01   Hertz.
+ Bus K     Phasor node voltage          Phasor branch current               Power flow                 Power loss
+  Bus M     Rectangular      Polar       Rectangular      Polar              P and Q                  P and D
+
+ SRCA                   1.9919200E+05        1.9919200E+05    1.2265720E+03        1.2266136E+03      1.00000E+06      1.00000E+03
+                        0.0000000E+00               0.0000    1.0105576E+01               0.4720      1.00000E+05
+
+            S0A         3.1378698E+05        3.3134506E+05   -1.2265720E+03        1.2266136E+03     -1.00000E+06      1.00000E+03
+                        1.0642969E+05              18.7358   -1.0105576E+01            -179.5280     -1.00000E+05
+
+ SRCB                  -9.9596000E+04        1.9919206E+05    6.1230000E+02        1.2259558E+03      1.00000E+06      1.00000E+03
+                       -1.7250540E+05            -120.0000   -1.0621000E+03             -60.0366      1.00000E+05
+
+            S0B        -9.4596000E+04        1.9673972E+05   -6.1230000E+02        1.2259558E+03     -1.00000E+06      1.00000E+03
+                       -1.7250540E+05            -118.7388    1.0621000E+03             119.9634     -1.00000E+05
+
+ SRCC                  -9.9596000E+04        1.9919206E+05   -6.1420000E+02        1.2181731E+03      1.00000E+06      1.00000E+03
+                        1.7250540E+05             120.0000    1.0520000E+03             120.2781      1.00000E+05
+
+            S0C        -1.0459600E+05        2.0173853E+05    6.1420000E+02        1.2181731E+03     -1.00000E+06      1.00000E+03
+                        1.7250540E+05             121.2299   -1.0520000E+03             -59.7219     -1.00000E+05
+
+ S0A                    3.1378698E+05        3.3134506E+05    1.2261000E+03        1.2261617E+03      1.00000E+06      1.00000E+03
+                        1.0642969E+05              18.7358   -1.2300000E+01              -0.5748      1.00000E+05
+
+            S1A         3.0000000E+05        3.1622777E+05   -1.2259000E+03        1.2259530E+03     -1.00000E+06      1.00000E+03
+                        1.0000000E+05              18.4349    1.1400000E+01             179.4672     -1.00000E+05
+
+ S0B                   -9.4596000E+04        1.9673972E+05    6.1200000E+02        1.2239869E+03      1.00000E+06      1.00000E+03
+                       -1.7250540E+05            -118.7388   -1.0600000E+03             -59.9996      1.00000E+05
+
+            S1B        -9.8000000E+04        1.9622436E+05   -6.1100000E+02        1.2226210E+03     -1.00000E+06      1.00000E+03
+                       -1.7000000E+05            -119.9622    1.0590000E+03             119.9832     -1.00000E+05
+
+ S0C                   -1.0459600E+05        2.0173853E+05   -6.1400000E+02        1.2172087E+03      1.00000E+06      1.00000E+03
+                        1.7250540E+05             121.2299    1.0510000E+03             120.2937      1.00000E+05
+
+            S1C        -9.8000000E+04        1.9622436E+05    6.1300000E+02        1.2158409E+03     -1.00000E+06      1.00000E+03
+                        1.7000000E+05             119.9622   -1.0500000E+03             -59.7232     -1.00000E+05
+
+  Total network loss  P-loss  by summing injections =   1.234567890E+04
+Output for steady-state phasor switch currents.
+     Node-K    Node-M        I-real            I-imag            I-magn          Degrees         Power           Reactive
+      S1A                       1.2259000E+03    -1.1400000E+01      1.2259530E+03
+      S1B                       6.1100000E+02    -1.0590000E+03      1.2226210E+03
+      S1C                      -6.1300000E+02     1.0500000E+03      1.2158409E+03
+      S1A       X1A                      Open              Open               Open
+
+Solution at nodes with known voltage.   Nodes that are shorted together by switches are shown as a group of names, with the printed
+"""[1:]
+
+
+@pytest.fixture
+def lis_file(tmpdir):
+    """ Write the sample steady-state LIS output to a temporary file. """
+    f = tmpdir.join('test_ss.lis')
+    f.write(tt_lis_ss)
+    return str(f)
+
+
+def test_get_SS_results(lis_file):
+    node_voltages, branch_currents = pyATP.get_SS_results(lis_file)
+    assert len(node_voltages) == 9
+    assert_round_equals(node_voltages['S0A'],
+                        3.1378698E+05 + 1.0642969E+05j)
+    assert_round_equals(branch_currents[('SRCA', 'S0A')],
+                        1.2265720E+03 + 1.0105576E+01j)
+    assert_round_equals(branch_currents[('S0A', 'SRCA')],
+                        -1.2265720E+03 - 1.0105576E+01j)
+    assert_round_equals(branch_currents[('S1B', 'TERRA')],
+                        6.1100000E+02 - 1.0590000E+03j)
+    assert_round_equals(branch_currents[('TERRA', 'S1B')],
+                        -6.1100000E+02 + 1.0590000E+03j)
+    assert branch_currents[('S1A', 'X1A')] == 0.
+
+
+@pytest.mark.parametrize('newline', ['\n', '\r\n'])
+def test_SS_engines_agree(tmpdir, newline):
+    f = tmpdir.join('test_engines.lis')
+    f.write_binary(tt_lis_ss.replace('\n', newline).encode('ascii'))
+    results = [pyATP.get_SS_results(str(f), RMS_scale=True, engine=engine)
+               for engine in ('python', 'numpy')]
+    assert results[0] == results[1]
+    # Insertion order is kept too.
+    assert list(results[0][1]) == list(results[1][1])
+
+
+def test_SS_engine_unknown(lis_file, monkeypatch):
+    monkeypatch.setattr(pyATP.pyATP, 'SS_engine', 'bogus')
+    with pytest.raises(ValueError, match='bogus'):
+        pyATP.get_SS_results(lis_file)
+    with pytest.raises(ValueError, match='other'):
+        pyATP.get_SS_results(lis_file, engine='other')
+
+
+def test_SS_result_matches_get_SS_results(lis_file):
+    pyATP.SteadyStateResult.clear_cache()
+    for RMS_scale in (False, True):
+        ss = pyATP.SteadyStateResult.from_lis(lis_file, RMS_scale)
+        node_voltages, branch_currents = pyATP.get_SS_results(lis_file,
+                                                              RMS_scale)
+        assert_round_equals(ss.node_voltages, node_voltages)
+        assert_round_equals(ss.branch_currents, branch_currents)
+
+
+def test_SS_result_memoized(lis_file):
+    pyATP.SteadyStateResult.clear_cache()
+    ss = pyATP.SteadyStateResult.from_lis(lis_file)
+    assert pyATP.SteadyStateResult.from_lis(lis_file) is ss
+    # A changed file must be parsed again.
+    with open(lis_file, 'a') as f:
+        f.write('\n')
+    assert pyATP.SteadyStateResult.from_lis(lis_file) is not ss
+
+
+def test_SS_result_cache_bounded(lis_file, tmpdir):
+    import shutil
+    SSR = pyATP.SteadyStateResult
+    SSR.clear_cache()
+    files = [str(tmpdir.join('copy%d.lis' % k)) for k in range(3)]
+    for name in files:
+        shutil.copy(lis_file, name)
+    previous = SSR.set_cache_size(2)
+    try:
+        first = [SSR.from_lis(name) for name in files[:2]]
+        # Using the first file again makes the second one the oldest
+        assert SSR.from_lis(files[0]) is first[0]
+        SSR.from_lis(files[2])
+        assert len(SSR._cache) == 2
+        assert SSR.from_lis(files[0]) is first[0]
+        assert SSR.from_lis(files[1]) is not first[1]
+        # Results of removed files are dropped
+        os.remove(files[0])
+        SSR.from_lis(files[2])
+        assert os.path.abspath(files[0]) not in SSR._cache
+        SSR.set_cache_size(0)
+        assert SSR.from_lis(files[1]).node_voltages
+        assert not SSR._cache
+    finally:
+        SSR.set_cache_size(previous)
+        SSR.clear_cache()
+
+
+def test_SS_result_processing(lis_file):
+    buses = ['SRC', 'S0']
+    branches = [('SRC', 'S0'), ('S0', 'S1')]
+    ss = pyATP.SteadyStateResult.from_lis(lis_file)
+    ph_voltages, seq_voltages, neg_seq_imbalance = \
+        ss.process_bus_voltages(buses)
+    assert ph_voltages.shape == (3, 2)
+    assert_round_equals(ph_voltages[0, 1], ss.node_voltages['S0A'])
+    assert_round_equals(seq_voltages, lineZ.ph_to_seq_v(ph_voltages))
+    assert_round_equals(neg_seq_imbalance,
+                        np.abs(seq_voltages[2]/seq_voltages[1])*100)
+    ph_br_currents, seq_br_currents, S_3ph = \
+        ss.process_branch_currents(branches)
+    assert_round_equals(ph_br_currents[1, 1],
+                        ss.branch_currents[('S0B', 'S1B')])
+    assert_round_equals(S_3ph[0], np.sum(ph_voltages[:, 0] *
+                                         np.conj(ph_br_currents[:, 0]))/1e6)
+    # Module-level helpers accept either a file name or a parsed result.
+    assert_round_equals(pyATP.process_SS_bus_voltages(lis_file, buses)[0],
+                        ph_voltages)
+    assert_round_equals(pyATP.process_SS_branch_currents(ss, branches)[2],
+                        S_3ph)
+    # RMS_scale applies to parsed results as it does to the file
+    rms = pyATP.process_SS_bus_voltages(lis_file, buses, RMS_scale=True)[0]
+    assert_round_equals(rms, ph_voltages/np.sqrt(2))
+    for parsed in (ss, (ss.node_voltages, ss.branch_currents)):
+        assert_round_equals(pyATP.process_SS_bus_voltages(
+            parsed, buses, RMS_scale=True)[0], rms)
+        assert_round_equals(pyATP.process_SS_branch_currents(
+            parsed, branches, RMS_scale=True)[2], S_3ph/2)
+
+
+def test_SS_arrays(lis_file):
+    arrays = pyATP.lis.read_SS_arrays(lis_file)
+    node_voltages, branch_currents = pyATP.get_SS_results(lis_file,
+                                                          engine='python')
+    # One row per branch and per switch
+    assert arrays.br_nodes.shape == (10, 2)
+    assert arrays.br_current.shape == (10, 2)
+    assert arrays.voltages.dtype == np.complex128
+    assert arrays.node_names[:3].tolist() == [b'SRCA', b'S0A', b'SRCB']
+    # Views behave like the dicts of the line-by-line parser
+    assert dict(arrays.node_voltages) == node_voltages
+    assert dict(arrays.branch_currents) == branch_currents
+    assert list(arrays.branch_currents) == list(branch_currents)
+    assert ('S0A', 'SRCA') in arrays.branch_currents
+    assert 'TERRA' not in arrays.node_voltages
+    with pytest.raises(KeyError):
+        arrays.node_voltages['TERRA']
+    with pytest.raises(KeyError):
+        arrays.branch_currents[('SRCA', 'S1A')]
+    assert_round_equals(
+        arrays.branch_current_array([('S1C', 'S0C'), ('TERRA', 'S1B')]),
+        [branch_currents[('S1C', 'S0C')], branch_currents[('TERRA', 'S1B')]])
+    scaled = arrays.scaled(0.5)
+    assert_round_equals(scaled.node_voltages['S1B'],
+                        0.5 * node_voltages['S1B'])
+
+
+def test_iter_SS_results(tmpdir):
+    marker = (' Marker card preceding new EMTP data case.' + ' '*22 +
+              '|BEGIN NEW DATA CASE\n')
+    f = tmpdir.join('test_cases.lis')
+    # Case 1 and 3 have a steady-state solution, case 2 does not and case 4
+    # is the empty case ending the deck.
+    f.write(marker + tt_lis_ss + marker + 'No phasor solution.\n' +
+            marker + tt_lis_ss.replace('S0A', 'S9A') + marker)
+    results = pyATP.get_all_SS_results(str(f))
+    assert list(results) == [1, 3]
+    single = pyATP.get_SS_results(str(f), engine='python')
+    assert dict(results[1].node_voltages) == single[0]
+    assert dict(results[1].branch_currents) == single[1]
+    assert 'S9A' in results[3].node_voltages
+    assert 'S0A' not in results[3].node_voltages
+    # Switch currents are taken from the case's own block
+    assert len(results[3].branch_currents) == len(single[1])
+
+
+# Banner printed by ATP at the top of a LIS file, before the echo of the
+# first card of the deck
+tt_lis_banner = """Alternative Transients Program (ATP), GNU Linux or DOS. All rights reserved by Can/Am user group of Portland, Oregon, USA.
+ Date (dd-mth-yy) and time of day (hh.mm.ss) = 05-May-16  14:58:52
+ Name of disk plot file (if any) is  test_cases.pl4
+ Consult the 860-page ATP Rule Book of the Can/Am EMTP User Group in Portland, Oregon, USA.  Source code date is 19 December 2011.
+ Total size of LABCOM tables = 5349520 INTEGER words.   39 VARDIM List Sizes follow:
+   6002  10K   192K   900   420K  1200  15K  120K  2250  3800  720  1200  72800   510  90K  800  90  254  120K  100K 3K 15K 192K 120
+ --------------------------------------------------+--------------------------------------------------------------------------------
+ Descriptive interpretation of input data cards.   |  Input data card images are shown below, all 80 columns, character by character
+                                                   0        1         2         3         4         5         6         7         8
+                                                   012345678901234567890123456789012345678901234567890123456789012345678901234567890
+ --------------------------------------------------+--------------------------------------------------------------------------------
+"""
+
+tt_lis_marker = (' Marker card preceding new EMTP data case.' + ' '*22 +
+                 '|BEGIN NEW DATA CASE\n')
+
+
+def test_iter_cases():
+    # The banner belongs to the first case
+    buf = (tt_lis_banner + tt_lis_marker + 'SS1\n' + tt_lis_marker +
+           'SS2\n' + tt_lis_marker).encode('ascii')
+    cases = [(case, buf[start:end])
+             for case, start, end in pyATP.lis.iter_cases(buf)]
+    assert [c[0] for c in cases] == [1, 2, 3]
+    assert cases[0][1].startswith(b'Alternative Transients Program')
+    assert cases[0][1].endswith(b'SS1\n')
+    assert cases[1][1] == (tt_lis_marker + 'SS2\n').encode('ascii')
+    assert pyATP.lis.marker_cases(buf) == [1, 2, 3]
+
+    # Cards echoed before the first marker are a case of their own
+    buf = (tt_lis_banner + ' Comment card.' + ' '*37 + '|C deck\n' +
+           'SS1\n' + tt_lis_marker + 'SS2\n' + tt_lis_marker).encode('ascii')
+    cases = [(case, buf[start:end])
+             for case, start, end in pyATP.lis.iter_cases(buf)]
+    assert [c[0] for c in cases] == [1, 2, 3]
+    assert cases[0][1].endswith(b'|C deck\nSS1\n')
+    assert cases[1][1] == (tt_lis_marker + 'SS2\n').encode('ascii')
+    assert pyATP.lis.marker_cases(buf) == [2, 3]
+
+    # Comment cards mentioning the marker do not start a case
+    buf = (b'\n Marker card.  |BEGIN NEW DATA CASE\n'
+           b' Comment card.  |C BEGIN NEW DATA CASE\n'
+           b' Marker card.  |BEGIN NEW DATA CASE\n')
+    cases = list(pyATP.lis.iter_cases(buf))
+    assert [c[0] for c in cases] == [1, 2]
+    assert b'Comment card' in buf[cases[0][1]:cases[0][2]]
+    assert list(pyATP.lis.iter_cases(b'SS1\n')) == [(1, 0, 4)]
+
+
+def test_iter_SS_results_banner(tmpdir):
+    f = tmpdir.join('test_banner.lis')
+    f.write(tt_lis_banner + tt_lis_marker + tt_lis_ss + tt_lis_marker +
+            tt_lis_ss.replace('S0A', 'S9A') + tt_lis_marker)
+    results = pyATP.get_all_SS_results(str(f))
+    assert list(results) == [1, 2]
+    assert 'S0A' in results[1].node_voltages
+    assert 'S9A' in results[2].node_voltages
+    assert list(pyATP.get_all_SS_results(str(f), workers=2)) == [1, 2]
+
+
+def test_iter_SS_results_no_marker(tmpdir):
+    # A deck without a leading BEGIN NEW DATA CASE card: the steady-state
+    # solution of the first case is kept and later cases are numbered on
+    f = tmpdir.join('test_no_marker.lis')
+    f.write(tt_lis_banner + tt_lis_ss + tt_lis_marker +
+            tt_lis_ss.replace('S0A', 'S9A') + tt_lis_marker)
+    results = pyATP.get_all_SS_results(str(f))
+    assert list(results) == [1, 2]
+    assert 'S0A' in results[1].node_voltages
+    assert 'S9A' in results[2].node_voltages
+    assert 'S0A' not in results[2].node_voltages
+
+
+@pytest.mark.parametrize('engine', ['numpy', 'python'])
+def test_output_ss_npz(lis_file, tmpdir, monkeypatch, engine):
+    import pickle
+    monkeypatch.setattr(pyATP, 'SS_engine', engine)
+    pyATP.SteadyStateResult.clear_cache()
+    buses = ['SRC', 'S0']
+    branches = [['SRC', 'S0'], ['S0', 'S1']]
+    npz_file = str(tmpdir.join('test_ss.npz'))
+    p_file = str(tmpdir.join('test_ss.p'))
+    csv_file = str(tmpdir.join('test_ss.csv'))
+    pyATP.output_ss_file(lis_file, csv_file, npz_file, buses, branches)
+    pyATP.output_ss_file(lis_file, csv_file, p_file, buses, branches)
+    with open(p_file, 'rb') as f:
+        expected = pickle.load(f)
+
+    ss = pyATP.SSResultFile(npz_file)
+    assert ss.version == pyATP.SS_NPZ_VERSION
+    assert ss.phases == ('A', 'B', 'C')
+    assert isinstance(ss['bus_ph_voltages'], np.memmap)
+    assert dict(ss.node_voltages) == expected['node_voltages']
+    assert dict(ss.branch_currents) == expected['branch_currents']
+    assert sorted(ss.bus_data) == sorted(expected['bus_data'])
+    for bus, data in expected['bus_data'].items():
+        assert_round_equals(ss.bus_data[bus], data)
+    for branch, data in expected['branch_data'].items():
+        assert_round_equals(ss.branch_data[branch], data)
+    # The results can be processed again without the LIS file
+    assert_round_equals(
+        pyATP.process_SS_bus_voltages(
+            (ss.node_voltages, ss.branch_currents), ['S1'])[0],
+        pyATP.process_SS_bus_voltages(lis_file, ['S1'])[0])
+
+
+def fs_table(freq, values, fs_output='polar', step=False, labels=True,
+             sep=' '):
+    ''' Text of a FREQUENCY SCAN table of the complex (n_freq, 3) values of
+        node voltages BUSA and BUSB and branch current BUSA-LOADA. Rows are
+        wrapped after six variable columns. labels adds a heading line naming
+        the quantity in each column; with sep='' fields that fill their width
+        run together. '''
+    k = pyATP.lis.FS_OUTPUTS[fs_output]
+    w = 13 + len(sep)
+    quantity = {'polar': ['Magnitude', 'Degrees'], 'rect': ['Real', 'Imag'],
+                'mag': ['Magnitude'],
+                'both': ['Magnitude', 'Degrees', 'Real', 'Imag']}[fs_output]
+    lines = [' Column headings for the   3  EMTP output variables follow.  '
+             'These are divided among the 5 possible classes as follows ....',
+             '   First   2  output variables are electric-network voltage '
+             'differences (upper voltage minus lower voltage);',
+             '   Next    1  output variables are branch currents (flowing '
+             'from the upper node to the lower node);',
+             ('  Step' if step else '') + '   Freq-Hz' + ' '*(w - 14) +
+             ''.join('%14s' % n for n in ['BUSA']*k + ['BUSB']*k +
+                     ['BUSA']*k),
+             ('      ' if step else '') + ' '*(w - 4) +
+             ' '*28*k + ''.join('%14s' % 'LOADA' for _ in range(k))]
+    if labels:
+        lines.append(('      ' if step else '') + ' '*(w - 4) +
+                     ''.join('%14s' % q for q in quantity*3))
+    for n, (f, v) in enumerate(zip(freq, values)):
+        cols = {'polar': [np.abs(v), np.angle(v, deg=True)],
+                'rect': [v.real, v.imag],
+                'mag': [np.abs(v)],
+                'both': [np.abs(v), np.angle(v, deg=True), v.real, v.imag]
+                }[fs_output]
+        cols = np.column_stack(cols).ravel()
+        text = ('%6d' % n if step else '') + ' %.8E' % f
+        for m in range(0, len(cols), 6):
+            text += ''.join(sep + '%13.6E' % c for c in cols[m:m + 6])
+            lines.append(text)
+            text = ' '*(15 + (6 if step else 0))
+    return '\n'.join(lines) + '\n\n Extrema of output variables follow.\n'
+
+
+@pytest.mark.parametrize('fs_output, step', [
+    ('polar', False), ('polar', True), ('mag', False), ('both', True),
+    ('rect', False)])
+def test_get_FS_results(tmpdir, fs_output, step):
+    freq = np.linspace(50, 3000, 60)
+    values = (np.random.RandomState(0).randn(60, 3) +
+              1j*np.random.RandomState(1).randn(60, 3)) * 1e3
+    f = tmpdir.join('test_fs.lis')
+    f.write('Data case echo\n' + fs_table(freq, values, fs_output, step))
+    for scan in (pyATP.get_FS_results(str(f)),
+                 pyATP.get_FS_results(str(f), fs_output)):
+        assert scan.names == ['BUSA', 'BUSB', ('BUSA', 'LOADA')]
+        assert_round_equals(scan.freq, freq)
+        assert scan.values.shape == (60, 3)
+        expected = np.abs(values) if fs_output == 'mag' else values
+        assert np.allclose(scan.values, expected, rtol=1e-5)
+
+
+@pytest.mark.parametrize('fs_output', ['polar', 'rect', 'both'])
+def test_FS_results_layout(tmpdir, fs_output):
+    # Two columns are magnitude and angle unless the heading says otherwise,
+    # even when the values could be either
+    freq = np.array([60., 120., 180.])
+    values = np.arange(9).reshape(3, 3) * (1 + 1j) + 1
+    f = tmpdir.join('test_fs_layout.lis')
+    f.write(fs_table(freq, values, fs_output, labels=False))
+    scan = pyATP.get_FS_results(str(f))
+    if fs_output == 'rect':
+        assert not np.allclose(scan.values, values, rtol=1e-5)
+    else:
+        assert np.allclose(scan.values, values, rtol=1e-5)
+    f.write(fs_table(freq, values, fs_output))
+    assert np.allclose(pyATP.get_FS_results(str(f)).values, values,
+                       rtol=1e-5)
+    with pytest.raises(ValueError):
+        pyATP.get_FS_results(str(f), 'mag')
+
+
+def test_FS_results_adjacent_fields(tmpdir):
+    # Negative numbers filling their field run into the previous one
+    freq = np.array([60., 120., 180.])
+    values = -(np.arange(9).reshape(3, 3) + 1) * (1e3 + 1e3j)
+    f = tmpdir.join('test_fs_adjacent.lis')
+    for fs_output in ('rect', 'both'):
+        text = fs_table(freq, values, fs_output, sep='')
+        assert 'E+03-' in text
+        f.write(text)
+        scan = pyATP.get_FS_results(str(f))
+        assert scan.names == ['BUSA', 'BUSB', ('BUSA', 'LOADA')]
+        assert np.allclose(scan.values, values, rtol=1e-5)
+
+
+def test_get_all_FS_results(tmpdir):
+    marker = (' Marker card preceding new EMTP data case.' + ' '*22 +
+              '|BEGIN NEW DATA CASE\n')
+    freq = np.array([60., 120., 180.])
+    values = np.arange(9).reshape(3, 3) * (1 + 1j) + 1
+    f = tmpdir.join('test_fs_cases.lis')
+    f.write(marker + fs_table(freq, values) + marker + tt_lis_ss + marker +
+            fs_table(freq, 2*values) + marker)
+    results = pyATP.get_all_FS_results(str(f))
+    assert list(results) == [1, 3]
+    assert np.allclose(results[3].values, 2*values, rtol=1e-5)
+    assert pyATP.get_FS_results(str(f)).end < len(f.read())
+
+
+@pytest.mark.parametrize('suffix', ['.gz', '.bz2', '.xz'])
+@pytest.mark.parametrize('engine', ['numpy', 'python'])
+def test_compressed_lis(lis_file, suffix, engine):
+    import bz2
+    import gzip
+    import lzma
+    opener = {'.gz': gzip.open, '.bz2': bz2.open, '.xz': lzma.open}[suffix]
+    with open(lis_file, 'rb') as f, opener(lis_file + suffix, 'wb') as z:
+        z.write(f.read())
+    os.remove(lis_file)
+    assert pyATP.lis_filename(lis_file[:-4] + '.atp') == lis_file + suffix
+    expected = pyATP.get_SS_results(lis_file + suffix, engine='python')
+    assert len(expected[0]) == 9
+    results = pyATP.get_SS_results(lis_file + suffix, engine=engine)
+    assert dict(results[0]) == expected[0]
+    assert dict(results[1]) == expected[1]
+
+
+def test_lis_index(tmpdir):
+    marker = (' Marker card preceding new EMTP data case.' + ' '*22 +
+              '|BEGIN NEW DATA CASE\n')
+    f = tmpdir.join('test_index.lis')
+    f.write(marker + tt_lis_ss + marker + fs_table([60., 120.], np.ones(
+        (2, 3))) + marker + tt_lis_ss.replace('S0A', 'S9A') + marker)
+    LIS_file = str(f)
+    expected = pyATP.get_all_SS_results(LIS_file)
+    assert pyATP.lis.load_index(LIS_file) is None
+
+    index = pyATP.lis.build_index(LIS_file)
+    assert os.path.exists(LIS_file + '.idx')
+    assert [c['case'] for c in index['cases']] == [1, 2, 3, 4]
+    assert [c['ss_start'] >= 0 for c in index['cases']] == \
+        [True, False, True, False]
+    assert index['cases'][1]['fs_start'] > index['cases'][1]['start']
+    assert pyATP.lis.load_index(LIS_file) == index
+
+    # Readers seek to the indexed offsets and give the same results
+    for results in (pyATP.get_all_SS_results(LIS_file),
+                    pyATP.get_all_SS_results(LIS_file, workers=2)):
+        assert list(results) == [1, 3]
+        for case in results:
+            assert dict(results[case].node_voltages) == \
+                dict(expected[case].node_voltages)
+            assert dict(results[case].branch_currents) == \
+                dict(expected[case].branch_currents)
+    names = ['S1A', 'SRCC', 'S9A']
+    assert_round_equals(
+        pyATP.lis.read_SS_node_voltages(LIS_file, names, case=3),
+        [expected[3].node_voltages[n] for n in names])
+    with pytest.raises(KeyError):
+        pyATP.lis.read_SS_node_voltages(LIS_file, ['S9A'], case=1)
+
+    # The index is stale once the LIS file changes
+    f.write(tt_lis_ss)
+    os.utime(LIS_file, (0, 0))
+    assert pyATP.lis.load_index(LIS_file) is None
+    assert list(pyATP.get_all_SS_results(LIS_file, workers=0)) == [1]
+    assert pyATP.lis.load_index(LIS_file)['size'] == len(tt_lis_ss)
+
+
+fake_ATP_script = r"""
+import os, re, sys
+deck = open(sys.argv[1]).read()
+base = os.path.splitext(sys.argv[1])[0]
+marker = (" Marker card preceding new EMTP data case." + " "*22 +
+          "|BEGIN NEW DATA CASE\n")
+banner = ("Alternative Transients Program (ATP), GNU Linux or DOS.\n"
+          " Descriptive interpretation of input data cards.   |  "
+          "Input data card images are shown below\n")
+
+def output(case):
+    inc = re.search(r"^\$INCLUDE,\s*(\S+)", case, re.M)
+    return open(inc.group(1)).read() if inc else ""
+
+cases = re.split(r"(?m)^BEGIN NEW DATA CASE.*$", deck)
+if len(cases) == 1:
+    lis = output(deck) or sys.exit(1)
+else:
+    lis = banner + "".join(marker + output(case) for case in cases[1:])
+open(base + ".lis", "w").write(lis)
+"""
+
+
+@pytest.fixture
+def fake_ATP(tmpdir, monkeypatch):
+    """ Install a stand-in for the ATP executable that writes, as the LIS
+        output of each data case of a deck, the contents of the first file
+        the case includes. """
+    exe = tmpdir.join('fake_atp.py')
+    exe.write('#!%s\n' % sys.executable + fake_ATP_script)
+    exe.chmod(0o755)
+    monkeypatch.setattr(pyATP.pyATP, 'ATP_path', str(tmpdir))
+    monkeypatch.setattr(pyATP.pyATP, 'ATP_exe', 'fake_atp.py')
+    return str(exe)
+
+
+def test_ATP_scheduler(tmpdir, fake_ATP):
+    tmpdir.mkdir('lib').join('case.lis').write(tt_lis_ss)
+    tmpdir.join('lib', 'other.lis').write(tt_lis_ss.replace('S0A', 'S9A'))
+    scratch = tmpdir.mkdir('scratch')
+    assert pyATP.find_includes('$INCLUDE, lib/case.lis\nC $INCLUDE x\n'
+                               '$include lib/other.lis, $$\n') == \
+        ['lib/case.lis', 'lib/other.lis']
+
+    with pyATP.ATPScheduler(workers=4, scratch_dir=str(scratch)) as s:
+        futures = [s.submit(deck='$INCLUDE, lib/%s.lis\n' % f, name='c.atp',
+                            include_dir=str(tmpdir))
+                   for f in ('case', 'other') * 4]
+        results = [f.result() for f in futures]
+        run = s.submit(deck='$INCLUDE, lib/case.lis\n', name='c.atp',
+                       include_dir=str(tmpdir), parse=None).result()
+
+    expected = pyATP.get_SS_results(tmpdir.join('lib', 'case.lis').strpath)
+    for ss, name in zip(results, ('S0A', 'S9A') * 4):
+        assert name in ss.node_voltages
+        assert_round_equals(ss.node_voltages[name],
+                            expected[0]['S0A'])
+    # Scratch directories are removed once parsed, unless the ATPRun is
+    # returned to the caller.
+    assert scratch.listdir() == [py.path.local(run.workdir)]
+    assert run.returncode == 0
+    assert os.path.exists(os.path.join(run.workdir, 'c.lis'))
+    assert os.path.exists(os.path.join(run.workdir, 'lib', 'case.lis'))
+
+    with pyATP.ATPScheduler(workers=1, scratch_dir=str(scratch)) as s:
+        with pytest.raises(RuntimeError):
+            s.submit(deck='no includes\n', name='c.atp').result()
+    assert len(scratch.listdir()) == 1
+
+
+def test_run_cache(tmpdir, fake_ATP, monkeypatch):
+    tmpdir.join('case.lis.inc').write(tt_lis_ss)
+    deck = tmpdir.join('case.atp')
+    deck.write('$INCLUDE, case.lis.inc\n')
+    LIS_file = tmpdir.join('case.lis')
+    cwd = str(tmpdir)
+    cache = pyATP.RunCache(str(tmpdir.join('cache')))
+    monkeypatch.setattr(pyATP.pyATP, 'run_cache', None)
+    assert pyATP.set_run_cache(cache) is None
+
+    assert pyATP.run_ATP('case.atp', cwd=cwd) == 0
+    assert cache.stats == {'hits': 0, 'misses': 1, 'stores': 1,
+                           'evictions': 0}
+    LIS_file.remove()
+    key = cache.key('case.atp', cwd)
+    # Hits do not run ATP
+    monkeypatch.setattr(pyATP.pyATP, 'ATP_exe', 'missing_atp.py')
+    assert cache.key('case.atp', cwd) != key
+    monkeypatch.setattr(pyATP.pyATP, 'ATP_exe', 'fake_atp.py')
+    os.chmod(fake_ATP, 0o644)
+    assert pyATP.run_ATP('case.atp', cwd=cwd) == 0
+    assert tt_lis_ss in LIS_file.read()
+    assert cache.stats['hits'] == 1
+    with pytest.raises(OSError):
+        pyATP.run_ATP('case.atp', cwd=cwd, use_cache=False)
+    os.chmod(fake_ATP, 0o755)
+
+    # Changing an included file changes the key
+    tmpdir.join('case.lis.inc').write(tt_lis_ss.replace('S0A', 'S9A'))
+    assert cache.key('case.atp', cwd) != key
+    pyATP.run_ATP('case.atp', cwd=cwd)
+    assert 'S9A' in LIS_file.read()
+    assert cache.stats['misses'] == 2
+    assert len(cache.entries()) == 2
+
+    # Least recently used entries are evicted first
+    os.utime(cache.entries()[-1][2], (0, 0))
+    assert cache.evict(cache.size() - 1) == 1
+    assert cache.entries()[0][2].endswith(key)
+    cache.clear()
+    assert cache.size() == 0
+    assert pyATP.set_run_cache(None) is cache
+
+
+def test_async_runs(tmpdir, fake_ATP, monkeypatch):
+    asyncio = pytest.importorskip('asyncio')
+    tmpdir.join('case.lis.inc').write(tt_lis_ss)
+    for n in range(6):
+        tmpdir.join('case%d.atp' % n).write('$INCLUDE, case.lis.inc\n')
+    cwd = str(tmpdir)
+    expected = pyATP.get_SS_results(tmpdir.join('case.lis.inc').strpath)
+
+    results = asyncio.run(pyATP.gather_limited(
+        [pyATP.run_SS_async('case%d.atp' % n, cwd=cwd, timeout=30.)
+         for n in range(6)], limit=3))
+    assert len(results) == 6
+    for ss in results:
+        assert dict(ss.node_voltages) == expected[0]
+
+    # A hung ATP is killed when the run times out
+    hung = tmpdir.join('hung_atp.py')
+    hung.write('#!%s\nimport time\ntime.sleep(60)\n' % sys.executable)
+    hung.chmod(0o755)
+    monkeypatch.setattr(pyATP.pyATP, 'ATP_exe', 'hung_atp.py')
+    start = time.time()
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(pyATP.gather_limited(
+            [pyATP.run_ATP_async('case%d.atp' % n, cwd=cwd, timeout=0.5)
+             for n in range(2)]))
+    assert time.time() - start < 30.
+
+
+def test_ATP_deck_template(tmpdir):
+    deck = ('C comment\n'
+            '  SRCA      IAMP      60.\n'
+            '  SRCB      IAMP      60.  IAMP\n'
+            '  SW1A  TCLOSE\n')
+    f = tmpdir.join('template.atp')
+    f.write(deck)
+    template = pyATP.ATPDeckTemplate(str(f))
+    assert template.count('IAMP') == 3
+    assert template.count('MISSING') == 0
+
+    # A single value gives the same deck as replace_text
+    out = tmpdir.join('out.atp')
+    pyATP.replace_text(str(f), 'TCLOSE', '-1', outfile=str(out))
+    assert template.render({'TCLOSE': '-1'}) == out.read()
+    assert template.render({'TCLOSE': '123456789'}) == \
+        deck.replace('TCLOSE', '123456')
+
+    text = template.render({'IAMP': ['1.', '22222', None],
+                            'TCLOSE': '-1'})
+    assert text == ('C comment\n'
+                    '  SRCA        1.      60.\n'
+                    '  SRCB      2222      60.  IAMP\n'
+                    '  SW1A      -1\n')
+    assert template.deck == deck
+    template.write(str(out), {'IAMP': '5'})
+    assert out.read() == deck.replace('IAMP', '   5')
+
+    with pytest.raises(ValueError):
+        template.render({'IAMP': ['1.', '2.']})
+    with pytest.raises(ValueError):
+        template.render({'MISSING': '1.'})
+    with pytest.raises(ValueError):
+        template.render({'IAMP': '1.', 'AMP': '2.'})
+
+
+def test_case_cards():
+    assert pyATP.case_cards('BEGIN NEW DATA CASE\r\nC x\r\nCARD 1\r\n'
+                            'BEGIN NEW DATA CASE\r\nBLANK CARD\r\n'
+                            '$EOF\r\nignored') == ['C x', 'CARD 1']
+    assert pyATP.case_cards('CARD 1\nCARD 2\n') == ['CARD 1', 'CARD 2']
+    with pytest.raises(ValueError):
+        pyATP.case_cards('BEGIN NEW DATA CASE\nCARD 1\n'
+                         'BEGIN NEW DATA CASE\nCARD 2\n')
+
+
+def test_split_pch(tmpdir):
+    f = tmpdir.join('batch.pch')
+    pch = '\n'.join(tt_line_const_pch) + '\n'
+    f.write(pch + pch.replace('IN___A', 'IN2__A') + pch)
+    cases = pyATP.split_pch(str(f))
+    assert cases == [pch, pch.replace('IN___A', 'IN2__A'), pch]
+
+
+def test_ATP_batch(tmpdir, fake_ATP):
+    tmpdir.join('case1.lis.inc').write(tt_lis_ss)
+    tmpdir.join('case2.lis.inc').write(tt_lis_ss.replace('S0A', 'S9A'))
+    decks = ['BEGIN NEW DATA CASE\n$INCLUDE, case%d.lis.inc\n'
+             'BEGIN NEW DATA CASE\nBLANK\n' % k for k in (1, 2, 1)]
+    batch = pyATP.ATPBatch(decks)
+    assert len(batch) == 3
+    assert batch.render() == (
+        'BEGIN NEW DATA CASE\n$INCLUDE, case1.lis.inc\n'
+        'BEGIN NEW DATA CASE\n$INCLUDE, case2.lis.inc\n'
+        'BEGIN NEW DATA CASE\n$INCLUDE, case1.lis.inc\n'
+        'BEGIN NEW DATA CASE\nBLANK\n')
+
+    with pyATP.ATPScheduler(workers=2) as s:
+        results = batch.submit(s, include_dir=str(tmpdir)).result()
+    assert ['S9A' in ss.node_voltages for ss in results] == \
+        [False, True, False]
+    expected = pyATP.get_SS_results(tmpdir.join('case1.lis.inc').strpath)
+    assert dict(results[2].node_voltages) == expected[0]
+
+    # Cases are taken in the order of the markers, even when ATP output
+    # before the first one is numbered as a case
+    lis = tmpdir.join('prefixed.lis')
+    lis.write(tt_lis_banner + ' Comment card.' + ' '*37 + '|C prefix\n' +
+              tt_lis_ss.replace('S0A', 'S7A') + ''.join(
+                  tt_lis_marker + tt_lis_ss.replace('S0A', n)
+                  for n in ('S1X', 'S9A', 'S1Y')) + tt_lis_marker)
+    assert list(pyATP.get_all_SS_results(str(lis))) == [1, 2, 3, 4]
+    results = batch.parse_SS(str(lis))
+    assert ['S9A' in ss.node_voltages for ss in results] == \
+        [False, True, False]
+    assert 'S7A' not in results[0].node_voltages
+    assert 'S1Y' in results[2].node_voltages
+
+    # A case without a steady-state solution
+    batch.add('C no output\n')
+    with pyATP.ATPScheduler(workers=1) as s:
+        with pytest.raises(RuntimeError):
+            batch.submit(s, include_dir=str(tmpdir)).result()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_sweep
+----------------------------------
+
+Tests for `pyATP.sweep` module.
+"""
+from __future__ import print_function, unicode_literals
+
+import pytest
+
+import numpy as np
+
+import pyATP
+from pyATP import fakeatp
+
+
+def test_grid_and_zipped():
+    points = pyATP.grid([('A', [1., 2.]), ('B', ['x', 'y', 'z'])])
+    assert list(points) == ['A', 'B']
+    assert points['A'].tolist() == [1., 1., 1., 2., 2., 2.]
+    assert points['B'].tolist() == ['x', 'y', 'z'] * 2
+
+    points = pyATP.zipped({'A': [1., 2.]})
+    assert points['A'].tolist() == [1., 2.]
+    with pytest.raises(ValueError):
+        pyATP.zipped([('A', [1., 2.]), ('B', [1.])])
+
+
+def test_latin_hypercube():
+    points = pyATP.latin_hypercube([('A', (0., 10.)), ('B', (-1., 1.))], 50,
+                                   seed=1)
+    for name, (low, high) in (('A', (0., 10.)), ('B', (-1., 1.))):
+        bins = np.floor((points[name] - low) / (high - low) * 50)
+        assert sorted(bins.tolist()) == list(range(50))
+
+
+@pytest.mark.parametrize('value,width,text', [
+    (500., 6, '500.'), (0.01, 6, '0.01'), (1./3, 6, '0.3333'),
+    (-2.5e-7, 8, '-2.5E-07'), (123456789., 6, '1E+08'),
+    (7, 3, '7.'), ('-1', 2, '-1')])
+def test_format_value(value, width, text):
+    assert pyATP.format_value(value, width) == text
+
+
+def test_format_value_too_wide():
+    with pytest.raises(ValueError):
+        pyATP.format_value(-1.5e-300, 4)
+
+
+@pytest.fixture
+def fake(tmpdir):
+    previous = fakeatp.install(str(tmpdir), n_branches=10, n_switches=2)
+    yield tmpdir
+    pyATP.pyATP.ATP_path, pyATP.pyATP.ATP_exe = previous
+
+
+def test_run_sweep(fake):
+    deck = fake.join('model.atp')
+    deck.write('BEGIN NEW DATA CASE\nC IAMP=XXXXXXXX TCLOSE\n'
+               'BEGIN NEW DATA CASE\nBLANK\n')
+    points = pyATP.grid([('IAMP', [100., 250.]), ('T', [0.01, 0.02, 1.])])
+    nodes = ['N0000001', 'M0000003']
+    branches = [('N0000002', 'M0000002'), ('M0000000', 'S0000000')]
+
+    with pyATP.ATPScheduler(workers=2) as scheduler:
+        results = pyATP.run_sweep(str(deck), points, {'IAMP': 'XXXXXXXX',
+                                                      'T': 'TCLOSE'},
+                                  nodes, branches, scheduler, ahead=2)
+    assert len(results) == 6
+    assert results.ok.all() and not results.errors
+    assert results.node_voltages.shape == (6, 2)
+    assert results.branch_currents.shape == (6, 2)
+    assert len(set(results.node_voltages[:, 0].tolist())) == 6
+    assert results.point(4) == {'IAMP': 250., 'T': 0.02}
+
+    # Row k holds the results of the deck rendered for point k
+    template = pyATP.ATPDeckTemplate(str(deck))
+    template.write(str(fake.join('check.atp')),
+                   {'XXXXXXXX': '    250.', 'TCLOSE': '  0.02'})
+    pyATP.run_ATP(str(fake.join('check.atp')))
+    ss = pyATP.SteadyStateResult.from_lis(str(fake.join('check.lis')))
+    assert results.node_voltages[4].tolist() == \
+        [ss.node_voltages[n] for n in nodes]
+    assert results.branch_currents[4].tolist() == \
+        [ss.branch_currents[b] for b in branches]
+
+    filename = results.save(str(fake.join('sweep.npz')))
+    loaded = pyATP.SweepResults.load(filename)
+    assert list(loaded.points) == ['IAMP', 'T']
+    assert loaded.points['T'].tolist() == results.points['T'].tolist()
+    assert loaded.branch_names == branches
+    assert np.array_equal(loaded.node_voltages, results.node_voltages)
+    assert loaded.ok.all()
+
+    # Failed points are recorded without stopping the sweep
+    results = pyATP.run_sweep(pyATP.ATPDeckTemplate(str(deck)),
+                              pyATP.zipped([('IAMP', [1., 2.])]),
+                              {'IAMP': 'XXXXXXXX'}, ['UNKNOWN'],
+                              RMS_scale=True)
+    assert not results.ok.any()
+    assert sorted(results.errors) == [0, 1]
+    assert 'KeyError' in results.errors[0]
+    assert np.isnan(results.node_voltages).all()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_switching
+----------------------------------
+
+Tests for `pyATP.switching` module.
+"""
+from __future__ import print_function, unicode_literals
+
+from concurrent.futures import Future
+from collections import namedtuple
+import re
+
+import pytest
+
+import numpy as np
+
+import pyATP
+from pyATP.switching import _peak_extractor
+
+
+def test_random_close_times():
+    switches = [('TA', (0.02, 0.001)), ('TB', (0.025, 0.))]
+    times = pyATP.random_close_times(switches, 1000, f0=50., seed=3)
+    assert list(times) == ['TA', 'TB']
+    # Without scatter, the times only have the common shift of a cycle
+    assert ((times['TB'] >= 0.025) & (times['TB'] < 0.045)).all()
+    scatter = times['TA'] - times['TB'] + 0.005
+    assert abs(scatter.std() - 0.001) < 1e-4
+    again = pyATP.random_close_times(switches, 1000, f0=50., seed=3)
+    assert np.array_equal(again['TA'], times['TA'])
+    assert (pyATP.random_close_times([('T', (0., 1.))], 100)['T'] >= 0).all()
+
+
+def test_P2_quantile():
+    rng = np.random.RandomState(0)
+    x = np.column_stack([rng.standard_normal(5000),
+                         rng.lognormal(0., 0.5, 5000),
+                         rng.uniform(1., 3., 5000)])
+    estimator = pyATP.P2Quantile([0.5, 0.9, 0.98], 3)
+    assert np.isnan(estimator.quantiles()).all()
+    for k, row in enumerate(x):
+        estimator.update(row)
+        if k == 2:
+            assert np.allclose(estimator.quantiles(), np.percentile(
+                x[:3], [50, 90, 98], axis=0))
+    expected = np.percentile(x, [50, 90, 98], axis=0)
+    assert estimator.quantiles().shape == (3, 3)
+    assert np.allclose(estimator.quantiles(), expected, rtol=0.03)
+
+
+def test_streaming_histogram():
+    rng = np.random.RandomState(1)
+    # Growing values make the bins merge several times
+    x = rng.uniform(0., 1., (4000, 2)) * np.linspace(0.01, 10., 4000)[:, None]
+    hist = pyATP.StreamingHistogram(2, n_bins=64)
+    for row in x:
+        hist.update(row)
+    assert hist.counts.sum() == 8000
+    assert (hist.width * hist.n_bins > x.max(axis=0)).all()
+    assert (hist.width * hist.n_bins <= 2 * x.max(axis=0)).all()
+    for p in (0.1, 0.5, 0.98):
+        assert np.allclose(hist.quantile(p), np.percentile(x, 100 * p, axis=0),
+                           atol=2 * hist.width.max())
+    level = np.percentile(x, 90, axis=0)
+    assert np.allclose(hist.exceedance(level), 0.1, atol=0.01)
+    assert np.allclose(hist.exceedance(0.), 1.)
+    assert np.allclose(hist.exceedance(1e9), 0.)
+    assert hist.edges.shape == (2, 65)
+
+    with pytest.raises(ValueError):
+        hist.update([-1., 0.])
+    with pytest.raises(ValueError):
+        pyATP.StreamingHistogram(2, n_bins=5)
+
+
+def test_peak_extractor(tmpdir):
+    t = np.arange(0., 0.05, 1e-5)
+    x = np.column_stack([np.sin(377 * t), -2 * np.sin(377 * t), 0 * t])
+    pyATP.write_PL4(str(tmpdir.join('case.pl4')), t,
+                    [(4, 'A', ''), (4, 'B', ''), (9, 'A', 'B')], x)
+    Run = namedtuple('Run', 'ATP_file returncode')
+    extract = _peak_extractor(['B', ('A', 'B'), 'A'], 0.5)
+    peaks = extract(Run(str(tmpdir.join('case.atp')), 0))
+    assert np.allclose(peaks, [1., 0., 0.5], atol=1e-3)
+    with pytest.raises(RuntimeError):
+        extract(Run(str(tmpdir.join('missing.atp')), 1))
+
+
+class PeakScheduler(object):
+    """ Stands in for an ATPScheduler: the peaks of a run are a function of
+        the closing times TA and TB in the deck. Decks with a TA of 0 fail. """
+    workers = 2
+
+    def __init__(self):
+        self.peaks = {}
+
+    def submit(self, deck, name, include_dir, parse):
+        future = Future()
+        ta, tb = [float(v) for v in re.findall(r'=\s*(\S+)', deck)]
+        if ta == 0:
+            future.set_exception(RuntimeError('ATP failed'))
+        else:
+            peaks = np.array([1. + abs(np.sin(377 * ta)),
+                              2. + abs(np.cos(377 * tb))])
+            self.peaks[deck] = peaks
+            future.set_result(peaks / 2.)
+        return future
+
+
+def test_run_switching_study():
+    template = pyATP.ATPDeckTemplate(
+        deck='C TA=AAAAAAAAAA TB=BBBBBBBBBB\n')
+    switches = [('TA', (0.01, 0.002)), ('TB', (0.012, 0.002))]
+    scheduler = PeakScheduler()
+    study = pyATP.run_switching_study(
+        template, switches, ['N1', 'N2'], 500,
+        fields={'TA': 'AAAAAAAAAA', 'TB': 'BBBBBBBBBB'},
+        scheduler=scheduler, seed=2)
+    assert study.n_cases == 500 and study.n_failed == 0
+    peaks = np.array(list(scheduler.peaks.values())) / 2.
+    assert np.allclose(study.peak_max, peaks.max(axis=0))
+    assert np.allclose(study.overvoltage(0.02),
+                       np.percentile(peaks, 98, axis=0), rtol=0.02)
+    assert np.allclose(study.overvoltage(0.2),
+                       np.percentile(peaks, 80, axis=0), rtol=0.02)
+    times = pyATP.random_close_times(switches, 500, seed=2)
+    k = study.worst_case[0]
+    assert study.worst_times['TA'][0] == times['TA'][k]
+
+    # Cases closing at time zero fail
+    study = pyATP.run_switching_study(
+        template, [('TA', (0., 0.)), ('TB', (0.012, 0.002))], ['N1', 'N2'],
+        10, fields={'TA': 'AAAAAAAAAA', 'TB': 'BBBBBBBBBB'}, window=0.,
+        scheduler=PeakScheduler(), seed=2)
+    assert study.n_cases == 0 and study.n_failed == 10
+    assert study.errors[0] == 'RuntimeError: ATP failed'
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_transient
+----------------------------------
+
+Tests for `pyATP.transient` module.
+"""
+from __future__ import print_function, unicode_literals
+
+import pytest
+
+import numpy as np
+
+import pyATP
+
+
+@pytest.fixture
+def signals():
+    t = np.arange(10007) * 1e-5
+    x = np.column_stack((np.sin(2*np.pi*60*t),
+                         np.exp(-t) * np.cos(2*np.pi*300*t),
+                         np.random.RandomState(0).randn(len(t))))
+    return t, x
+
+
+@pytest.mark.parametrize('chunk_steps', [64, 1000, 100000])
+def test_envelope(signals, chunk_steps):
+    t, x = signals
+    n_bins = 37
+    env = pyATP.envelope((t, x), n_bins=n_bins, chunk_steps=chunk_steps)
+    edges = np.linspace(0, len(t), n_bins + 1).astype(int)
+    for k in range(n_bins):
+        xb = x[edges[k]:edges[k+1]]
+        assert np.allclose(env.min[k], xb.min(axis=0))
+        assert np.allclose(env.max[k], xb.max(axis=0))
+        assert np.allclose(env.mean[k], xb.mean(axis=0))
+        assert env.time[k] == t[edges[k]]
+    k = np.argmax(np.abs(x), axis=0)
+    assert np.allclose(env.peak, x[k, range(3)])
+    assert np.allclose(env.peak_time, t[k])
+
+
+def test_envelope_pl4(tmpdir, signals):
+    t, x = signals
+    f = str(tmpdir.join('env.pl4'))
+    pyATP.write_PL4(f, t, [(4, 'A', ''), (4, 'B', ''), (4, 'C', '')], x)
+    env = pyATP.envelope(pyATP.PL4File(f), keys=['C', 'A'], n_bins=10,
+                         chunk_steps=999)
+    ref = pyATP.envelope((t, x.astype(np.float32)), keys=[2, 0], n_bins=10)
+    assert env.keys == ['C', 'A']
+    assert np.allclose(env.max, ref.max)
+    assert np.allclose(env.peak, ref.peak)
+    assert np.allclose(env.peak_time, ref.peak_time)
+
+
+@pytest.fixture
+def pl4_sine(tmpdir):
+    ''' PL4 file of a 60 Hz three-phase set with a 5th harmonic, starting
+        with a decaying DC offset. '''
+    t = np.arange(256*12) / (60.*256)
+    V = np.array([1e5, 1e5*np.exp(-2j*np.pi/3), 1.1e5*np.exp(2j*np.pi/3)])
+    I = np.array([100.*np.exp(-0.5j), 90.*np.exp(-2.6j), 95.*np.exp(1.6j)])
+    w = 2*np.pi*60
+    data = np.column_stack(
+        [np.real(v*np.exp(1j*w*t)) + 0.1*np.real(v*np.exp(5j*w*t))
+         + np.abs(v)*np.exp(-t/0.005) for v in V] +
+        [np.real(i*np.exp(1j*w*t)) for i in I])
+    variables = ([(4, 'BUS' + p, '') for p in 'ABC'] +
+                 [(9, 'BUS' + p, 'LOAD' + p) for p in 'ABC'])
+    f = str(tmpdir.join('sine.pl4'))
+    pyATP.write_PL4(f, t, variables, data)
+    return f, V, I
+
+
+@pytest.mark.parametrize('chunk_bytes', [2**26, 8*256*3*7, 8*256])
+def test_sliding_phasors(pl4_sine, chunk_bytes):
+    # Chunks of every window, of 7 windows, and of one window of one signal
+    f, V, I = pl4_sine
+    pl4 = pyATP.PL4File(f)
+    time, ph = pyATP.sliding_phasors(pl4, keys=['BUSA', 'BUSB', 'BUSC'],
+                                     harmonic=[0, 1, 5], step=100,
+                                     chunk_bytes=chunk_bytes)
+    assert ph.shape == (len(time), 3, 3)
+    assert np.allclose(time, pl4.time[np.arange(len(time))*100 + 255])
+    # Once the DC offset has decayed every window gives the same phasors
+    late = time > 0.1
+    assert np.allclose(ph[late, 0], 0., atol=1e-1)
+    assert np.allclose(ph[late, 1], V, rtol=1e-4)
+    assert np.allclose(ph[late, 2], 0.1*V, rtol=1e-3)
+    # Signals taken in blocks from arrays are in the order of keys
+    _, ph2 = pyATP.sliding_phasors((pl4.time, pl4.data[:, 1:]), keys=[2, 0],
+                                   harmonic=1, step=100,
+                                   chunk_bytes=chunk_bytes)
+    assert np.allclose(ph2, ph[:, 1, ::-1][:, [0, 2]])
+
+
+def test_get_transient_phasors(pl4_sine):
+    f, V, I = pl4_sine
+    node_voltages, branch_currents = pyATP.get_transient_phasors(f)
+    assert sorted(node_voltages) == ['BUSA', 'BUSB', 'BUSC']
+    assert len(branch_currents) == 6
+    assert np.allclose(branch_currents['BUSB', 'LOADB'], I[1], rtol=1e-4)
+    assert branch_currents['LOADB', 'BUSB'] == \
+        -branch_currents['BUSB', 'LOADB']
+
+    ph_voltages, seq_voltages, imbalance = pyATP.process_SS_bus_voltages(
+        (node_voltages, branch_currents), ['BUS'])
+    assert np.allclose(ph_voltages[:, 0], V, rtol=1e-4)
+    assert np.allclose(seq_voltages[:, 0], pyATP.lineZ.ph_to_seq_v(V),
+                       rtol=1e-4)
+
+    rms, _ = pyATP.get_transient_phasors(f, at=0.05, RMS_scale=True)
+    assert np.allclose(rms['BUSA'], V[0] / np.sqrt(2), rtol=1e-3)
+
+
+def test_get_transient_phasors_ground(tmpdir):
+    t = np.arange(256*3) / (60.*256)
+    i = 50.*np.exp(0.3j)
+    f = str(tmpdir.join('ground.pl4'))
+    pyATP.write_PL4(f, t, [(9, 'BUSA', '')],
+                    np.real(i*np.exp(2j*np.pi*60*t))[:, np.newaxis])
+    _, branch_currents = pyATP.get_transient_phasors(f)
+    assert sorted(branch_currents) == [('BUSA', 'TERRA'), ('TERRA', 'BUSA')]
+    assert np.allclose(branch_currents['BUSA', 'TERRA'], i, rtol=1e-4)
+    assert branch_currents['TERRA', 'BUSA'] == \
+        -branch_currents['BUSA', 'TERRA']
+    with pytest.raises(ValueError):
+        pyATP.get_transient_phasors(f, harmonic=[1, 5])